@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+# simulations admitted at once, across all clients and per client
+RUN_ATTACK_MAX_CONCURRENT = int(os.getenv("RUN_ATTACK_MAX_CONCURRENT", "2"))
+RUN_ATTACK_MAX_PER_CLIENT = int(os.getenv("RUN_ATTACK_MAX_PER_CLIENT", "1"))
+
+# over the limits a request waits up to RUN_ATTACK_QUEUE_TIMEOUT_S in a queue of RUN_ATTACK_MAX_QUEUE
+#   -> 0 for either rejects with 429 straight away instead of queueing
+RUN_ATTACK_MAX_QUEUE = int(os.getenv("RUN_ATTACK_MAX_QUEUE", "8"))
+RUN_ATTACK_QUEUE_TIMEOUT_S = float(os.getenv("RUN_ATTACK_QUEUE_TIMEOUT_S", "10"))
+
+# token bucket on simulated packets (requestCount) per second, 0 disables it
+#   -> a run bigger than the burst waits for a full bucket and drains it
+SIM_PACKETS_PER_S = float(os.getenv("SIM_PACKETS_PER_S", "2000"))
+SIM_PACKET_BURST = float(os.getenv("SIM_PACKET_BURST", "20000"))
+
+
+class Overloaded(Exception):
+    """Raised instead of admitting a request; maps to 429 with Retry-After."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.capacity > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def level(self) -> float:
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, cost: float) -> float:
+        """Seconds until cost tokens are available (0 when they are now)."""
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        cost = min(cost, self.capacity)
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost: float) -> None:
+        if self.enabled:
+            self.tokens -= min(cost, self.capacity)
+
+
+class AdmissionController:
+    """
+    Global and per-client concurrency limits plus a packet-rate token bucket.
+
+    A request that can't run yet waits, up to the queue timeout, until a slot
+    frees up and the bucket refills; tokens are only taken once it also has a
+    slot. A full queue or an expired wait raises Overloaded.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = RUN_ATTACK_MAX_CONCURRENT,
+        max_per_client: int = RUN_ATTACK_MAX_PER_CLIENT,
+        max_queue: int = RUN_ATTACK_MAX_QUEUE,
+        queue_timeout_s: float = RUN_ATTACK_QUEUE_TIMEOUT_S,
+        bucket: Optional[TokenBucket] = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.bucket = bucket or TokenBucket(SIM_PACKETS_PER_S, SIM_PACKET_BURST)
+        self.in_flight = 0
+        self.queued = 0
+        self.per_client: Dict[str, int] = defaultdict(int)
+        self._changed = asyncio.Condition()
+
+    def _try_admit(self, client: str, cost: float) -> Optional[float]:
+        """Admit and return None, or return how long to wait before trying again."""
+        if self.max_concurrent > 0 and self.in_flight >= self.max_concurrent:
+            return math.inf
+        if self.max_per_client > 0 and self.per_client[client] >= self.max_per_client:
+            return math.inf
+        wait = self.bucket.wait_time(cost)
+        if wait > 0:
+            return wait
+        self.bucket.take(cost)
+        self.in_flight += 1
+        self.per_client[client] += 1
+        return None
+
+    def _release(self, client: str) -> None:
+        self.in_flight -= 1
+        self.per_client[client] -= 1
+        if self.per_client[client] <= 0:
+            del self.per_client[client]
+
+    @asynccontextmanager
+    async def admit(self, client: str, cost: float = 0.0) -> AsyncIterator[float]:
+        """Hold a slot for the body of the with-block; yields the seconds spent queued."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        async with self._changed:
+            wait = self._try_admit(client, cost)
+            if wait is not None:
+                if self.queue_timeout_s <= 0 or self.queued >= self.max_queue:
+                    retry = wait if math.isfinite(wait) else max(self.queue_timeout_s, 1.0)
+                    raise Overloaded("queue_full", retry)
+                deadline = started + self.queue_timeout_s
+                self.queued += 1
+                try:
+                    while wait is not None:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            retry = wait if math.isfinite(wait) else self.queue_timeout_s
+                            raise Overloaded("queue_timeout", retry)
+                        try:
+                            # woken by a release, or when the bucket should have refilled
+                            await asyncio.wait_for(self._changed.wait(), timeout=min(wait, remaining))
+                        except asyncio.TimeoutError:
+                            pass
+                        wait = self._try_admit(client, cost)
+                finally:
+                    self.queued -= 1
+
+        try:
+            yield loop.time() - started
+        finally:
+            async with self._changed:
+                self._release(client)
+                self._changed.notify_all()
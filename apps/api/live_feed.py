@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterator, List, Optional, Sequence
+
+import numpy as np
+from prometheus_client import Counter, Gauge
+
+# events a subscriber may have waiting; past this its oldest verdicts are dropped
+LIVE_QUEUE_EVENTS = int(os.getenv("LIVE_QUEUE_EVENTS", "256"))
+# open /live connections on one worker; more get 503
+LIVE_MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", "1000"))
+# a run's progress goes out at most this often, later updates replace the pending one
+LIVE_PROGRESS_INTERVAL_S = float(os.getenv("LIVE_PROGRESS_INTERVAL_S", "0.1"))
+# idle connections get a keep-alive this often, which is also how dead ones are noticed
+LIVE_HEARTBEAT_S = float(os.getenv("LIVE_HEARTBEAT_S", "15"))
+# verdict rows per event; a scored chunk bigger than this goes out as several events
+LIVE_VERDICT_ROWS = int(os.getenv("LIVE_VERDICT_ROWS", "5000"))
+
+# lifecycle events are never dropped for a slow subscriber, only verdicts are (progress is coalesced)
+LIFECYCLE_EVENTS = frozenset({"run_started", "run_finished"})
+EVENT_TYPES = LIFECYCLE_EVENTS | {"progress", "verdicts"}
+
+# client-chosen run ids, so a viewer can subscribe before it starts the run
+LIVE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+LIVE_SUBSCRIBERS = Gauge("api_live_subscribers", "Open /live connections")
+LIVE_EVENTS = Counter("api_live_events_total", "Events published to the live feed", ["type"])
+LIVE_DROPPED = Counter("api_live_dropped_total", "Events dropped from slow subscribers' queues", ["type"])
+
+
+class FeedFull(Exception):
+    """Raised by subscribe() past LIVE_MAX_SUBSCRIBERS; maps to 503."""
+
+
+@dataclass(frozen=True)
+class Event:
+    seq: int
+    type: str
+    run: Optional[str]
+    # serialized once, shared by every subscriber's queue
+    data: str
+    # queued events with the same key replace each other (a run's progress)
+    key: Optional[str] = None
+
+    @property
+    def droppable(self) -> bool:
+        return self.type not in LIFECYCLE_EVENTS
+
+    def sse(self) -> str:
+        return f"id: {self.seq}\nevent: {self.type}\ndata: {self.data}\n\n"
+
+
+def _event(seq: int, type: str, run: Optional[str], payload: dict, key: Optional[str] = None) -> Event:
+    data = json.dumps({"type": type, "seq": seq, "run": run, **payload}, separators=(",", ":"))
+    return Event(seq, type, run, data, key)
+
+
+class Subscriber:
+    """
+    One viewer's bounded queue. offer() never waits: a full queue drops its
+    oldest verdict event, and a progress event replaces the one still queued
+    for its run. The viewer gets a "dropped" event with the count before the
+    next events it does receive.
+    """
+
+    def __init__(
+        self,
+        run: Optional[str] = None,
+        types: Optional[FrozenSet[str]] = None,
+        capacity: int = LIVE_QUEUE_EVENTS,
+        seq: Optional[Iterator[int]] = None,
+    ):
+        # the feed's sequence, so "dropped" notices get ids of their own
+        self._seq = seq or itertools.count(1)
+        self.run = run
+        self.types = types
+        self.capacity = max(1, capacity)
+        self.dropped = 0
+        self._queue: "OrderedDict[object, Event]" = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def wants(self, type: str, run: Optional[str]) -> bool:
+        if self.run is not None and run != self.run:
+            return False
+        return self.types is None or type in self.types
+
+    def offer(self, event: Event) -> Optional[str]:
+        """Queue event; returns the type of the event dropped to make room, if any."""
+        queue = self._queue
+        key = event.key or event.seq
+        if event.key is not None and key in queue:
+            queue.move_to_end(key)
+        queue[key] = event
+        self._ready.set()
+        if len(queue) <= self.capacity:
+            return None
+        for old_key, old in queue.items():
+            if old.droppable:
+                del queue[old_key]
+                self.dropped += 1
+                return old.type
+        return None
+
+    async def next_events(self, timeout: float = LIVE_HEARTBEAT_S) -> List[Event]:
+        """Everything queued, waiting up to timeout for the first event; [] on timeout."""
+        if not self._queue:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        events = list(self._queue.values())
+        self._queue.clear()
+        if self.dropped:
+            events.insert(0, _event(next(self._seq), "dropped", self.run, {"count": self.dropped}))
+            self.dropped = 0
+        return events
+
+
+class LiveRun:
+    """
+    Publishing side of one /run-attack. Progress is throttled to one event per
+    LIVE_PROGRESS_INTERVAL_S; phase changes and the end of the run send it at once.
+    """
+
+    def __init__(self, feed: "LiveFeed", run_id: str, attack: str, info: dict):
+        self.feed = feed
+        self.id = run_id
+        self.attack = attack
+        self.info = info
+        self.state: Dict[str, object] = {"phase": "queued"}
+        self.started_at = time.time()
+        self._sent_at = 0.0
+        self._pending = False
+
+    def _started_payload(self) -> dict:
+        return {"attack": self.attack, "started_at": self.started_at, **self.info}
+
+    def _progress_payload(self) -> dict:
+        return dict(self.state)
+
+    def progress(self, force: bool = False, **fields) -> None:
+        self.state.update(fields)
+        now = time.monotonic()
+        if not force and now - self._sent_at < LIVE_PROGRESS_INTERVAL_S:
+            self._pending = True
+            return
+        self._sent_at, self._pending = now, False
+        self.feed.publish("progress", self._progress_payload(), run=self.id, key=f"{self.id}:progress")
+
+    def phase(self, name: str, **fields) -> None:
+        self.progress(force=True, phase=name, **fields)
+
+    def verdicts(self, offset: int, columns: Dict[str, Sequence]) -> None:
+        """Publish scored rows offset.. as columns (e.g. port, label, confidence)."""
+        if not self.feed.has_subscribers("verdicts", self.id):
+            return
+        arrays = {name: np.asarray(values) for name, values in columns.items()}
+        n = len(next(iter(arrays.values()), []))
+        for start in range(0, n, LIVE_VERDICT_ROWS):
+            end = min(n, start + LIVE_VERDICT_ROWS)
+            rows = {}
+            for name, values in arrays.items():
+                part = values[start:end]
+                if part.dtype.kind == "f":
+                    # NaN (unscored rows) isn't valid JSON
+                    part = np.where(np.isnan(part), None, part.round(4))
+                rows[name] = part.tolist()
+            self.feed.publish("verdicts", {"offset": offset + start, "rows": end - start, **rows}, run=self.id)
+
+    def finish(self, status: str, **fields) -> None:
+        if self._pending:
+            self.progress(force=True)
+        self.feed.publish(
+            "run_finished",
+            {"status": status, "seconds": round(time.time() - self.started_at, 3), **fields},
+            run=self.id,
+        )
+        self.feed._runs.pop(self.id, None)
+
+
+class LiveFeed:
+    """
+    One producer, many viewers. publish() serializes an event once and appends
+    it to every matching subscriber's bounded queue without awaiting anything,
+    so a slow viewer costs itself events, not the simulation time.
+    """
+
+    def __init__(self, max_subscribers: int = LIVE_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._subscribers: set = set()
+        self._runs: Dict[str, LiveRun] = {}
+        self._seq = itertools.count(1)
+        LIVE_SUBSCRIBERS.set_function(lambda: len(self))
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def has_subscribers(self, type: str, run: Optional[str] = None) -> bool:
+        return any(s.wants(type, run) for s in self._subscribers)
+
+    def subscribe(self, run: Optional[str] = None, types: Optional[FrozenSet[str]] = None) -> Subscriber:
+        if len(self) >= self.max_subscribers:
+            raise FeedFull(f"{len(self)} live subscribers already connected")
+        sub = Subscriber(run, types, seq=self._seq)
+        # late joiners start from the runs in progress and their latest progress
+        for live in list(self._runs.values()):
+            for event in (
+                _event(next(self._seq), "run_started", live.id, live._started_payload()),
+                _event(next(self._seq), "progress", live.id, live._progress_payload(), key=f"{live.id}:progress"),
+            ):
+                if sub.wants(event.type, event.run):
+                    sub.offer(event)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self._subscribers.discard(sub)
+
+    def publish(self, type: str, payload: dict, run: Optional[str] = None, key: Optional[str] = None) -> None:
+        LIVE_EVENTS.labels(type=type).inc()
+        targets = [s for s in self._subscribers if s.wants(type, run)]
+        if not targets:
+            return
+        event = _event(next(self._seq), type, run, payload, key)
+        dropped: Dict[str, int] = {}
+        for sub in targets:
+            victim = sub.offer(event)
+            if victim is not None:
+                dropped[victim] = dropped.get(victim, 0) + 1
+        for victim, count in dropped.items():
+            LIVE_DROPPED.labels(type=victim).inc(count)
+
+    def start_run(self, attack: str, run_id: Optional[str] = None, **info) -> LiveRun:
+        if run_id is None:
+            run_id = f"{time.time_ns():x}"
+        elif run_id in self._runs:
+            raise ValueError(f"Live run {run_id} is already in progress")
+        live = LiveRun(self, run_id, attack, info)
+        self._runs[run_id] = live
+        self.publish("run_started", live._started_payload(), run=run_id)
+        live.phase("queued")
+        return live
+
+    def runs(self) -> List[dict]:
+        return [{"run": r.id, **r._started_payload(), **r._progress_payload()} for r in self._runs.values()]
+
+
+def parse_types(raw: Optional[str]) -> Optional[FrozenSet[str]]:
+    """?types=progress,verdicts -> frozenset; unknown names raise ValueError."""
+    if not raw:
+        return None
+    types = frozenset(t.strip() for t in raw.split(",") if t.strip())
+    unknown = types - EVENT_TYPES
+    if unknown:
+        raise ValueError(f"Unknown event types {sorted(unknown)}; use {sorted(EVENT_TYPES)}")
+    return types
+
+
+if __name__ == "__main__":
+    import sys
+
+    # fan-out cost and drops with N viewers, a tenth of them never reading
+    #   -> python live_feed.py 500 2000
+    viewers = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    batches = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    async def _bench() -> None:
+        feed = LiveFeed(max_subscribers=viewers)
+        subs = [feed.subscribe() for _ in range(viewers)]
+        readers = subs[: viewers - viewers // 10]
+        live = feed.start_run("port_probing")
+        received = 0
+
+        async def read(sub: Subscriber) -> None:
+            nonlocal received
+            while True:
+                # awaited first: "received += await ..." reads received before suspending
+                events = await sub.next_events()
+                received += len(events)
+
+        tasks = [asyncio.create_task(read(s)) for s in readers]
+        ports = np.arange(LIVE_VERDICT_ROWS)
+        labels = ports % 7 == 0
+        confidence = np.linspace(0, 1, LIVE_VERDICT_ROWS)
+
+        start = time.perf_counter()
+        for i in range(batches):
+            live.progress(scanned=i)
+            live.verdicts(i * LIVE_VERDICT_ROWS, {"port": ports, "label": labels, "confidence": confidence})
+            await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+        live.finish("completed")
+        await asyncio.sleep(0.05)
+        for task in tasks:
+            task.cancel()
+
+        stalled = subs[len(readers) :]
+        print(f"{viewers} viewers, {batches} verdict events of {LIVE_VERDICT_ROWS} rows")
+        print(f"publish: {elapsed * 1e6 / batches:.0f} us/event ({elapsed * 1e6 / batches / viewers:.2f} us/viewer)")
+        print(f"delivered: {received} events to {len(readers)} readers")
+        if stalled:
+            print(f"stalled viewers: {len(stalled[0]._queue)} queued, {stalled[0].dropped} dropped each")
+
+    asyncio.run(_bench())
@@ -4,26 +4,67 @@ import asyncio
 import csv
 import json
 import logging
+import math
 import os
+import re
 import sys
+import sqlite3
+import tempfile
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 from io import StringIO
+from itertools import islice
 from pathlib import Path
-from typing import List, Optional, Sequence
+from typing import Callable, Dict, List, Optional, Tuple
 
-import httpx
-from fastapi import FastAPI, HTTPException, status
+import numpy as np
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, status
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import Response
+from starlette.background import BackgroundTask
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 
-from models import Attack, AttackType, MLModel, ScanCSV, ScanRow
+import wire
+from admission import AdmissionController, Overloaded
+from flow_aggregator import DOS_COLUMNS, FlowAggregator, PacketEvent
+from live_feed import LIVE_HEARTBEAT_S, LIVE_ID_PATTERN, FeedFull, LiveFeed, LiveRun, parse_types
+from ml_client import ML_DEADLINE_S, Deadline, MLClient, MLServiceError
+from models import Attack, AttackType, MLModel, ScanCSV
+from scan_cache import ScanCache
+from run_history import PAGE_MAX, RUN_HISTORY_PATH, CursorError, RunHistory
+from run_summary import ScoredColumns, summarize
+from scan_frame import ScanFrame, ScanFrameError, batch_rows
+from scan_stream import ExternalSorter, RowErrors, StreamRow, iter_csv_rows, iter_ndjson_rows
+from static_cache import CachedJSON
 
 ML_SERVICE_URL = os.getenv("ML_SERVICE_URL", "http://capstone-ml:8001/predict")
-ML_SERVICE_DOS_URL = os.getenv("ML_SERVICE_DOS_URL", "http://capstone-ml:8001/dos/predict")
-DOS_TARGET_URL = "https://mlcasim-api.edwardnafornita.com/output-json"
+ML_SERVICE_BATCH_URL = os.getenv("ML_SERVICE_BATCH_URL", "http://capstone-ml:8001/predict/batch")
+ML_SERVICE_DOS_BATCH_URL = os.getenv(
+    "ML_SERVICE_DOS_BATCH_URL", "http://capstone-ml:8001/dos/predict/batch"
+)
+# several model families scored together; {attack} is port_probing or dos
+ML_SERVICE_ENSEMBLE_URL = os.getenv(
+    "ML_SERVICE_ENSEMBLE_URL", "http://capstone-ml:8001/predict/{attack}/ensemble"
+)
+# MLModel families the ensemble route can score (ensemble.FAMILY_ESTIMATORS in the ml-service);
+#   -> /run-attack answers 400 for any other mlModels entry instead of scoring every row as an error
+ML_SERVICE_FAMILIES = frozenset(
+    f.strip().upper()
+    for f in os.getenv(
+        "ML_SERVICE_FAMILIES", "RANDOM_FOREST,GRADIENT_BOOSTING,DECISION_TREE,LOGISTIC_REGRESSION"
+    ).split(",")
+    if f.strip()
+)
+# where simulated traffic is spooled for incremental training, empty disables it
+#   -> e.g. http://capstone-ml:8001/admin/spool
+ML_SERVICE_SPOOL_URL = os.getenv("ML_SERVICE_SPOOL_URL", "")
+ML_ADMIN_TOKEN = os.getenv("ML_ADMIN_TOKEN")
+# "binary" sends batches as application/x-ml-batch (see wire.py), "json" as columnar JSON
+ML_WIRE_FORMAT = os.getenv("ML_WIRE_FORMAT", "binary").lower()
+# where DoS runs send their requests; empty disables the simulator (runs score a synthetic profile).
+#   -> simulations/dos.py refuses non-local targets unless DOS_ALLOW_REMOTE_TARGET=1
+DOS_TARGET_URL = os.getenv("DOS_TARGET_URL", "")
 FRONTEND_ORIGINS = [
     "http://localhost:3000",
     "http://localhost:5173",
@@ -38,6 +79,13 @@ if not SIMULATIONS_DIR.exists():
     SIMULATIONS_DIR = PROJECT_ROOT / "simulations"
 GENERATED_DIR = SIMULATIONS_DIR / "generated_payloads"
 GENERATED_DIR.mkdir(parents=True, exist_ok=True)
+# proxies in front of the API that append to X-Forwarded-For (1 behind the ingress);
+#   -> 0 ignores the header and keys per-client limits on the peer address
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+# host the port probing simulation scans; cached payloads are only reused for the same target
+PORT_PROBE_TARGET = os.getenv("PORT_PROBE_TARGET", "192.168.50.253")
+# above 1, scans are sharded over this many worker processes (simulations/distributed_scan.py)
+PORT_PROBE_WORKERS = int(os.getenv("PORT_PROBE_WORKERS", "1"))
 
 logging.basicConfig(
     level=logging.INFO,
@@ -52,7 +100,43 @@ REQUEST_LATENCY = Histogram(
     "api_request_duration_seconds", "API request latency", ["path", "method"]
 )
 
+# /run-attack admission: every run forks a simulator and fans out ML calls, so they're rationed
+ADMISSION = AdmissionController()
+RUN_ATTACK_IN_FLIGHT = Gauge("api_run_attack_in_flight", "Admitted /run-attack calls still running")
+RUN_ATTACK_IN_FLIGHT.set_function(lambda: ADMISSION.in_flight)
+RUN_ATTACK_QUEUED = Gauge("api_run_attack_queued", "/run-attack calls waiting for admission")
+RUN_ATTACK_QUEUED.set_function(lambda: ADMISSION.queued)
+SIM_PACKET_TOKENS = Gauge("api_sim_packet_tokens", "Simulated packets the rate limiter would admit right now")
+SIM_PACKET_TOKENS.set_function(lambda: ADMISSION.bucket.level())
+RUN_ATTACK_REJECTED = Counter(
+    "api_run_attack_rejected_total", "/run-attack calls refused with 429", ["reason"]
+)
+RUN_ATTACK_QUEUE_WAIT = Histogram(
+    "api_run_attack_queue_wait_seconds", "Time /run-attack calls spent queued before admission"
+)
+
+# one pooled client for every ml-service call: deadlines, circuit breakers, hedging, replicas
+ML_CLIENT = MLClient()
+# scored runs and their per-row predictions, queryable through /history/*
+HISTORY = RunHistory(RUN_HISTORY_PATH) if RUN_HISTORY_PATH else None
+# simulation progress and verdicts of running /run-attack calls, streamed through /live
+LIVE_FEED = LiveFeed()
+
 DOS_STORE: List[dict] = []
+# rows per request on the columnar batch path
+ML_BATCH_ROWS = int(os.getenv("ML_BATCH_ROWS", "5000"))
+# keeps fire-and-forget tasks referenced until they finish
+_BACKGROUND_TASKS: set = set()
+# batch URLs that answered 415 to the binary format; they get JSON from then on
+_JSON_ONLY_URLS: set = set()
+
+# raw-body content types accepted by /predict-from-scan-stream
+STREAM_PARSERS = {
+    "text/csv": iter_csv_rows,
+    "application/x-ndjson": iter_ndjson_rows,
+    "application/ndjson": iter_ndjson_rows,
+    "application/jsonl": iter_ndjson_rows,
+}
 
 app = FastAPI(title="Attack API")
 app.add_middleware(
@@ -63,43 +147,84 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.middleware("http")
-async def strip_api_prefix(request, call_next):
-    path = request.scope.get("path") or request.url.path
-    if path == "/api":
-        request.scope["path"] = "/"
-    elif path.startswith("/api/"):
-        request.scope["path"] = path[4:] or "/"
-    return await call_next(request)
-
-@app.middleware("http")
-async def metrics_middleware(request, call_next):
-    start = time.perf_counter()
-    response = None
+# plain ASGI middleware rather than @app.middleware("http"): that wraps every streamed chunk in
+#   -> extra tasks and memory streams, which dominated the CPU of /live with hundreds of viewers
+class StripApiPrefix:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            path = scope.get("path") or ""
+            if path == "/api":
+                scope["path"] = "/"
+            elif path.startswith("/api/"):
+                scope["path"] = path[4:] or "/"
+        await self.app(scope, receive, send)
+
+class RequestMetrics:
+    """Counts and times HTTP requests up to the response headers, as call_next did."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        recorded = False
+
+        def record(status: int) -> None:
+            nonlocal recorded
+            recorded = True
+            duration = time.perf_counter() - start
+            # read after the inner middleware stripped the /api prefix
+            path = scope["path"]
+            method = scope["method"]
+            REQUEST_COUNT.labels(path=path, method=method, status=status).inc()
+            REQUEST_LATENCY.labels(path=path, method=method).observe(duration)
+            logger.info(
+                "request path=%s method=%s status=%s duration_ms=%.2f",
+                path,
+                method,
+                status,
+                duration * 1000,
+            )
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start" and not recorded:
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            if not recorded:
+                record(500)
+
+app.add_middleware(StripApiPrefix)
+app.add_middleware(RequestMetrics)
+
+def _load_attacks() -> List[dict]:
     try:
-        response = await call_next(request)
-        return response
-    finally:
-        duration = time.perf_counter() - start
-        path = request.url.path
-        method = request.method
-        status = getattr(response, "status_code", 500)
-        REQUEST_COUNT.labels(path=path, method=method, status=status).inc()
-        REQUEST_LATENCY.labels(path=path, method=method).observe(duration)
-        logger.info(
-            "request path=%s method=%s status=%s duration_ms=%.2f",
-            path,
-            method,
-            status,
-            duration * 1000,
-        )
+        with open(DATA_PATH, "r", encoding="utf-8") as f:
+            _attacks_raw = json.load(f)
+    except FileNotFoundError:
+        return []
+    # validated the same way response_model used to, then dumped once
+    return [Attack.model_validate(a).model_dump(mode="json") for a in _attacks_raw]
 
-try:
-    with open(DATA_PATH, "r", encoding="utf-8") as f:
-        _attacks_raw = json.load(f)
-    attacks: List[Attack] = [Attack.model_validate(a) for a in _attacks_raw]
-except FileNotFoundError:
-    attacks = []
+# the frontend polls these; they're serialized once and answered with 304 when unchanged
+#   -> data.json edits are picked up without a restart
+ATTACKS_RESPONSE = CachedJSON(_load_attacks, source=Path(DATA_PATH))
+METADATA_RESPONSE = CachedJSON(
+    lambda: {
+        "attackTypes": [t.value for t in AttackType],
+        "mlModels": [m.value for m in MLModel],
+    }
+)
 
 @app.get("/")
 @app.get("/api")
@@ -112,6 +237,27 @@ async def backend():
 async def health():
     return {"status": "ok", "timestamp": datetime.utcnow().isoformat() + "Z"}
 
+@app.get("/livez")
+@app.get("/api/livez")
+async def livez():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+@app.get("/api/readyz")
+async def readyz():
+    # the API has nothing to load; it's ready when it can run simulations and keep their payloads
+    checks = {
+        "port_probing_script": (SIMULATIONS_DIR / "port_probing.py").exists(),
+        "dos_script": (SIMULATIONS_DIR / "dos.py").exists(),
+        "payload_dir_writable": os.access(GENERATED_DIR, os.W_OK),
+    }
+    ready = all(checks.values())
+    # ml-service health is reported, not required: runs still answer (with per-row errors) without it
+    return JSONResponse(
+        {"status": "ready" if ready else "not_ready", "checks": checks, "ml_replicas": ML_CLIENT.describe()},
+        status_code=200 if ready else 503,
+    )
+
 @app.get("/metrics")
 @app.get("/api/metrics")
 async def metrics():
@@ -119,16 +265,13 @@ async def metrics():
 
 @app.get("/attacks", response_model=List[Attack])
 @app.get("/api/attacks", response_model=List[Attack])
-async def get_attacks():
-    return attacks
+async def get_attacks(request: Request):
+    return ATTACKS_RESPONSE.response(request)
 
 @app.get("/metadata")
 @app.get("/api/metadata")
-async def get_metadata():
-    return {
-        "attackTypes": [t.value for t in AttackType],
-        "mlModels": [m.value for m in MLModel],
-    }
+async def get_metadata(request: Request):
+    return METADATA_RESPONSE.response(request)
 
 @app.post("/predict")
 @app.post("/api/predict")
@@ -147,112 +290,337 @@ class RunAttackRequest(BaseModel):
         default=None,
         description="If provided, reuse the latest generated payload when it is fresher than this age.",
     )
+    mlModels: Optional[List[MLModel]] = Field(
+        default=None,
+        description="Score with these model families as one ensemble instead of the default model.",
+    )
+    liveId: Optional[str] = Field(
+        default=None,
+        pattern=LIVE_ID_PATTERN.pattern,
+        description="Id for the run's /live events, so a viewer can subscribe before starting it.",
+    )
 
-def _rows_from_json(raw: List[dict]) -> List[ScanRow]:
-    return [ScanRow.model_validate(r) for r in raw]
+def _frame_from_json(raw: List[dict]) -> ScanFrame:
+    try:
+        return ScanFrame.from_records(raw)
+    except ScanFrameError as exc:
+        raise HTTPException(status_code=422, detail=f"Invalid scan rows: {exc}") from exc
 
-def _rows_from_csv(text: str) -> List[ScanRow]:
-    reader = csv.DictReader(StringIO(text))
-    return [ScanRow.model_validate(row) for row in reader]
+def _ml_unavailable(exc: MLServiceError) -> HTTPException:
+    if exc.retry_after is not None:
+        return HTTPException(
+            status_code=503,
+            detail=exc.detail,
+            headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+        )
+    return HTTPException(status_code=502, detail=exc.detail)
 
-def _row_to_ml_payload(row: ScanRow, prev_ts: Optional[datetime]) -> dict:
-    delta = (row.timestamp - prev_ts).total_seconds() if prev_ts else 0.0
-    return {
-        "dst_port": row.port,
-        "src_port": 0,
-        "inter_arrival_time": max(delta, 0.0),
-        "stream_1_count": 1,
-        "l4_tcp": True,
-        "l4_udp": False,
-    }
+def _ml_error(resp) -> HTTPException:
+    # the ml-service's own 503 (model not trained, queue full) means the same to our caller
+    if resp.status_code == 503:
+        headers = {"Retry-After": resp.headers["Retry-After"]} if "Retry-After" in resp.headers else None
+        return HTTPException(status_code=503, detail=f"ML service error 503: {resp.text}", headers=headers)
+    return HTTPException(status_code=502, detail=f"ML service error {resp.status_code}: {resp.text}")
 
-async def _post_to_ml(payload: dict, ml_url: str = ML_SERVICE_URL) -> dict:
+async def _post_to_ml(payload: dict, ml_url: str = ML_SERVICE_URL, deadline: Optional[Deadline] = None) -> dict:
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(ml_url, json=payload)
-            resp.raise_for_status()
-            return resp.json()
-    except httpx.HTTPStatusError as exc:
-        raise HTTPException(
-            status_code=502,
-            detail=f"ML service error {exc.response.status_code}: {exc.response.text}",
-        ) from exc
-    except httpx.RequestError as exc:
-        raise HTTPException(status_code=502, detail=f"ML service request failed: {exc}") from exc
+        resp = await ML_CLIENT.post(ml_url, deadline=deadline, json=payload)
+    except MLServiceError as exc:
+        raise _ml_unavailable(exc) from exc
+    if resp.is_error:
+        raise _ml_error(resp)
+    return resp.json()
 
-async def _predict_batch(payloads: Sequence[dict], ml_url: str = ML_SERVICE_URL) -> List[dict]:
-    results: List[dict] = []
-    for payload in payloads:
+async def _post_batch_to_ml(
+    batch: Dict[str, list], ml_url: str, deadline: Optional[Deadline] = None
+) -> Dict[str, list]:
+    """
+    POST one columnar batch. Uses the compact binary format (wire.py) unless
+    ML_WIRE_FORMAT=json or the ml-service answered 415 before, and always
+    accepts JSON back so either side can be upgraded first.
+    """
+    if ML_WIRE_FORMAT != "binary" or ml_url in _JSON_ONLY_URLS:
+        return await _post_to_ml(batch, ml_url=ml_url, deadline=deadline)
+
+    try:
+        resp = await ML_CLIENT.post(
+            ml_url,
+            deadline=deadline,
+            content=wire.encode_batch(batch),
+            headers={
+                "Content-Type": wire.CONTENT_TYPE,
+                "Accept": f"{wire.CONTENT_TYPE}, application/json;q=0.5",
+            },
+        )
+    except MLServiceError as exc:
+        raise _ml_unavailable(exc) from exc
+    if resp.status_code == 415:
+        logger.warning("ml-service at %s does not accept %s; using JSON", ml_url, wire.CONTENT_TYPE)
+        _JSON_ONLY_URLS.add(ml_url)
+        return await _post_to_ml(batch, ml_url=ml_url, deadline=deadline)
+    if resp.is_error:
+        raise _ml_error(resp)
+
+    if resp.headers.get("content-type", "").startswith(wire.CONTENT_TYPE):
+        columns, meta = wire.decode_batch(resp.content)
+        return {**meta, **{k: v.tolist() for k, v in columns.items()}}
+    return resp.json()
+
+async def _score_columns(
+    batch: Dict[str, list], ml_url: str, label_key: str, live: Optional[LiveRun] = None
+) -> ScoredColumns:
+    """
+    Score a columnar batch in ML_BATCH_ROWS-sized requests, verdicts as columns.
+    All requests share one ML_DEADLINE_S budget; once it is spent (or every
+    replica's circuit is open) the remaining chunks fail at once instead of
+    each waiting out its own timeout. With a live run, each chunk's verdicts
+    are published as soon as they come back.
+    """
+    n = len(next(iter(batch.values()), []))
+    scored = ScoredColumns.empty(n)
+    deadline = Deadline(ML_DEADLINE_S)
+    for start in range(0, n, ML_BATCH_ROWS):
+        end = min(start + ML_BATCH_ROWS, n)
         try:
-            ml = await _post_to_ml(payload, ml_url=ml_url)
-            if "model_metrics" in ml:
-                # log-only: drop metrics from response, keep on server side
-                print("model_metrics:", ml.get("model_metrics"))
-                ml = {k: v for k, v in ml.items() if k != "model_metrics"}
-            results.append({"input": payload, "ml": ml})
+            ml = await _post_batch_to_ml({k: v[start:end] for k, v in batch.items()}, ml_url, deadline)
         except HTTPException as exc:
-            results.append({"input": payload, "error": exc.detail})
-    return results
+            scored.errors.append((start, end, exc.detail))
+        else:
+            scored.labels[start:end] = np.asarray(ml[label_key], dtype=bool)
+            scored.confidence[start:end] = np.asarray(ml["confidence"], dtype=np.float64)
+            # ensembles report one version per family
+            version = ml.get("model_version") or ml.get("model_versions")
+            if version:
+                scored.model_version = version if isinstance(version, str) else json.dumps(version, sort_keys=True)
+        if live is not None:
+            _publish_verdicts(live, batch, scored, start, end)
+    return scored
 
-async def _execute_port_probing(timeout_s: float = 200.0, param: int = 100) -> Path:
+def _publish_verdicts(live: LiveRun, batch: Dict[str, list], scored: ScoredColumns, start: int, end: int) -> None:
+    # label is 1/0, or -1 for rows whose request failed
+    columns = {
+        "port": batch["dst_port"][start:end],
+        "label": scored.labels[start:end],
+        "confidence": scored.confidence[start:end],
+    }
+    if "src_ip" in batch:
+        columns["src_ip"] = batch["src_ip"][start:end]
+    live.verdicts(start, columns)
+    labels = scored.labels[start:end]
+    live.progress(
+        scored=end,
+        detected=live.state.get("detected", 0) + int((labels == 1).sum()),
+        failed=live.state.get("failed", 0) + int((labels == -1).sum()),
+    )
+
+def _write_history(run_id: str, scored: ScoredColumns, summary: Optional[dict], columns: dict) -> None:
+    try:
+        HISTORY.append(run_id, 0, scored, **columns)
+        HISTORY.finish(run_id, summary, scored.model_version)
+    except Exception as exc:
+        logger.warning("run history write failed run_id=%s: %s", run_id, exc)
+        try:
+            HISTORY.finish(run_id, summary, scored.model_version, status="failed")
+        except sqlite3.Error:
+            pass
+
+async def _record_run(
+    kind: str,
+    attack: str,
+    scored: ScoredColumns,
+    summary: Optional[dict] = None,
+    meta: Optional[dict] = None,
+    **columns,
+) -> Optional[str]:
+    """
+    Keep a scored run in the history and return its run_id. The run is
+    registered before the response goes out; its rows are written in the
+    background (status "writing" until they are in).
+    """
+    if HISTORY is None:
+        return None
+    try:
+        run_id = await asyncio.to_thread(HISTORY.start_run, kind, attack, meta)
+    except sqlite3.Error as exc:
+        logger.warning("run history unavailable: %s", exc)
+        return None
+    task = asyncio.create_task(asyncio.to_thread(_write_history, run_id, scored, summary, columns))
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return run_id
+
+async def _predict_scan(frame: ScanFrame, include_rows: bool, kind: str) -> dict:
+    order = frame.time_order()
+    batch = frame.to_ml_batch(order)
+    scored = await _score_columns(batch, ML_SERVICE_BATCH_URL, "is_port_probe")
+    targets = np.asarray(frame.target_names, dtype=object)[frame.targets[order]]
+    summary = summarize(
+        scored,
+        ports=frame.ports[order],
+        groups={"target": targets},
+        timestamps_ns=frame.timestamps[order],
+    )
+    run_id = await _record_run(
+        kind,
+        "port_probing",
+        scored,
+        summary,
+        timestamps_ns=frame.timestamps[order],
+        ports=frame.ports[order],
+        sources=targets,
+    )
+    response = {"run_id": run_id, "count": len(order), "summary": summary}
+    if include_rows:
+        response["results"] = scored.rows(batch_rows(batch), "is_port_probe")
+    return response
+
+async def _execute_port_probing(
+    timeout_s: float = 200.0,
+    param: int = 100,
+    start_port: int = 0,
+    target: str = PORT_PROBE_TARGET,
+    output: Optional[Path] = None,
+    progress: Optional[Callable[..., None]] = None,
+) -> Path:
     """
-    Run the port probing simulation script and return once the process finishes.
+    Run the port probing simulation over ports start_port..param (inclusive)
+    and return the payload path once the process finishes. progress, if given,
+    is called with the scan's progress fields as the scanner reports them.
     Raises TimeoutError on timeout and RuntimeError on non-zero exit.
     """
     script = SIMULATIONS_DIR / "port_probing.py"
     if not script.exists():
         raise RuntimeError(f"Simulation script not found at {script}")
 
-    prefix = GENERATED_DIR / "port_probe"
-    cmd = [
-        sys.executable,
-        str(script),
-        str(param),
-        "--use-default-common",
-        "--out-prefix",
-        str(prefix),
-    ]
+    output = output or GENERATED_DIR / f"port_probe_{time.time_ns()}.json"
+    if PORT_PROBE_WORKERS > 1:
+        cmd = [
+            sys.executable,
+            str(SIMULATIONS_DIR / "distributed_scan.py"),
+            "run",
+            "--targets",
+            target,
+            "--ports",
+            f"{start_port}-{param}",
+            "--workers",
+            str(PORT_PROBE_WORKERS),
+            "--output",
+            str(output),
+            "--progress",
+        ]
+    else:
+        cmd = [
+            sys.executable,
+            str(script),
+            str(param),
+            "--start-port",
+            str(start_port),
+            "--target",
+            target,
+            "--use-default-common",
+            "--output",
+            str(output),
+        ]
+    scan = f"{target}:{start_port}-{param}"
+    if progress is not None:
+        progress(scan=scan)
+    try:
+        returncode, stdout, stderr = await _run_simulation(
+            cmd, timeout_s, _scan_progress(progress, scan) if progress is not None else None
+        )
+    except asyncio.TimeoutError as exc:
+        raise TimeoutError("Simulation timed out") from exc
+
+    if returncode != 0:
+        err = stderr.strip() or stdout.strip() or "unknown error"
+        raise RuntimeError(f"Simulation failed: {err}")
+
+    return output
+
+async def _run_simulation(
+    cmd: List[str], timeout_s: float, on_line: Optional[Callable[[bytes], None]] = None
+) -> Tuple[int, str, str]:
+    """
+    Run a simulation script and return (returncode, stdout, stderr).
+    With on_line, stdout is read line by line as the script writes it (unbuffered)
+    and every line is handed to on_line; otherwise it is collected at the end.
+    Raises asyncio.TimeoutError after killing the process.
+    """
     proc = await asyncio.create_subprocess_exec(
         *cmd,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE,
         cwd=str(SIMULATIONS_DIR.parent),
+        env={**os.environ, "PYTHONUNBUFFERED": "1"} if on_line is not None else None,
     )
+
+    async def _read_lines() -> Tuple[bytes, bytes]:
+        stderr_task = asyncio.ensure_future(proc.stderr.read())
+        lines: List[bytes] = []
+        try:
+            async for line in proc.stdout:
+                lines.append(line)
+                on_line(line)
+            stderr = await stderr_task
+        finally:
+            stderr_task.cancel()
+        await proc.wait()
+        return b"".join(lines), stderr
+
     try:
-        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout_s)
-    except asyncio.TimeoutError as exc:
+        stdout, stderr = await asyncio.wait_for(
+            proc.communicate() if on_line is None else _read_lines(), timeout=timeout_s
+        )
+    except asyncio.TimeoutError:
         proc.kill()
         await proc.communicate()
-        raise TimeoutError("Simulation timed out") from exc
+        raise
+    return proc.returncode, stdout.decode(), stderr.decode()
 
-    if proc.returncode != 0:
-        err = stderr.decode().strip() or stdout.decode().strip() or "unknown error"
-        raise RuntimeError(f"Simulation failed: {err}")
+# "[12/100] port 443 -> open | banner: ..." as simulations/port_probing.py prints each finished port
+_SCAN_LINE = re.compile(rb"^\[(\d+)/(\d+)\] port (\d+) -> (\w+)")
+# "[1024/65536] ports closed=1020 open=4" as distributed_scan.py --progress prints while shards report
+_SHARDED_SCAN_LINE = re.compile(rb"^\[(\d+)/(\d+)\] ports((?: \w+=\d+)*)\s*$")
 
-    return GENERATED_DIR
+def _scan_progress(progress: Callable[..., None], scan: str) -> Callable[[bytes], None]:
+    states: Dict[str, int] = {}
 
-def _load_latest_payload() -> tuple[List[dict], Path]:
-    files = sorted(
-        GENERATED_DIR.glob("*.json"),
-        key=lambda p: p.stat().st_mtime,
-        reverse=True,
-    )
-    if not files:
-        raise FileNotFoundError("No generated payloads available")
-    path = files[0]
-    with path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data, path
-
-def _latest_payload_path() -> Optional[Path]:
-    files = sorted(
-        GENERATED_DIR.glob("*.json"),
-        key=lambda p: p.stat().st_mtime,
-        reverse=True,
-    )
-    return files[0] if files else None
+    def on_line(line: bytes) -> None:
+        match = _SCAN_LINE.match(line)
+        if match is not None:
+            state = match.group(4).decode()
+            states[state] = states.get(state, 0) + 1
+            progress(
+                scan=scan,
+                ports_done=int(match.group(1)),
+                ports_total=int(match.group(2)),
+                last_port=int(match.group(3)),
+                port_states=dict(states),
+            )
+            return
+        match = _SHARDED_SCAN_LINE.match(line)
+        if match is not None:
+            counts = dict(pair.split(b"=") for pair in match.group(3).split())
+            progress(
+                scan=scan,
+                ports_done=int(match.group(1)),
+                ports_total=int(match.group(2)),
+                port_states={k.decode(): int(v) for k, v in counts.items()},
+            )
+
+    return on_line
 
-async def _execute_dos_simulation(target_url: str, count: int, timeout_s: float = 200.0) -> tuple[str, str]:
+# generated payloads indexed by target and port range; runs only scan the ports no fresh payload has
+SCAN_CACHE = ScanCache(
+    GENERATED_DIR,
+    run=lambda target, start, end, output, progress: _execute_port_probing(
+        param=end, start_port=start, target=target, output=output, progress=progress
+    ),
+)
+
+async def _execute_dos_simulation(
+    target_url: str, count: int, timeout_s: float = 200.0, live: Optional[LiveRun] = None
+) -> tuple[str, str]:
     script = SIMULATIONS_DIR / "dos.py"
     if not script.exists():
         raise RuntimeError(f"DoS simulation script not found at {script}")
@@ -263,124 +631,496 @@ async def _execute_dos_simulation(target_url: str, count: int, timeout_s: float
         target_url,
         str(count),
     ]
-    proc = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-        cwd=str(SIMULATIONS_DIR.parent),
-    )
+    on_line = None
+    if live is not None:
+        live.phase("simulating", requests_total=count)
+        sent = 0
+
+        # every request the simulator made is one NDJSON event line
+        def on_line(line: bytes) -> None:
+            nonlocal sent
+            if line.startswith(b"{"):
+                sent += 1
+                live.progress(requests_sent=sent)
+
     try:
-        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout_s)
+        returncode, stdout, stderr = await _run_simulation(cmd, timeout_s, on_line)
     except asyncio.TimeoutError as exc:
-        proc.kill()
-        await proc.communicate()
         raise TimeoutError("DoS simulation timed out") from exc
 
-    if proc.returncode != 0:
-        err = stderr.decode().strip() or stdout.decode().strip() or "unknown error"
+    if returncode != 0:
+        err = stderr.strip() or stdout.strip() or "unknown error"
         raise RuntimeError(f"DoS simulation failed: {err}")
 
-    return stdout.decode(), stderr.decode()
+    return stdout, stderr
+
+# per-row results are the bulk of a big response; summaries are always included
+INCLUDE_ROWS_QUERY = Query(True, description="Return per-row results next to the summary")
 
 @app.post("/predict-from-scan-json")
 @app.post("/api/predict-from-scan-json")
-async def predict_from_scan_json(raw: List[dict]):
-    rows = sorted(_rows_from_json(raw), key=lambda r: r.timestamp)
-    payloads = []
-    prev_ts = None
-    for r in rows:
-        payloads.append(_row_to_ml_payload(r, prev_ts))
-        prev_ts = r.timestamp
-    results = await _predict_batch(payloads)
-    return {"count": len(results), "results": results}
+async def predict_from_scan_json(raw: List[dict], include_rows: bool = INCLUDE_ROWS_QUERY):
+    return await _predict_scan(_frame_from_json(raw), include_rows, "scan-json")
 
 @app.post("/predict-from-scan-csv")
 @app.post("/api/predict-from-scan-csv")
-async def predict_from_scan_csv(body: ScanCSV):
-    rows = sorted(_rows_from_csv(body.csv_text), key=lambda r: r.timestamp)
-    payloads = []
-    prev_ts = None
-    for r in rows:
-        payloads.append(_row_to_ml_payload(r, prev_ts))
-        prev_ts = r.timestamp
-    results = await _predict_batch(payloads)
-    return {"count": len(results), "results": results}
+async def predict_from_scan_csv(body: ScanCSV, include_rows: bool = INCLUDE_ROWS_QUERY):
+    frame = _frame_from_json(list(csv.DictReader(StringIO(body.csv_text))))
+    return await _predict_scan(frame, include_rows, "scan-csv")
+
+@app.post("/predict-from-scan-stream")
+@app.post("/api/predict-from-scan-stream")
+async def predict_from_scan_stream(
+    request: Request,
+    presorted: bool = Query(False, description="Rows already arrive in timestamp order; skip sorting"),
+    batch_size: int = Query(500, ge=1, le=10000, description="Rows scored per ML batch"),
+):
+    """
+    Raw-body variant of the predict-from-scan endpoints for large exports.
+    The body (text/csv or NDJSON) is parsed as it arrives, and scored results are
+    spooled to disk and streamed back as NDJSON, ending with a summary line.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    parse = STREAM_PARSERS.get(content_type)
+    if parse is None:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported content type '{content_type}'; use one of {sorted(STREAM_PARSERS)}",
+        )
+
+    errors = RowErrors()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=4)
+    producer = asyncio.create_task(
+        _produce_scan_batches(parse(request.stream(), errors), presorted, batch_size, queue)
+    )
+
+    fd, out_path = tempfile.mkstemp(prefix="scan_results_", suffix=".ndjson")
+    count = 0
+    detected = 0
+    model_version = None
+    run_id = None
+    if HISTORY is not None:
+        try:
+            run_id = await asyncio.to_thread(HISTORY.start_run, "scan-stream", "port_probing")
+        except sqlite3.Error as exc:
+            logger.warning("run history unavailable: %s", exc)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            # score batch N while the producer is still parsing batch N+1
+            while (item := await queue.get()) is not None:
+                batch, columns = item
+                scored = await _score_columns(batch, ML_SERVICE_BATCH_URL, "is_port_probe")
+                for result in scored.rows(batch_rows(batch), "is_port_probe"):
+                    out.write(json.dumps(result))
+                    out.write("\n")
+                if run_id is not None:
+                    await asyncio.to_thread(HISTORY.append, run_id, count, scored, **columns)
+                count += len(batch["dst_port"])
+                detected += int((scored.labels == 1).sum())
+                model_version = scored.model_version or model_version
+            stats = await producer
+            summary = {
+                "run_id": run_id,
+                "count": count,
+                "detected": detected,
+                "invalid_rows": errors.count,
+                "errors": errors.samples,
+                **stats,
+            }
+            out.write(json.dumps({"summary": summary}))
+            out.write("\n")
+        if run_id is not None:
+            await asyncio.to_thread(HISTORY.finish, run_id, summary, model_version)
+    except BaseException:
+        producer.cancel()
+        os.unlink(out_path)
+        if run_id is not None:
+            await asyncio.to_thread(HISTORY.finish, run_id, None, model_version, "failed")
+        raise
+
+    logger.info(
+        "scan stream completed count=%d invalid=%d presorted=%s", count, errors.count, presorted
+    )
+    return FileResponse(
+        out_path,
+        media_type="application/x-ndjson",
+        background=BackgroundTask(os.unlink, out_path),
+    )
+
+async def _produce_scan_batches(rows, presorted: bool, batch_size: int, queue: asyncio.Queue) -> dict:
+    sorter = None if presorted else ExternalSorter()
+    stats = {"presorted": presorted, "spilled_runs": 0, "out_of_order_rows": 0}
+    batch: List[StreamRow] = []
+    prev_ts: Optional[datetime] = None
+    # per-target state, so inter-arrival deltas and stream counts carry across batches
+    prev_ns: Dict[str, int] = {}
+    recent: Dict[str, np.ndarray] = {}
+
+    def _pack(rows: List[StreamRow]) -> Tuple[Dict[str, list], dict]:
+        frame = ScanFrame.from_rows(rows)
+        order = frame.time_order()
+        columns = {
+            "timestamps_ns": frame.timestamps[order],
+            "ports": frame.ports[order],
+            "sources": np.asarray(frame.target_names, dtype=object)[frame.targets[order]],
+        }
+        return frame.to_ml_batch(order, prev_ns, recent), columns
+
+    try:
+        if sorter is None:
+            ordered = rows
+        else:
+            async for row in rows:
+                if sorter.add(row):
+                    await asyncio.to_thread(sorter.spill)
+            stats["spilled_runs"] = len(sorter.runs)
+            # the merge reads the spilled runs from disk, so it is pulled from a worker thread
+            ordered = _aiter_in_thread(sorter, batch_size)
+
+        async for row in ordered:
+            if prev_ts is not None and row.timestamp < prev_ts:
+                stats["out_of_order_rows"] += 1
+            batch.append(row)
+            prev_ts = row.timestamp
+            if len(batch) >= batch_size:
+                await queue.put(_pack(batch))
+                batch = []
+        if batch:
+            await queue.put(_pack(batch))
+        await queue.put(None)
+        return stats
+    except Exception:
+        # wake the consumer so it can surface the error
+        await queue.put(None)
+        raise
+    finally:
+        if sorter is not None:
+            sorter.close()
+
+async def _aiter_in_thread(items, chunk: int):
+    it = await asyncio.to_thread(iter, items)
+    while True:
+        rows = await asyncio.to_thread(list, islice(it, chunk))
+        if not rows:
+            return
+        for row in rows:
+            yield row
+
+def _history() -> RunHistory:
+    if HISTORY is None:
+        raise HTTPException(status_code=503, detail="Run history is disabled (RUN_HISTORY_PATH is empty)")
+    return HISTORY
+
+def _to_ns(value: Optional[datetime]) -> Optional[int]:
+    if value is None:
+        return None
+    # naive datetimes are UTC, like the scanner timestamps
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1e9)
+
+async def _history_query(fn, *args, **kwargs):
+    try:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    except CursorError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+@app.get("/history/runs")
+@app.get("/api/history/runs")
+async def list_runs(
+    attack: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="Runs started at or after this time"),
+    until: Optional[datetime] = Query(None, description="Runs started before this time"),
+    limit: int = Query(50, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+):
+    """Past runs, newest first."""
+    return await _history_query(
+        _history().list_runs, attack=attack, since_ns=_to_ns(since), until_ns=_to_ns(until), limit=limit, cursor=cursor
+    )
+
+@app.get("/history/runs/{run_id}")
+@app.get("/api/history/runs/{run_id}")
+async def get_run(run_id: str):
+    run = await _history_query(_history().get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Unknown run '{run_id}'")
+    return run
+
+@app.get("/history/runs/{run_id}/predictions")
+@app.get("/api/history/runs/{run_id}/predictions")
+async def get_run_predictions(
+    run_id: str,
+    limit: int = Query(500, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    detected_only: bool = False,
+):
+    """One run's per-row predictions in row order."""
+    return await _history_query(
+        _history().run_predictions, run_id, limit=limit, cursor=cursor, detected_only=detected_only
+    )
+
+@app.get("/history/predictions")
+@app.get("/api/history/predictions")
+async def get_predictions(
+    since: datetime,
+    until: Optional[datetime] = Query(None, description="Defaults to now"),
+    attack: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    detected_only: bool = False,
+):
+    """Predictions of every run whose row timestamp falls in [since, until), oldest first."""
+    return await _history_query(
+        _history().predictions_between,
+        _to_ns(since),
+        _to_ns(until) if until is not None else time.time_ns(),
+        attack=attack,
+        limit=limit,
+        cursor=cursor,
+        detected_only=detected_only,
+    )
 
 @app.post("/run-attack")
 @app.post("/api/run-attack")
-async def run_attack(body: RunAttackRequest):
+async def run_attack(body: RunAttackRequest, request: Request, include_rows: bool = INCLUDE_ROWS_QUERY):
     attack = body.attack.lower()
     request_count = int(body.requestCount or 0)
     if attack in ("port probing", "port_probing", "port-probing", "portprobing"):
-        return await _run_port_probing(request_count, body.max_age_seconds)
-    if attack in ("dos", "ddos", "dos attack", "denial of service"):
-        return await _run_dos_attack(request_count)
-    raise HTTPException(status_code=400, detail="Attack not implemented; supported: Port Probing, DOS.")
+        attack = "port_probing"
+        run = lambda live: _run_port_probing(request_count, body.max_age_seconds, body.mlModels, include_rows, live)
+    elif attack in ("dos", "ddos", "dos attack", "denial of service"):
+        attack = "dos"
+        run = lambda live: _run_dos_attack(request_count, body.mlModels, include_rows, live)
+    else:
+        raise HTTPException(status_code=400, detail="Attack not implemented; supported: Port Probing, DOS.")
+    unsupported = sorted({m.value for m in body.mlModels or ()} - ML_SERVICE_FAMILIES)
+    if unsupported:
+        raise HTTPException(
+            status_code=400,
+            detail=f"mlModels {unsupported} are not served by the ml-service; supported: {sorted(ML_SERVICE_FAMILIES)}",
+        )
 
-async def _run_port_probing(requestCount: int, max_age: Optional[int]) -> dict:
-    requestCount = max(requestCount, 1)
-    source = "generated"
-    exec_error = None
+    try:
+        live = LIVE_FEED.start_run(attack, body.liveId, request_count=request_count)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    outcome, result = "failed", {}
+    try:
+        async with ADMISSION.admit(_client_id(request), cost=max(request_count, 1)) as waited:
+            RUN_ATTACK_QUEUE_WAIT.observe(waited)
+            result = await run(live)
+            outcome = "completed"
+            return {"live_id": live.id, **result}
+    except Overloaded as exc:
+        outcome = "rejected"
+        RUN_ATTACK_REJECTED.labels(reason=exc.reason).inc()
+        logger.warning("run_attack rejected reason=%s retry_after=%ss", exc.reason, exc.retry_after)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Too many simulations running ({exc.reason}); retry later.",
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+    finally:
+        summary = result.get("summary") or {}
+        live.finish(
+            outcome,
+            run_id=result.get("run_id"),
+            count=result.get("count"),
+            detected=summary.get("detected"),
+            detection_rate=summary.get("detection_rate"),
+        )
 
-    latest = _latest_payload_path()
-    if max_age is not None and latest:
-        age = time.time() - latest.stat().st_mtime
-        if age <= max_age:
-            source = "cached"
-            logger.info("using cached payload (age %.1fs <= max_age %ss)", age, max_age)
-        else:
-            latest = None
+LIVE_RUN_QUERY = Query(None, description="Only this run's events (the live_id /run-attack returns or was given)")
+LIVE_TYPES_QUERY = Query(None, description="Comma-separated event types, e.g. progress,run_finished")
+
+def _live_subscribe(run: Optional[str], types: Optional[str]):
+    try:
+        parsed = parse_types(types)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    try:
+        return LIVE_FEED.subscribe(run, parsed)
+    except FeedFull as exc:
+        raise HTTPException(status_code=503, detail="Too many live viewers", headers={"Retry-After": "5"}) from exc
+
+@app.get("/live")
+@app.get("/api/live")
+async def live_events(run: Optional[str] = LIVE_RUN_QUERY, types: Optional[str] = LIVE_TYPES_QUERY):
+    """
+    Server-sent events of running simulations: run_started, progress,
+    verdicts, run_finished, and dropped (events a slow viewer missed).
+    """
+    # subscribed before the response starts, so a full feed is a 503 rather than a cut-off 200
+    sub = _live_subscribe(run, types)
 
-    if source != "cached":
+    async def stream():
         try:
-            await _execute_port_probing(param=requestCount)
-            logger.info("port probing simulation executed successfully")
-        except TimeoutError:
-            source = "cached"
-            exec_error = "Simulation timed out; using latest cached payload."
-            logger.warning("port probing simulation timed out; using cached payload")
-        except Exception as exc:
-            source = "cached"
-            exec_error = f"Simulation failed ({exc}); using latest cached payload."
-            logger.error("port probing simulation failed: %s", exc)
+            # EventSource reconnects after this many ms
+            yield "retry: 2000\n\n"
+            while True:
+                events = await sub.next_events(LIVE_HEARTBEAT_S)
+                # everything queued goes out as one write; idle connections get a comment line
+                yield "".join(e.sse() for e in events) if events else ": keep-alive\n\n"
+        finally:
+            LIVE_FEED.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # a viewer gone before the body started never runs the generator's finally
+        background=BackgroundTask(LIVE_FEED.unsubscribe, sub),
+    )
+
+@app.websocket("/live/ws")
+@app.websocket("/api/live/ws")
+async def live_socket(websocket: WebSocket, run: Optional[str] = None, types: Optional[str] = None):
+    """The /live events as WebSocket text frames, one JSON event per frame."""
+    try:
+        sub = LIVE_FEED.subscribe(run, parse_types(types))
+    except (ValueError, FeedFull) as exc:
+        await websocket.close(code=1008 if isinstance(exc, ValueError) else 1013, reason=str(exc))
+        return
+    await websocket.accept()
+
+    async def send_events() -> None:
+        while True:
+            for event in await sub.next_events(LIVE_HEARTBEAT_S):
+                await websocket.send_text(event.data)
+
+    async def wait_for_close() -> None:
+        # viewers don't send anything; reading is how a close is noticed while no events flow
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
 
+    # whichever ends first (the viewer left, or a send to it failed) ends both
+    tasks = [asyncio.ensure_future(send_events()), asyncio.ensure_future(wait_for_close())]
     try:
-        payload_data, payload_path = _load_latest_payload()
-    except FileNotFoundError as exc:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        LIVE_FEED.unsubscribe(sub)
+
+@app.get("/live/runs")
+@app.get("/api/live/runs")
+async def live_runs():
+    return {"runs": LIVE_FEED.runs(), "subscribers": len(LIVE_FEED)}
+
+def _client_id(request: Request) -> str:
+    # each trusted proxy appends the address it saw, so the client is TRUSTED_PROXY_COUNT hops from the end;
+    #   -> anything left of that is whatever the client sent and can't key a rate limit
+    if TRUSTED_PROXY_COUNT > 0:
+        hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if len(hops) >= TRUSTED_PROXY_COUNT:
+            return hops[-TRUSTED_PROXY_COUNT]
+    return request.client.host if request.client else "unknown"
+
+def _ml_batch_url(attack: str, default_url: str, ml_models: Optional[List[MLModel]]) -> str:
+    # no families picked: the attack's default model, as before
+    if not ml_models:
+        return default_url
+    families = ",".join(sorted({m.value.lower() for m in ml_models}))
+    return f"{ML_SERVICE_ENSEMBLE_URL.format(attack=attack)}?families={families}"
+
+async def _run_port_probing(
+    requestCount: int,
+    max_age: Optional[int],
+    ml_models: Optional[List[MLModel]] = None,
+    include_rows: bool = True,
+    live: Optional[LiveRun] = None,
+) -> dict:
+    requestCount = max(requestCount, 1)
+
+    # one row per port, 0..requestCount-1; fresh cached ports are reused, the rest are scanned
+    if live is not None:
+        live.phase("scanning")
+    # progress of every scan this run waits on, including ones another run started
+    scan = await SCAN_CACHE.get(
+        PORT_PROBE_TARGET, 0, requestCount - 1, max_age, on_progress=live.progress if live is not None else None
+    )
+    exec_error = None
+    if scan.errors:
+        exec_error = f"Simulation failed ({'; '.join(scan.errors)}); using cached payloads for the missing ports."
+        logger.error("port probing simulation failed: %s", "; ".join(scan.errors))
+    if not scan.rows:
         raise HTTPException(
             status_code=500,
             detail="No generated payloads available; run the simulation script to produce payloads.",
-        ) from exc
-
-    rows = sorted(_rows_from_json(payload_data), key=lambda r: r.timestamp)
-    payloads = []
-    prev_ts: Optional[datetime] = None
-    for r in rows:
-        payloads.append(_row_to_ml_payload(r, prev_ts))
-        prev_ts = r.timestamp
+        )
+    source = scan.source
+    payload_data = scan.rows
+    payload_path = scan.paths[0]
+    logger.info(
+        "port probing payload source=%s reused=%s scanned=%s files=%d",
+        source,
+        scan.reused,
+        scan.scanned,
+        len(scan.paths),
+    )
 
-    payloads = payloads[: max(requestCount, 1)]
-    payload_data = payload_data[: len(payloads)]
-    results = await _predict_batch(payloads)
+    frame = _frame_from_json(payload_data)
+    order = frame.time_order()[:requestCount]
+    payload_data = [payload_data[i] for i in order]
+    ml_batch = frame.to_ml_batch(order)
+    ml_url = _ml_batch_url("port_probing", ML_SERVICE_BATCH_URL, ml_models)
+    if live is not None:
+        live.phase("scoring", rows_total=len(order), reused_ports=scan.reused, scanned_ports=scan.scanned)
+    scored = await _score_columns(ml_batch, ml_url, "is_port_probe", live)
+    _spool_simulation("port_probing", _spoolable_scan_rows(ml_batch, payload_data, scan.started))
+    states = np.array([str(row.get("state", "unknown")) for row in payload_data], dtype=object)
+    summary = summarize(
+        scored,
+        ports=frame.ports[order],
+        groups={"state": states},
+        timestamps_ns=frame.timestamps[order],
+    )
+    run_id = await _record_run(
+        "run-attack",
+        "port_probing",
+        scored,
+        summary,
+        meta={"target": PORT_PROBE_TARGET, "source": source, "ml_url": ml_url},
+        timestamps_ns=frame.timestamps[order],
+        ports=frame.ports[order],
+        sources=np.asarray(frame.target_names, dtype=object)[frame.targets[order]],
+        states=states,
+    )
     response = {
+        "run_id": run_id,
         "source": source,
         "payload_path": str(payload_path),
-        "count": len(results),
-        "payload": payload_data,
-        "results": results,
+        "scan": {
+            "target": PORT_PROBE_TARGET,
+            "reused_ports": scan.reused,
+            "scanned_ports": scan.scanned,
+            "payload_paths": [str(p) for p in scan.paths],
+        },
+        "count": len(order),
+        "summary": summary,
     }
+    if include_rows:
+        response["payload"] = payload_data
+        response["results"] = scored.rows(batch_rows(ml_batch), "is_port_probe")
     if exec_error:
         response["note"] = exec_error
     logger.info(
         "run_attack completed source=%s payload_path=%s count=%d note=%s",
         source,
         payload_path,
-        len(results),
+        len(order),
         exec_error or "",
     )
     return response
 
-async def _run_dos_attack(request_count: int) -> dict:
+async def _run_dos_attack(
+    request_count: int,
+    ml_models: Optional[List[MLModel]] = None,
+    include_rows: bool = True,
+    live: Optional[LiveRun] = None,
+) -> dict:
     target = DOS_TARGET_URL
     request_count = max(request_count, 1)
     payloads = [{"msg": "malicious traffic"} for _ in range(request_count)]
@@ -388,50 +1128,147 @@ async def _run_dos_attack(request_count: int) -> dict:
     DOS_STORE.extend(payloads)
 
     note = ""
-    try:
-        stdout, stderr = await _execute_dos_simulation(target, request_count)
-        logger.info("dos simulation executed successfully target=%s count=%d", target, request_count)
-        if stdout.strip() or stderr.strip():
-            note = (stdout.strip() + " " + stderr.strip()).strip()
-    except Exception as exc:
-        note = f"DoS simulation had errors: {exc}"
-        logger.warning(note)
-
-    ml_payloads = []
-    for idx, _ in enumerate(DOS_STORE):
-        burst_factor = 1 + (idx % 10)
-        ml_payloads.append(
-            {
-                "dst_port": 80,
-                "flow_packets_s": 800 + (burst_factor * 50),
-                "flow_bytes_s": 6000000 + (burst_factor * 250000),
-                "total_fwd_packet": 700 + (burst_factor * 25),
-                "flow_duration": 750000 + (burst_factor * 500),
-                "total_length_of_fwd_packet": 5000000 + (burst_factor * 50000),
-                "src_ip": f"10.0.0.98",
-                "dst_ip": "192.168.50.253",
-            }
-        )
+    events: List[PacketEvent] = []
+    if not target:
+        note = "DOS_TARGET_URL is not set; no requests were sent."
+    else:
+        try:
+            stdout, stderr = await _execute_dos_simulation(target, request_count, live=live)
+            logger.info("dos simulation executed successfully target=%s count=%d", target, request_count)
+            events = _parse_packet_events(stdout)
+            if stderr.strip():
+                note = stderr.strip()
+        except Exception as exc:
+            note = f"DoS simulation had errors: {exc}"
+            logger.warning(note)
 
-    results = await _predict_batch(ml_payloads, ml_url=ML_SERVICE_DOS_URL)
-    confidences = []
-    for r in results:
-        ml = r.get("ml") or {}
-        conf = ml.get("confidence")
-        if isinstance(conf, (int, float)):
-            confidences.append(float(conf))
-    avg_conf = sum(confidences) / len(confidences) if confidences else None
+    if events:
+        # derive flow features from what the simulator actually sent
+        features = FlowAggregator().add_many(events)
+        ml_batch = {name: features[name][:request_count] for name in DOS_COLUMNS}
+        timestamps_ns = np.fromiter((e.ts_ns for e in events[:request_count]), dtype=np.int64)
+        feature_source = "flow_aggregator"
+    else:
+        ml_batch = _synthetic_dos_batch(len(DOS_STORE))
+        timestamps_ns = None
+        feature_source = "synthetic"
+        note = (note + " No packet events captured; scored a synthetic burst profile.").strip()
+
+    ml_url = _ml_batch_url("dos", ML_SERVICE_DOS_BATCH_URL, ml_models)
+    if live is not None:
+        live.phase("scoring", rows_total=len(ml_batch["dst_port"]), feature_source=feature_source)
+    scored = await _score_columns(ml_batch, ml_url, "is_dos", live)
+    if feature_source == "flow_aggregator":
+        _spool_simulation("dos", ml_batch)
+    summary = summarize(
+        scored,
+        ports=np.asarray(ml_batch["dst_port"]),
+        groups={"src_ip": np.asarray(ml_batch["src_ip"], dtype=object)},
+        timestamps_ns=timestamps_ns,
+    )
+    run_id = await _record_run(
+        "run-attack",
+        "dos",
+        scored,
+        summary,
+        meta={"target": target, "feature_source": feature_source, "ml_url": ml_url},
+        timestamps_ns=timestamps_ns,
+        ports=ml_batch["dst_port"],
+        sources=ml_batch["src_ip"],
+    )
 
     DOS_STORE.clear()
-    return {
+    response = {
+        "run_id": run_id,
         "source": "simulation",
         "target": target,
         "count": request_count,
-        "payload": payloads,
-        "results": results,
-        "average_confidence": avg_conf,
+        "average_confidence": summary["confidence"]["mean"],
+        "summary": summary,
+        "feature_source": feature_source,
         "note": note or "DoS simulation completed.",
     }
+    if include_rows:
+        response["payload"] = payloads
+        response["results"] = scored.rows(batch_rows(ml_batch), "is_dos")
+    return response
+
+def _spoolable_scan_rows(batch: Dict[str, list], rows: List[dict], started: List[Tuple[int, int]]) -> Dict[str, list]:
+    """
+    The rows of a port-probing batch worth training on: ports this run scanned itself (cached
+    and joined ports were spooled by the run that scanned them) whose real source port the
+    scanner recorded. The batch's src_port is a placeholder 0 and would teach "src_port 0 is an attack".
+    """
+    keep = [
+        i for i, row in enumerate(rows)
+        if row.get("src_port") is not None and any(a <= int(row["port"]) <= b for a, b in started)
+    ]
+    spool = {name: [values[i] for i in keep] for name, values in batch.items()}
+    spool["src_port"] = [int(rows[i]["src_port"]) for i in keep]
+    return spool
+
+def _spool_simulation(model: str, batch: Dict[str, list]) -> None:
+    """
+    Hand simulated traffic to the ml-service spool for incremental training.
+    Everything a simulation generates is attack traffic, so every row is labeled 1.
+    Fire-and-forget: spooling must never slow down or fail a run.
+    """
+    if not ML_SERVICE_SPOOL_URL or not batch or not next(iter(batch.values())):
+        return
+
+    async def _send() -> None:
+        headers = {"X-Admin-Token": ML_ADMIN_TOKEN} if ML_ADMIN_TOKEN else {}
+        try:
+            resp = await ML_CLIENT.post(
+                f"{ML_SERVICE_SPOOL_URL.rstrip('/')}/{model}",
+                json={"columns": batch, "label": 1},
+                headers=headers,
+            )
+        except MLServiceError as exc:
+            logger.warning("spooling %s simulation rows failed: %s", model, exc.detail)
+            return
+        if resp.is_error:
+            logger.warning("spooling %s simulation rows failed: %s %s", model, resp.status_code, resp.text)
+
+    task = asyncio.create_task(_send())
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+def _parse_packet_events(stdout: str) -> List[PacketEvent]:
+    events: List[PacketEvent] = []
+    for line in stdout.splitlines():
+        if not line.startswith("{"):
+            continue
+        try:
+            raw = json.loads(line)
+            events.append(
+                PacketEvent(
+                    ts_ns=int(raw["ts_ns"]),
+                    src_ip=str(raw["src_ip"]),
+                    dst_ip=str(raw["dst_ip"]),
+                    dst_port=int(raw["dst_port"]),
+                    src_port=int(raw.get("src_port") or 0),
+                    length=int(raw.get("length") or 0),
+                    proto=str(raw.get("proto") or "tcp"),
+                )
+            )
+        except (ValueError, KeyError, TypeError):
+            continue
+    events.sort(key=lambda e: e.ts_ns)
+    return events
+
+def _synthetic_dos_batch(n: int) -> Dict[str, list]:
+    burst_factor = 1 + (np.arange(n) % 10)
+    return {
+        "dst_port": [80] * n,
+        "flow_packets_s": (800 + burst_factor * 50).tolist(),
+        "flow_bytes_s": (6000000 + burst_factor * 250000).tolist(),
+        "total_fwd_packet": (700 + burst_factor * 25).tolist(),
+        "flow_duration": (750000 + burst_factor * 500).tolist(),
+        "total_length_of_fwd_packet": (5000000 + burst_factor * 50000).tolist(),
+        "src_ip": ["10.0.0.98"] * n,
+        "dst_ip": ["192.168.50.253"] * n,
+    }
 
 @app.post("/output-json", status_code=status.HTTP_403_FORBIDDEN)
 @app.post("/api/output-json", status_code=status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,419 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger("api")
+
+# comma-separated ml-service base URLs (scheme://host:port) to spread calls over
+#   -> empty: every call goes to the host in the configured ML_SERVICE_* URL, as before
+ML_SERVICE_REPLICAS = [u.strip().rstrip("/") for u in os.getenv("ML_SERVICE_REPLICAS", "").split(",") if u.strip()]
+
+# one attempt may take ML_REQUEST_TIMEOUT_S; everything a call does (chunks, retries,
+# hedges) has to fit in its deadline, ML_DEADLINE_S unless the caller passes one
+ML_REQUEST_TIMEOUT_S = float(os.getenv("ML_REQUEST_TIMEOUT_S", "10"))
+ML_DEADLINE_S = float(os.getenv("ML_DEADLINE_S", "20"))
+ML_RETRIES = int(os.getenv("ML_RETRIES", "1"))
+
+# a second copy of a slow request goes out after this many seconds
+#   -> "auto" waits for the recent p95 of that route, "off" never hedges
+ML_HEDGE_AFTER = os.getenv("ML_HEDGE_AFTER", "auto").lower()
+# hedges (and retries) may add at most this share of extra requests
+ML_RETRY_BUDGET = float(os.getenv("ML_RETRY_BUDGET", "0.1"))
+
+# a replica's breaker opens after this many failures in a row and lets one trial through after the reset
+ML_BREAKER_FAILURES = int(os.getenv("ML_BREAKER_FAILURES", "5"))
+ML_BREAKER_RESET_S = float(os.getenv("ML_BREAKER_RESET_S", "10"))
+
+# with several replicas, each one's /readyz is polled this often; 0 disables it
+ML_HEALTH_INTERVAL_S = float(os.getenv("ML_HEALTH_INTERVAL_S", "5"))
+
+# hedge timing needs this many recent latencies before "auto" starts hedging
+HEDGE_MIN_SAMPLES = 20
+
+# answers that say the replica (or the proxy in front of it) is broken, not the request
+#   -> counted against its breaker and retried; any other status goes back to the caller,
+#   -> e.g. a 503 for a model that isn't trained would fail the same way everywhere
+REPLICA_FAILURE_STATUSES = frozenset({502, 504})
+
+ML_ATTEMPTS = Counter(
+    "api_ml_attempts_total", "Requests sent to ml-service replicas", ["replica", "outcome"]
+)
+ML_ATTEMPT_LATENCY = Histogram(
+    "api_ml_attempt_duration_seconds", "Latency of ml-service requests that got an answer", ["replica"]
+)
+ML_FAST_FAILS = Counter(
+    "api_ml_fast_fail_total", "ml-service calls failed without sending anything", ["reason"]
+)
+ML_RETRIES_SENT = Counter("api_ml_retries_total", "ml-service calls retried after a failed attempt")
+ML_HEDGES = Counter("api_ml_hedges_total", "Hedged ml-service requests", ["outcome"])
+ML_BREAKER_STATE = Gauge(
+    "api_ml_breaker_state", "Circuit breaker per replica: 0 closed, 1 half-open, 2 open", ["replica"]
+)
+ML_BREAKER_TRANSITIONS = Counter(
+    "api_ml_breaker_transitions_total", "Circuit breaker state changes", ["replica", "from_state", "to_state"]
+)
+ML_REPLICA_READY = Gauge(
+    "api_ml_replica_ready", "Last /readyz answer per replica: 1 ready, 0 not, -1 unknown", ["replica"]
+)
+
+
+class MLServiceError(Exception):
+    """A call that got no usable answer; retry_after is set when waiting would help."""
+
+    def __init__(self, detail: str, retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Deadline:
+    def __init__(self, seconds: float = ML_DEADLINE_S):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failures: int = ML_BREAKER_FAILURES, reset_s: float = ML_BREAKER_RESET_S):
+        self.name = name
+        self.threshold = failures
+        self.reset_s = reset_s
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial = False
+        ML_BREAKER_STATE.labels(replica=name).set(0)
+
+    def _move(self, state: str) -> None:
+        if state == self.state:
+            return
+        ML_BREAKER_TRANSITIONS.labels(replica=self.name, from_state=self.state, to_state=state).inc()
+        ML_BREAKER_STATE.labels(replica=self.name).set(self._GAUGE[state])
+        logger.warning("ml-service %s circuit %s -> %s", self.name, self.state, state)
+        self.state = state
+
+    def available(self) -> bool:
+        """Would a request be let through right now (without claiming the half-open trial)."""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_s
+        return not (self.state == self.HALF_OPEN and self.trial)
+
+    def acquire(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_s:
+                return False
+            self._move(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self.trial:
+                return False
+            self.trial = True
+        return True
+
+    def release(self) -> None:
+        # an attempt that was cancelled (lost a hedge race) says nothing about the replica
+        self.trial = False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.trial = False
+        self._move(self.CLOSED)
+
+    def failure(self) -> None:
+        self.failures += 1
+        self.trial = False
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self._move(self.OPEN)
+
+    def retry_after(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_s - (time.monotonic() - self.opened_at))
+
+
+class Replica:
+    def __init__(self, base: str, breaker: CircuitBreaker):
+        self.base = base
+        self.breaker = breaker
+        self.ready: Optional[bool] = None
+        self.ewma_s: Optional[float] = None
+        self.in_flight = 0
+        ML_REPLICA_READY.labels(replica=base).set(-1)
+
+    def observe(self, seconds: float) -> None:
+        self.ewma_s = seconds if self.ewma_s is None else 0.8 * self.ewma_s + 0.2 * seconds
+
+    def load(self) -> float:
+        # expected wait: recent latency, scaled by the requests already queued on it
+        #   -> a replica with no history scores 0, so new replicas get tried
+        return (self.ewma_s or 0.0) * (1 + self.in_flight)
+
+    def describe(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "ready": self.ready,
+            "in_flight": self.in_flight,
+            "latency_ms": round(self.ewma_s * 1000, 1) if self.ewma_s is not None else None,
+        }
+
+
+class _AttemptFailed(Exception):
+    pass
+
+
+class MLClient:
+    """
+    Shared async client for ml-service calls.
+
+    Each call picks a replica (the less loaded of two random healthy ones),
+    skips replicas whose circuit is open or whose /readyz says not ready, and
+    retries a failed attempt on another replica while its deadline allows.
+    An attempt slower than the route's recent p95 gets a hedged copy on a
+    second replica (never the same one); whichever answers first wins and the
+    other is cancelled. Hedges and retries share a budget so an overloaded
+    service is not handed twice the traffic. Only timeouts, transport errors,
+    502 and 504 count as a replica failing; every other response is returned
+    as it is, including the ml-service's 503 for a model that isn't trained.
+    """
+
+    def __init__(
+        self,
+        replicas: Optional[List[str]] = None,
+        timeout_s: float = ML_REQUEST_TIMEOUT_S,
+        retries: int = ML_RETRIES,
+        hedge_after: str = ML_HEDGE_AFTER,
+        retry_budget: float = ML_RETRY_BUDGET,
+        breaker_failures: int = ML_BREAKER_FAILURES,
+        breaker_reset_s: float = ML_BREAKER_RESET_S,
+        health_interval_s: float = ML_HEALTH_INTERVAL_S,
+    ):
+        self.bases = list(ML_SERVICE_REPLICAS if replicas is None else replicas)
+        self.timeout_s = timeout_s
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self.retry_budget = retry_budget
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_s = breaker_reset_s
+        self.health_interval_s = health_interval_s
+        self.replicas: Dict[str, Replica] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        # starts full; every call adds retry_budget, every hedge or retry spends 1
+        self._budget = 10.0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._health_task: Optional[asyncio.Task] = None
+        for base in self.bases:
+            self._replica(base)
+
+    # -- plumbing ----------------------------------------------------------------
+
+    def _http(self) -> httpx.AsyncClient:
+        # one pooled client per event loop, so calls reuse connections instead of reconnecting
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(timeout=self.timeout_s)
+            self._loop = loop
+            self._health_task = None
+        if self._health_task is None and self.health_interval_s > 0 and len(self.replicas) > 1:
+            self._health_task = loop.create_task(self._poll_health())
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _replica(self, base: str) -> Replica:
+        replica = self.replicas.get(base)
+        if replica is None:
+            breaker = CircuitBreaker(base, self.breaker_failures, self.breaker_reset_s)
+            replica = self.replicas[base] = Replica(base, breaker)
+        return replica
+
+    def _route(self, url: str) -> Tuple[List[Replica], str]:
+        parts = urlsplit(url)
+        path = urlunsplit(("", "", parts.path, parts.query, ""))
+        bases = self.bases or [f"{parts.scheme}://{parts.netloc}"]
+        return [self._replica(b) for b in bases], path
+
+    async def _poll_health(self) -> None:
+        while True:
+            for replica in list(self.replicas.values()):
+                try:
+                    resp = await self._client.get(f"{replica.base}/readyz", timeout=min(2.0, self.timeout_s))
+                    ready = resp.status_code == 200
+                except httpx.HTTPError:
+                    ready = False
+                if ready != replica.ready:
+                    logger.info("ml-service %s ready=%s", replica.base, ready)
+                replica.ready = ready
+                ML_REPLICA_READY.labels(replica=replica.base).set(1 if ready else 0)
+            await asyncio.sleep(self.health_interval_s)
+
+    # -- routing -----------------------------------------------------------------
+
+    def _pick(self, replicas: List[Replica], exclude: Set[str]) -> Optional[Replica]:
+        candidates = [r for r in replicas if r.base not in exclude and r.breaker.available()]
+        # replicas that said they're not ready only get traffic when nothing else is left
+        candidates = [r for r in candidates if r.ready is not False] or candidates
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        a, b = random.sample(candidates, 2)
+        return a if a.load() <= b.load() else b
+
+    def _claim(self, replicas: List[Replica], exclude: Set[str]) -> Optional[Replica]:
+        """Pick a replica and claim a slot on its breaker; None when no replica lets a request through."""
+        exclude = set(exclude)
+        while True:
+            replica = self._pick(replicas, exclude)
+            if replica is None or replica.breaker.acquire():
+                return replica
+            exclude.add(replica.base)
+
+    def _hedge_delay(self, path: str) -> Optional[float]:
+        if self.hedge_after == "off":
+            return None
+        if self.hedge_after != "auto":
+            return float(self.hedge_after)
+        samples = self._latencies.get(path)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return max(0.01, ordered[int(0.95 * (len(ordered) - 1))])
+
+    def _spend_budget(self) -> bool:
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        return True
+
+    # -- calls -------------------------------------------------------------------
+
+    async def _attempt(self, replica: Replica, path: str, timeout: float, kwargs: dict) -> httpx.Response:
+        replica.in_flight += 1
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(timeout):
+                resp = await self._http().post(replica.base + path, **kwargs)
+        except asyncio.CancelledError:
+            replica.breaker.release()
+            ML_ATTEMPTS.labels(replica=replica.base, outcome="cancelled").inc()
+            raise
+        except (TimeoutError, httpx.TimeoutException) as exc:
+            replica.breaker.failure()
+            ML_ATTEMPTS.labels(replica=replica.base, outcome="timeout").inc()
+            raise _AttemptFailed(f"{replica.base} timed out after {timeout:.1f}s") from exc
+        except httpx.RequestError as exc:
+            replica.breaker.failure()
+            ML_ATTEMPTS.labels(replica=replica.base, outcome="connect_error").inc()
+            raise _AttemptFailed(f"{replica.base} request failed: {exc}") from exc
+        finally:
+            replica.in_flight -= 1
+
+        elapsed = time.perf_counter() - start
+        if resp.status_code in REPLICA_FAILURE_STATUSES:
+            replica.breaker.failure()
+            ML_ATTEMPTS.labels(replica=replica.base, outcome="server_error").inc()
+            raise _AttemptFailed(f"ML service error {resp.status_code}: {resp.text}")
+        replica.breaker.success()
+        replica.observe(elapsed)
+        ML_ATTEMPTS.labels(replica=replica.base, outcome="ok" if resp.status_code < 500 else "model_error").inc()
+        ML_ATTEMPT_LATENCY.labels(replica=replica.base).observe(elapsed)
+        self._latencies.setdefault(path.split("?")[0], deque(maxlen=200)).append(elapsed)
+        return resp
+
+    def _launch(self, replica: Replica, path: str, deadline: Deadline, kwargs: dict) -> asyncio.Task:
+        # replica came from _claim, which already took its breaker slot
+        timeout = min(self.timeout_s, deadline.remaining())
+        return asyncio.ensure_future(self._attempt(replica, path, timeout, kwargs))
+
+    async def _hedged(
+        self, replicas: List[Replica], path: str, deadline: Deadline, tried: Set[str], kwargs: dict
+    ) -> httpx.Response:
+        first = self._claim(replicas, tried) or self._claim(replicas, set())
+        if first is None:
+            retry_after = min(r.breaker.retry_after() for r in replicas)
+            ML_FAST_FAILS.labels(reason="circuit_open").inc()
+            raise MLServiceError("ML service unavailable: circuit open", retry_after=retry_after)
+        tried.add(first.base)
+        primary = self._launch(first, path, deadline, kwargs)
+        pending = {primary}
+        errors: List[str] = []
+        try:
+            delay = self._hedge_delay(path.split("?")[0])
+            if delay is not None and delay < deadline.remaining():
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    # only another replica: a copy on the slow one just adds to its queue
+                    second = self._claim(replicas, tried) if self._budget >= 1 else None
+                    if second is not None:
+                        self._spend_budget()
+                        tried.add(second.base)
+                        pending.add(self._launch(second, path, deadline, kwargs))
+                        ML_HEDGES.labels(outcome="sent").inc()
+                    else:
+                        ML_HEDGES.labels(outcome="skipped").inc()
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    exc = task.exception()
+                    if exc is None:
+                        if task is not primary:
+                            ML_HEDGES.labels(outcome="won").inc()
+                        return task.result()
+                    errors.append(str(exc))
+            raise _AttemptFailed("; ".join(errors))
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def post(self, url: str, deadline: Optional[Deadline] = None, **kwargs) -> httpx.Response:
+        """POST to url's path on a healthy replica; raises MLServiceError when no answer fits the deadline."""
+        deadline = deadline or Deadline()
+        self._http()
+        replicas, path = self._route(url)
+        self._budget = min(10.0, self._budget + self.retry_budget)
+        tried: Set[str] = set()
+        errors: List[str] = []
+        for attempt in range(self.retries + 1):
+            if attempt:
+                if not self._spend_budget():
+                    break
+                ML_RETRIES_SENT.inc()
+                # a little jitter so callers that failed together don't retry together
+                await asyncio.sleep(min(deadline.remaining(), random.uniform(0.02, 0.1) * attempt))
+            if deadline.expired:
+                ML_FAST_FAILS.labels(reason="deadline").inc()
+                errors.append("deadline exceeded")
+                break
+            try:
+                return await self._hedged(replicas, path, deadline, tried, kwargs)
+            except _AttemptFailed as exc:
+                errors.append(str(exc))
+        raise MLServiceError(f"ML service request failed: {'; '.join(errors)}")
+
+    def describe(self) -> Dict[str, dict]:
+        return {base: replica.describe() for base, replica in self.replicas.items()}
@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from itertools import islice, repeat
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from run_summary import ScoredColumns
+
+# SQLite file holding every scored run; empty disables the history
+RUN_HISTORY_PATH = os.getenv("RUN_HISTORY_PATH", str(Path(__file__).resolve().parent / "history" / "runs.sqlite3"))
+# rows per executemany; one transaction per run append, however large
+RUN_HISTORY_INSERT_ROWS = int(os.getenv("RUN_HISTORY_INSERT_ROWS", "50000"))
+# runs older than this are deleted whenever a run finishes, 0 keeps everything
+RUN_HISTORY_RETENTION_DAYS = float(os.getenv("RUN_HISTORY_RETENTION_DAYS", "30"))
+
+PAGE_MAX = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    attack TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_ns INTEGER NOT NULL,
+    finished_ns INTEGER,
+    rows INTEGER NOT NULL DEFAULT 0,
+    detected INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    model_version TEXT,
+    summary TEXT,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created_ns, run_id);
+CREATE INDEX IF NOT EXISTS runs_attack_created ON runs (attack, created_ns, run_id);
+
+-- clustered by (run, row): a run's predictions are one contiguous range of the table
+--   -> run is runs.id, so every row and index entry carries an integer, not the 32-char run_id
+CREATE TABLE IF NOT EXISTS predictions (
+    run INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    ts_ns INTEGER,
+    port INTEGER,
+    source TEXT,
+    state TEXT,
+    label INTEGER NOT NULL,
+    confidence REAL,
+    error TEXT,
+    PRIMARY KEY (run, row)
+) WITHOUT ROWID;
+-- secondary indexes of a WITHOUT ROWID table carry the key, so this also orders by (ts_ns, run, row)
+CREATE INDEX IF NOT EXISTS predictions_ts ON predictions (ts_ns);
+"""
+
+RUN_COLUMNS = (
+    "run_id", "kind", "attack", "status", "created_ns", "finished_ns",
+    "rows", "detected", "failed", "model_version", "summary", "meta",
+)
+PREDICTION_COLUMNS = ("run", "row", "ts_ns", "port", "source", "state", "label", "confidence", "error")
+# what the read endpoints return per prediction, run being swapped for the public run_id
+PREDICTION_FIELDS = ("run_id",) + PREDICTION_COLUMNS[1:]
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(values: Sequence) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as exc:
+        raise CursorError(f"invalid cursor: {exc}") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise CursorError("invalid cursor")
+    return values
+
+
+def _column(values: Optional[Sequence], n: int, cast=None) -> list:
+    if values is None:
+        return [None] * n
+    out = np.asarray(values).tolist() if cast is None else [cast(v) for v in values]
+    if len(out) != n:
+        raise ValueError(f"column has {len(out)} values, expected {n}")
+    return out
+
+
+class RunHistory:
+    """
+    Scored runs and their per-row predictions in one local SQLite file (WAL mode).
+
+    Writes go through one connection behind a lock, in a worker thread, with
+    the rows of an append bulk-inserted in RUN_HISTORY_INSERT_ROWS batches in a
+    single transaction. Reads open their own connection and page with keyset
+    cursors, so page N costs the same as page 1.
+    """
+
+    def __init__(
+        self,
+        path: str = RUN_HISTORY_PATH,
+        insert_rows: int = RUN_HISTORY_INSERT_ROWS,
+        retention_days: float = RUN_HISTORY_RETENTION_DAYS,
+    ):
+        self.path = Path(path)
+        self.insert_rows = insert_rows
+        self.retention_days = retention_days
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        self._keys: Dict[str, int] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: a power cut may lose the last commits, never corrupt the file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # -- writes ------------------------------------------------------------------
+
+    def start_run(self, kind: str, attack: str, meta: Optional[dict] = None) -> str:
+        run_id = uuid.uuid4().hex
+        now = time.time_ns()
+        with self._lock:
+            cur = self._writer.execute(
+                "INSERT INTO runs (run_id, kind, attack, status, created_ns, meta) VALUES (?, ?, ?, 'writing', ?, ?)",
+                (run_id, kind, attack, now, json.dumps(meta or {})),
+            )
+            self._keys[run_id] = cur.lastrowid
+        return run_id
+
+    def append(
+        self,
+        run_id: str,
+        start_row: int,
+        scored: ScoredColumns,
+        timestamps_ns: Optional[Sequence[int]] = None,
+        ports: Optional[Sequence[int]] = None,
+        sources: Optional[Sequence[str]] = None,
+        states: Optional[Sequence[str]] = None,
+    ) -> int:
+        """Insert one batch of verdicts (rows start_row.. of the run); returns the rows written."""
+        n = int(scored.labels.size)
+        if n == 0:
+            return 0
+        errors: List[Optional[str]] = [None] * n
+        for start, end, detail in scored.errors:
+            errors[start:end] = [detail] * (min(end, n) - start)
+        columns = (
+            repeat(self._keys[run_id]),
+            range(start_row, start_row + n),
+            _column(timestamps_ns, n),
+            _column(ports, n),
+            _column(sources, n, cast=str),
+            _column(states, n, cast=str),
+            scored.labels.tolist(),
+            # NaN (unscored) is stored as NULL
+            scored.confidence.tolist(),
+            errors,
+        )
+        rows = zip(*columns)
+        sql = f"INSERT OR REPLACE INTO predictions VALUES ({', '.join('?' * len(PREDICTION_COLUMNS))})"
+        with self._lock:
+            self._writer.execute("BEGIN")
+            try:
+                for _ in range(0, n, self.insert_rows):
+                    self._writer.executemany(sql, list(islice(rows, self.insert_rows)))
+                self._writer.execute(
+                    "UPDATE runs SET rows = rows + ?, detected = detected + ?, failed = failed + ? WHERE run_id = ?",
+                    (n, int((scored.labels == 1).sum()), int((scored.labels < 0).sum()), run_id),
+                )
+                self._writer.execute("COMMIT")
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+                raise
+        return n
+
+    def finish(
+        self,
+        run_id: str,
+        summary: Optional[dict] = None,
+        model_version: Optional[str] = None,
+        status: str = "complete",
+    ) -> None:
+        with self._lock:
+            self._writer.execute(
+                "UPDATE runs SET status = ?, finished_ns = ?, summary = ?, model_version = ? WHERE run_id = ?",
+                (status, time.time_ns(), json.dumps(summary) if summary is not None else None, model_version, run_id),
+            )
+            self._keys.pop(run_id, None)
+        self.prune()
+
+    def prune(self) -> int:
+        if self.retention_days <= 0:
+            return 0
+        cutoff = time.time_ns() - int(self.retention_days * 86400 * 1e9)
+        with self._lock:
+            old = [r[0] for r in self._writer.execute("SELECT id FROM runs WHERE created_ns < ?", (cutoff,))]
+            for key in old:
+                self._writer.execute("BEGIN")
+                self._writer.execute("DELETE FROM predictions WHERE run = ?", (key,))
+                self._writer.execute("DELETE FROM runs WHERE id = ?", (key,))
+                self._writer.execute("COMMIT")
+        return len(old)
+
+    # -- reads -------------------------------------------------------------------
+
+    def _query(self, sql: str, params: Sequence) -> List[tuple]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _run(row: tuple) -> dict:
+        run = dict(zip(RUN_COLUMNS, row))
+        run["summary"] = json.loads(run["summary"]) if run["summary"] else None
+        run["meta"] = json.loads(run["meta"]) if run["meta"] else {}
+        return run
+
+    def get_run(self, run_id: str) -> Optional[dict]:
+        rows = self._query(f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE run_id = ?", (run_id,))
+        return self._run(rows[0]) if rows else None
+
+    def list_runs(
+        self,
+        attack: Optional[str] = None,
+        since_ns: Optional[int] = None,
+        until_ns: Optional[int] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> dict:
+        """Newest first; the summaries stay out of the listing (GET the run for those)."""
+        where, params = [], []
+        if attack:
+            where.append("attack = ?")
+            params.append(attack)
+        if since_ns is not None:
+            where.append("created_ns >= ?")
+            params.append(since_ns)
+        if until_ns is not None:
+            where.append("created_ns < ?")
+            params.append(until_ns)
+        if cursor:
+            where.append("(created_ns, run_id) < (?, ?)")
+            params.extend(decode_cursor(cursor, 2))
+        limit = max(1, min(limit, PAGE_MAX))
+        columns = [c for c in RUN_COLUMNS if c != "summary"]
+        rows = self._query(
+            f"SELECT {', '.join(columns)} FROM runs"
+            f"{' WHERE ' + ' AND '.join(where) if where else ''}"
+            " ORDER BY created_ns DESC, run_id DESC LIMIT ?",
+            [*params, limit + 1],
+        )
+        runs = [dict(zip(columns, r), meta=json.loads(r[-1] or "{}")) for r in rows[:limit]]
+        more = len(rows) > limit
+        return {
+            "runs": runs,
+            "next_cursor": encode_cursor([runs[-1]["created_ns"], runs[-1]["run_id"]]) if more else None,
+        }
+
+    def run_predictions(
+        self, run_id: str, limit: int = 500, cursor: Optional[str] = None, detected_only: bool = False
+    ) -> dict:
+        """One run's predictions in row order."""
+        after = decode_cursor(cursor, 1)[0] if cursor else -1
+        limit = max(1, min(limit, PAGE_MAX))
+        rows = self._query(
+            f"SELECT r.run_id, {', '.join('p.' + c for c in PREDICTION_COLUMNS[1:])}"
+            " FROM runs r JOIN predictions p ON p.run = r.id WHERE r.run_id = ? AND p.row > ?"
+            f"{' AND p.label = 1' if detected_only else ''} ORDER BY p.row LIMIT ?",
+            (run_id, after, limit + 1),
+        )
+        items = [dict(zip(PREDICTION_FIELDS, r)) for r in rows[:limit]]
+        more = len(rows) > limit
+        return {"predictions": items, "next_cursor": encode_cursor([items[-1]["row"]]) if more else None}
+
+    def predictions_between(
+        self,
+        since_ns: int,
+        until_ns: int,
+        attack: Optional[str] = None,
+        limit: int = 500,
+        cursor: Optional[str] = None,
+        detected_only: bool = False,
+    ) -> dict:
+        """Predictions of every run whose row timestamp falls in [since, until), in time order."""
+        where = ["p.ts_ns >= ?", "p.ts_ns < ?"]
+        params: list = [since_ns, until_ns]
+        if cursor:
+            where.append("(p.ts_ns, p.run, p.row) > (?, ?, ?)")
+            params.extend(decode_cursor(cursor, 3))
+        if detected_only:
+            where.append("p.label = 1")
+        if attack:
+            where.append("r.attack = ?")
+            params.append(attack)
+        limit = max(1, min(limit, PAGE_MAX))
+        rows = self._query(
+            f"SELECT r.run_id, {', '.join('p.' + c for c in PREDICTION_COLUMNS[1:])}, p.run"
+            " FROM predictions p INDEXED BY predictions_ts JOIN runs r ON r.id = p.run"
+            f" WHERE {' AND '.join(where)} ORDER BY p.ts_ns, p.run, p.row LIMIT ?",
+            [*params, limit + 1],
+        )
+        items = [dict(zip(PREDICTION_FIELDS, r[:-1])) for r in rows[:limit]]
+        more = len(rows) > limit
+        last = rows[limit - 1] if more else None
+        return {
+            "predictions": items,
+            "next_cursor": encode_cursor([last[2], last[-1], last[1]]) if more else None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._writer.close()
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    # bulk insert throughput and page latency for one big run
+    #   -> python run_history.py 1000000
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(3)
+    confidence = rng.uniform(0, 1, n)
+    scored = ScoredColumns((confidence > 0.5).astype(np.int8), confidence)
+    ts = 1_700_000_000 * 10**9 + np.sort(rng.integers(0, 3600 * 10**9, n))
+    ports = rng.integers(0, 65536, n)
+    states = rng.choice(["open", "closed", "filtered"], n)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = RunHistory(str(Path(tmp) / "bench.sqlite3"), retention_days=0)
+        run_id = history.start_run("benchmark", "port_probing")
+        start = time.perf_counter()
+        history.append(run_id, 0, scored, timestamps_ns=ts, ports=ports, sources=["10.0.0.1"] * n, states=states)
+        history.finish(run_id)
+        elapsed = time.perf_counter() - start
+        size = (Path(tmp) / "bench.sqlite3").stat().st_size + (Path(tmp) / "bench.sqlite3-wal").stat().st_size
+        print(f"insert {n} rows: {elapsed:.2f}s ({n / elapsed:,.0f} rows/s), {size / 1e6:.1f} MB")
+
+        page = history.run_predictions(run_id, limit=500)
+        start = time.perf_counter()
+        for _ in range(100):
+            page = history.run_predictions(run_id, limit=500, cursor=page["next_cursor"])
+        print(f"per-run page (500 rows): {(time.perf_counter() - start) * 10:.2f} ms")
+        mid = int(ts[n // 2])
+        start = time.perf_counter()
+        window = history.predictions_between(mid, mid + 10**9, limit=500)
+        print(f"time-range page (500 rows): {(time.perf_counter() - start) * 1000:.2f} ms")
+        history.close()
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# equal-width confidence bins over [0, 1]
+CONFIDENCE_BINS = int(os.getenv("SUMMARY_CONFIDENCE_BINS", "10"))
+# breakdowns list the most frequent keys, the rest are folded into "other"
+SUMMARY_TOP_KEYS = int(os.getenv("SUMMARY_TOP_KEYS", "20"))
+# timelines pick the smallest of these bucket widths that needs no more than SUMMARY_TIMELINE_BUCKETS buckets
+SUMMARY_TIMELINE_BUCKETS = int(os.getenv("SUMMARY_TIMELINE_BUCKETS", "60"))
+BUCKET_WIDTHS_S = (0.001, 0.01, 0.1, 1, 5, 10, 30, 60, 300, 900, 3600, 21600, 86400)
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+# IANA port ranges, for a breakdown that stays small however many ports a scan covers
+PORT_RANGES = (("well_known", 0, 1023), ("registered", 1024, 49151), ("dynamic", 49152, 65535))
+
+
+@dataclass
+class ScoredColumns:
+    """ML verdicts for a columnar batch, one slot per row, in row order."""
+
+    labels: np.ndarray  # int8: 1 detected, 0 not, -1 the request for that row failed
+    confidence: np.ndarray  # float64, NaN where not scored
+    errors: List[Tuple[int, int, str]] = field(default_factory=list)  # failed [start, end) row ranges
+    model_version: Optional[str] = None
+
+    @classmethod
+    def empty(cls, n: int) -> "ScoredColumns":
+        return cls(np.full(n, -1, dtype=np.int8), np.full(n, np.nan))
+
+    def rows(self, inputs: Sequence[dict], label_key: str) -> List[dict]:
+        """The per-row results the endpoints have always returned."""
+        results: List[dict] = [
+            {"input": r, "ml": {label_key: bool(label), "confidence": float(conf)}}
+            for r, label, conf in zip(inputs, self.labels.tolist(), self.confidence.tolist())
+        ]
+        for start, end, detail in self.errors:
+            for i in range(start, min(end, len(results))):
+                results[i] = {"input": inputs[i], "error": detail}
+        return results
+
+
+def _rounded(value: float, digits: int = 4) -> Optional[float]:
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+
+def _breakdown(keys: np.ndarray, detected: np.ndarray, confidence: np.ndarray, top: int) -> List[dict]:
+    """Rows, detections and mean confidence per key, most frequent keys first."""
+    if keys.size == 0:
+        return []
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    rows = np.bincount(inverse, minlength=uniq.size)
+    hits = np.bincount(inverse, weights=detected, minlength=uniq.size)
+    conf = np.bincount(inverse, weights=confidence, minlength=uniq.size)
+    order = np.argsort(-rows, kind="stable")
+    out = [
+        {
+            "key": uniq[i].item(),
+            "rows": int(rows[i]),
+            "detected": int(hits[i]),
+            "detection_rate": _rounded(hits[i] / rows[i]),
+            "mean_confidence": _rounded(conf[i] / rows[i]),
+        }
+        for i in order[:top]
+    ]
+    rest = order[top:]
+    if rest.size:
+        n, d = int(rows[rest].sum()), float(hits[rest].sum())
+        out.append(
+            {
+                "key": "other",
+                "keys": int(rest.size),
+                "rows": n,
+                "detected": int(d),
+                "detection_rate": _rounded(d / n),
+                "mean_confidence": _rounded(conf[rest].sum() / n),
+            }
+        )
+    return out
+
+
+def _timeline(timestamps_ns: np.ndarray, detected: np.ndarray, confidence: np.ndarray, buckets: int) -> dict:
+    start, end = int(timestamps_ns.min()), int(timestamps_ns.max())
+    span_s = (end - start) / 1e9
+    width = next((w for w in BUCKET_WIDTHS_S if span_s / w < buckets), BUCKET_WIDTHS_S[-1])
+    index = ((timestamps_ns - start) // int(width * 1e9)).astype(np.int64)
+    count = int(index.max()) + 1
+    rows = np.bincount(index, minlength=count)
+    hits = np.bincount(index, weights=detected, minlength=count)
+    conf = np.bincount(index, weights=confidence, minlength=count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_conf = np.where(rows > 0, conf / np.maximum(rows, 1), np.nan)
+    return {
+        "start_ns": start,
+        "bucket_s": width,
+        "rows": rows.tolist(),
+        "detected": hits.astype(np.int64).tolist(),
+        "mean_confidence": [_rounded(c) for c in mean_conf.tolist()],
+    }
+
+
+def summarize(
+    scored: ScoredColumns,
+    ports: Optional[np.ndarray] = None,
+    groups: Optional[Dict[str, np.ndarray]] = None,
+    timestamps_ns: Optional[np.ndarray] = None,
+    top: int = SUMMARY_TOP_KEYS,
+    timeline_buckets: int = SUMMARY_TIMELINE_BUCKETS,
+) -> dict:
+    """
+    Aggregates of one run, computed on the verdict columns in a single pass each.
+    ports, every array in groups and timestamps_ns are aligned with the rows;
+    rows whose request failed are counted under "failed" and left out of the rest.
+    """
+    ok = scored.labels >= 0
+    total = int(scored.labels.size)
+    n = int(ok.sum())
+    detected = (scored.labels[ok] == 1).astype(np.float64)
+    confidence = scored.confidence[ok].astype(np.float64)
+    hits = int(detected.sum())
+
+    summary: dict = {
+        "rows": total,
+        "scored": n,
+        "failed": total - n,
+        "detected": hits,
+        "detection_rate": _rounded(hits / n) if n else None,
+    }
+
+    edges = np.linspace(0.0, 1.0, CONFIDENCE_BINS + 1)
+    bins = np.clip(np.searchsorted(edges, confidence, side="right") - 1, 0, CONFIDENCE_BINS - 1)
+    summary["confidence"] = {
+        "mean": _rounded(confidence.mean()) if n else None,
+        "min": _rounded(confidence.min()) if n else None,
+        "max": _rounded(confidence.max()) if n else None,
+        "quantiles": (
+            {f"p{int(q * 100)}": _rounded(v) for q, v in zip(QUANTILES, np.quantile(confidence, QUANTILES))}
+            if n
+            else {}
+        ),
+        "histogram": {
+            "edges": [round(float(e), 4) for e in edges],
+            "rows": np.bincount(bins, minlength=CONFIDENCE_BINS).tolist(),
+            "detected": np.bincount(bins, weights=detected, minlength=CONFIDENCE_BINS).astype(np.int64).tolist(),
+        },
+    }
+
+    if ports is not None:
+        p = np.asarray(ports, dtype=np.int64)[ok]
+        summary["by_port"] = _breakdown(p, detected, confidence, top)
+        names = np.array([name for name, _, _ in PORT_RANGES])
+        range_index = np.searchsorted(np.array([lo for _, lo, _ in PORT_RANGES]), p, side="right") - 1
+        summary["by_port_range"] = _breakdown(names[np.clip(range_index, 0, len(names) - 1)], detected, confidence, len(names))
+    for name, values in (groups or {}).items():
+        summary[f"by_{name}"] = _breakdown(np.asarray(values).astype(str)[ok], detected, confidence, top)
+    if timestamps_ns is not None and n:
+        summary["timeline"] = _timeline(np.asarray(timestamps_ns, dtype=np.int64)[ok], detected, confidence, timeline_buckets)
+    return summary
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    import time
+
+    # summary cost vs. building and serializing per-row results
+    #   -> python run_summary.py 200000
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = np.random.default_rng(7)
+    ports = rng.integers(0, 65536, n)
+    states = rng.choice(["open", "closed", "filtered"], n)
+    timestamps = np.sort(rng.integers(0, 120 * 10**9, n)) + 1_700_000_000 * 10**9
+    confidence = rng.uniform(0, 1, n)
+    scored = ScoredColumns((confidence > 0.5).astype(np.int8), confidence)
+    inputs = [{"port": int(p), "state": s} for p, s in zip(ports.tolist(), states.tolist())]
+
+    start = time.perf_counter()
+    summary = summarize(scored, ports=ports, groups={"state": states}, timestamps_ns=timestamps)
+    summary_s = time.perf_counter() - start
+    summary_bytes = len(json.dumps(summary))
+
+    start = time.perf_counter()
+    rows_bytes = len(json.dumps(scored.rows(inputs, "is_port_probe")))
+    rows_s = time.perf_counter() - start
+
+    print(f"{n} rows")
+    print(f"summary:  {summary_s * 1000:8.1f} ms {summary_bytes:>12,} bytes")
+    print(f"per-row:  {rows_s * 1000:8.1f} ms {rows_bytes:>12,} bytes")
@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("api")
+
+# inclusive (first, last) port range
+PortRange = Tuple[int, int]
+
+# called with a running scan's progress fields (ports_done=..., ports_total=..., ...)
+ProgressFn = Callable[..., None]
+
+# every payload gets a <stem>.meta sidecar listing the targets and port ranges it holds
+#   -> lookups read the sidecars, never the payloads; the suffix keeps them out of "*.json" globs
+SIDECAR_SUFFIX = ".meta"
+
+# bump when the sidecar layout changes so old sidecars get rebuilt
+INDEX_VERSION = 1
+
+
+def to_ranges(ports: Iterable[int]) -> List[PortRange]:
+    """Collapse ports into sorted, merged inclusive ranges."""
+    ranges: List[PortRange] = []
+    for port in sorted(set(int(p) for p in ports)):
+        if ranges and port <= ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], port)
+        else:
+            ranges.append((port, port))
+    return ranges
+
+
+def subtract(needed: Iterable[PortRange], covered: Iterable[PortRange]) -> List[PortRange]:
+    """The parts of needed that no covered range includes."""
+    gaps = list(needed)
+    for c_start, c_end in covered:
+        remaining = []
+        for start, end in gaps:
+            if c_end < start or c_start > end:
+                remaining.append((start, end))
+                continue
+            if start < c_start:
+                remaining.append((start, c_start - 1))
+            if end > c_end:
+                remaining.append((c_end + 1, end))
+        gaps = remaining
+    return gaps
+
+
+def _overlaps(a: PortRange, ranges: Iterable[PortRange]) -> bool:
+    return any(a[0] <= end and start <= a[1] for start, end in ranges)
+
+
+@dataclass
+class ScanEntry:
+    path: Path
+    created_at: float
+    targets: Dict[str, List[PortRange]]
+
+    def ranges(self, target: str) -> List[PortRange]:
+        return self.targets.get(target, [])
+
+
+@dataclass
+class ScanResult:
+    rows: List[dict]
+    paths: List[Path]
+    reused: List[PortRange] = field(default_factory=list)
+    scanned: List[PortRange] = field(default_factory=list)
+    # the part of scanned this request's own scans covered; joined scans belong to whoever started them
+    started: List[PortRange] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def source(self) -> str:
+        if not self.scanned:
+            return "cached"
+        return "merged" if self.reused else "generated"
+
+
+class ScanCache:
+    """
+    Port scan payloads indexed by target and port range.
+
+    A request for target T, ports a..b reuses every indexed payload fresher
+    than max_age that covers part of that range, runs the scanner only for the
+    ports still missing, and merges the rows, newest scan first per port.
+    Scans already running for the same target are joined instead of repeated,
+    so concurrent identical requests share one simulation run. A running scan's
+    progress goes to every request waiting on it, not just the one that started it.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        run: Callable[[str, int, int, Path, ProgressFn], Awaitable[object]],
+        prefix: str = "port_probe",
+    ):
+        self.directory = Path(directory)
+        self.run = run
+        self.prefix = prefix
+        self._entries: Dict[Path, Tuple[Tuple[int, int], ScanEntry]] = {}
+        self._inflight: Dict[Tuple[str, int, int], asyncio.Task] = {}
+        self._watchers: Dict[Tuple[str, int, int], List[ProgressFn]] = {}
+
+    # -- index -------------------------------------------------------------------
+
+    def entry(self, path: Path) -> Optional[ScanEntry]:
+        """Index entry for one payload file: from memory, its sidecar, or (once) its contents."""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._entries.pop(path, None)
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._entries.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        sidecar = path.with_suffix(SIDECAR_SUFFIX)
+        meta = None
+        try:
+            with sidecar.open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != INDEX_VERSION or [meta.get("mtime_ns"), meta.get("size")] != list(stamp):
+                meta = None
+        except (OSError, ValueError):
+            meta = None
+
+        if meta is None:
+            # payloads written before the index existed (or by hand) are indexed on first sight
+            try:
+                rows = self._read_rows(path)
+            except (OSError, ValueError) as exc:
+                logger.warning("skipping unreadable scan payload %s: %s", path, exc)
+                return None
+            ports: Dict[str, List[int]] = {}
+            for row in rows:
+                try:
+                    ports.setdefault(str(row["target"]), []).append(int(row["port"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+            meta = {
+                "version": INDEX_VERSION,
+                "mtime_ns": stamp[0],
+                "size": stamp[1],
+                "rows": len(rows),
+                "targets": {t: to_ranges(p) for t, p in ports.items()},
+            }
+            try:
+                with sidecar.open("w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+            except OSError:
+                pass
+
+        entry = ScanEntry(
+            path=path,
+            created_at=stat.st_mtime,
+            targets={t: [tuple(r) for r in ranges] for t, ranges in meta["targets"].items()},
+        )
+        self._entries[path] = (stamp, entry)
+        return entry
+
+    def entries(self, target: str) -> List[ScanEntry]:
+        """Indexed payloads that include target, newest first."""
+        found = [self.entry(p) for p in self.directory.glob("*.json")]
+        found = [e for e in found if e is not None and e.ranges(target)]
+        return sorted(found, key=lambda e: e.created_at, reverse=True)
+
+    @staticmethod
+    def _read_rows(path: Path) -> List[dict]:
+        with path.open("r", encoding="utf-8") as f:
+            rows = json.load(f)
+        if not isinstance(rows, list):
+            raise ValueError("scan payload must be a JSON array of rows")
+        return rows
+
+    def _merge_rows(
+        self, sources: List[ScanEntry], target: str, start: int, end: int
+    ) -> Tuple[List[dict], List[Path]]:
+        """Rows for start..end from sources; the first source holding a port wins."""
+        rows: Dict[int, dict] = {}
+        used: List[Path] = []
+        total = end - start + 1
+        for entry in sources:
+            if len(rows) >= total:
+                break
+            if not _overlaps((start, end), entry.ranges(target)):
+                continue
+            added = False
+            for row in self._read_rows(entry.path):
+                try:
+                    port = int(row["port"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if str(row.get("target")) == target and start <= port <= end and port not in rows:
+                    rows[port] = row
+                    added = True
+            if added:
+                used.append(entry.path)
+        return [rows[p] for p in sorted(rows)], used
+
+    # -- scanning ----------------------------------------------------------------
+
+    async def _scan(self, target: str, start: int, end: int, progress: ProgressFn) -> ScanEntry:
+        safe_target = re.sub(r"[^A-Za-z0-9.]+", "_", target)
+        output = self.directory / f"{self.prefix}_{safe_target}_{start}-{end}_{time.time_ns()}.json"
+        await self.run(target, start, end, output, progress)
+        entry = await asyncio.to_thread(self.entry, output)
+        if entry is None:
+            raise RuntimeError(f"Simulation produced no payload at {output}")
+        return entry
+
+    def _start(self, target: str, start: int, end: int) -> asyncio.Task:
+        key = (target, start, end)
+        watchers = self._watchers[key] = []
+
+        def progress(**fields) -> None:
+            for watcher in list(watchers):
+                watcher(**fields)
+
+        task = asyncio.ensure_future(self._scan(target, start, end, progress))
+        self._inflight[key] = task
+
+        def _done(_) -> None:
+            self._inflight.pop(key, None)
+            self._watchers.pop(key, None)
+
+        task.add_done_callback(_done)
+        return task
+
+    async def get(
+        self,
+        target: str,
+        start: int,
+        end: int,
+        max_age: Optional[float] = None,
+        on_progress: Optional[ProgressFn] = None,
+    ) -> ScanResult:
+        """
+        Rows for ports start..end on target.
+        max_age=None never reuses finished scans (only ones still running); when
+        a scan fails, older payloads of any age fill in the ports it missed.
+        on_progress gets the progress of every scan this call waits on, started or joined.
+        """
+        needed = [(start, end)]
+        now = time.time()
+        # the index and payloads are read from disk, off the event loop
+        indexed = await asyncio.to_thread(self.entries, target)
+        fresh = [e for e in indexed if max_age is not None and now - e.created_at <= max_age]
+
+        gaps = needed
+        for entry in fresh:
+            gaps = subtract(gaps, entry.ranges(target))
+        reused = subtract(needed, gaps)
+
+        # join scans another request already started for these ports
+        joined: List[asyncio.Task] = []
+        keys: List[Tuple[str, int, int]] = []
+        for key, task in list(self._inflight.items()):
+            t, a, b = key
+            if t == target and _overlaps((a, b), gaps):
+                joined.append(task)
+                keys.append(key)
+                gaps = subtract(gaps, [(a, b)])
+
+        started = [self._start(target, a, b) for a, b in gaps]
+        keys += [(target, a, b) for a, b in gaps]
+        if on_progress is not None:
+            for key in keys:
+                self._watchers[key].append(on_progress)
+        try:
+            # shielded: a client disconnecting must not cancel a scan other requests are waiting on
+            outcomes = await asyncio.gather(
+                *(asyncio.shield(t) for t in joined + started), return_exceptions=True
+            )
+        finally:
+            if on_progress is not None:
+                for key in keys:
+                    watchers = self._watchers.get(key)
+                    if watchers is not None and on_progress in watchers:
+                        watchers.remove(on_progress)
+
+        scanned_entries: List[ScanEntry] = []
+        started_entries: List[ScanEntry] = []
+        errors: List[str] = []
+        for i, outcome in enumerate(outcomes):
+            if isinstance(outcome, BaseException):
+                errors.append(str(outcome) or type(outcome).__name__)
+            else:
+                scanned_entries.append(outcome)
+                if i >= len(joined):
+                    started_entries.append(outcome)
+
+        sources = sorted(scanned_entries, key=lambda e: e.created_at, reverse=True) + fresh
+        if errors:
+            # keep the old fallback: serve whatever was scanned before, however old
+            seen = {e.path for e in sources}
+            sources += [e for e in indexed if e.path not in seen]
+
+        rows, used = await asyncio.to_thread(self._merge_rows, sources, target, start, end)
+
+        scanned = subtract(needed, subtract(needed, [r for e in scanned_entries for r in e.ranges(target)]))
+        started_ranges = subtract(needed, subtract(needed, [r for e in started_entries for r in e.ranges(target)]))
+        return ScanResult(
+            rows=rows,
+            paths=used,
+            reused=reused,
+            scanned=scanned,
+            started=started_ranges,
+            errors=errors,
+        )
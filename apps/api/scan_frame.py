@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import warnings
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from pydantic import TypeAdapter
+
+from flow_aggregator import STREAM_WINDOW_S
+
+_DATETIME = TypeAdapter(datetime)
+
+
+class ScanFrameError(ValueError):
+    pass
+
+
+@dataclass
+class ScanFrame:
+    """
+    Columnar view of scanner rows.
+    timestamps are int64 nanoseconds, ports int32, and targets int32 codes
+    into target_names, so the feature math runs as a handful of numpy ops
+    instead of a Python loop per row.
+    """
+
+    timestamps: np.ndarray
+    ports: np.ndarray
+    targets: np.ndarray
+    target_names: List[str]
+
+    def __len__(self) -> int:
+        return int(self.ports.shape[0])
+
+    @classmethod
+    def from_records(cls, records: Sequence[dict]) -> "ScanFrame":
+        """Build from raw scanner dicts (JSON payloads or csv.DictReader rows)."""
+        try:
+            timestamps = [r["timestamp"] for r in records]
+            ports = [r["port"] for r in records]
+            targets = [r["target"] for r in records]
+        except (KeyError, TypeError) as exc:
+            raise ScanFrameError(f"scan rows need timestamp, target and port: {exc}") from exc
+        return cls._build(timestamps, ports, targets)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> "ScanFrame":
+        """Build from ScanRow/StreamRow objects."""
+        rows = list(rows)
+        return cls._build(
+            [r.timestamp for r in rows], [r.port for r in rows], [r.target for r in rows]
+        )
+
+    @classmethod
+    def _build(cls, timestamps: list, ports: list, targets: list) -> "ScanFrame":
+        try:
+            port_arr = np.asarray(ports, dtype=np.int64)
+        except (TypeError, ValueError) as exc:
+            raise ScanFrameError(f"port must be an integer: {exc}") from exc
+        bad = np.flatnonzero((port_arr < 0) | (port_arr > 65535))
+        if bad.size:
+            raise ScanFrameError(f"row {int(bad[0])}: port {int(port_arr[bad[0]])} out of range")
+
+        target_names, target_codes = np.unique(np.asarray(targets, dtype=str), return_inverse=True)
+        return cls(
+            timestamps=_parse_timestamps(timestamps),
+            ports=port_arr.astype(np.int32),
+            targets=target_codes.astype(np.int32),
+            target_names=[str(t) for t in target_names],
+        )
+
+    def time_order(self) -> np.ndarray:
+        """Row indices in timestamp order (stable, like sorted(..., key=timestamp))."""
+        return np.argsort(self.timestamps, kind="stable")
+
+    def inter_arrival_seconds(self, prev_ns: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """
+        Seconds since the previous probe of the same target, in row order.
+        The first probe of a target gets 0, or the gap to prev_ns[target] when a
+        caller carries state across batches; prev_ns is updated in place.
+        """
+        n = len(self)
+        if n == 0:
+            return np.zeros(0, dtype=np.float64)
+
+        # group by target, then time; one diff covers every group at once
+        order = np.lexsort((self.timestamps, self.targets))
+        ts = self.timestamps[order]
+        codes = self.targets[order]
+        deltas = np.empty(n, dtype=np.int64)
+        deltas[0] = 0
+        deltas[1:] = np.diff(ts)
+
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        deltas[starts] = 0
+        if prev_ns is not None:
+            ends = np.r_[starts[1:], n] - 1
+            for start, end in zip(starts, ends):
+                name = self.target_names[codes[start]]
+                if name in prev_ns:
+                    deltas[start] = ts[start] - prev_ns[name]
+                prev_ns[name] = int(ts[end])
+
+        out = np.empty(n, dtype=np.float64)
+        out[order] = np.maximum(deltas, 0) / 1e9
+        return out
+
+    def stream_counts(
+        self,
+        window_s: float = STREAM_WINDOW_S,
+        recent: Optional[Dict[str, np.ndarray]] = None,
+    ) -> np.ndarray:
+        """
+        Probes of the same target in the window_s seconds up to and including
+        each row, in row order; the same stream_1_count FlowAggregator reports.
+        recent carries each target's in-window timestamps across batches.
+        """
+        n = len(self)
+        out = np.empty(n, dtype=np.int64)
+        if n == 0:
+            return out
+
+        window_ns = int(window_s * 1e9)
+        order = np.lexsort((self.timestamps, self.targets))
+        ts = self.timestamps[order]
+        codes = self.targets[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], n]
+
+        counts = np.empty(n, dtype=np.int64)
+        for start, end in zip(starts, ends):
+            name = self.target_names[codes[start]]
+            seg = ts[start:end]
+            prior = recent.get(name) if recent is not None else None
+            if prior is not None and prior.size:
+                seg = np.concatenate([prior, seg])
+            first = np.searchsorted(seg, seg - window_ns, side="left")
+            group_counts = np.arange(seg.size) - first + 1
+            counts[start:end] = group_counts[seg.size - (end - start):]
+            if recent is not None:
+                recent[name] = seg[seg >= seg[-1] - window_ns]
+
+        out[order] = counts
+        return out
+
+    def to_ml_batch(
+        self,
+        index: Optional[np.ndarray] = None,
+        prev_ns: Optional[Dict[str, int]] = None,
+        recent: Optional[Dict[str, np.ndarray]] = None,
+    ) -> Dict[str, list]:
+        """Columnar port-probing batch for the ml-service /predict/batch route."""
+        deltas = self.inter_arrival_seconds(prev_ns)
+        streams = self.stream_counts(recent=recent)
+        ports = self.ports
+        if index is not None:
+            deltas = deltas[index]
+            streams = streams[index]
+            ports = ports[index]
+        n = int(ports.shape[0])
+        # the scanner doesn't record its source port and only speaks TCP
+        return {
+            "dst_port": ports.tolist(),
+            "src_port": [0] * n,
+            "inter_arrival_time": deltas.tolist(),
+            "stream_1_count": streams.tolist(),
+            "l4_tcp": [True] * n,
+            "l4_udp": [False] * n,
+        }
+
+
+def batch_rows(batch: Dict[str, list]) -> List[dict]:
+    """Expand a columnar batch back into per-row dicts for the response."""
+    keys = list(batch)
+    return [dict(zip(keys, values)) for values in zip(*batch.values())]
+
+
+def _parse_timestamps(values: list) -> np.ndarray:
+    # fast path: naive ISO strings / datetimes parse straight into datetime64
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            return np.array(values, dtype="datetime64[ns]").astype(np.int64)
+    except (ValueError, TypeError, OverflowError, Warning):
+        pass
+
+    # slow path: timezone-aware or unusual formats, normalised to naive UTC
+    out = np.empty(len(values), dtype=np.int64)
+    for i, value in enumerate(values):
+        try:
+            ts = _DATETIME.validate_python(value)
+        except ValueError as exc:
+            raise ScanFrameError(f"row {i}: invalid timestamp {value!r}") from exc
+        if ts.tzinfo is not None:
+            ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+        out[i] = np.datetime64(ts, "ns").astype(np.int64)
+    return out
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import heapq
+import json
+import os
+import pickle
+import tempfile
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional
+
+from pydantic import ValidationError
+
+from models import ScanRow
+
+# rows held in memory before a sorted run is spilled to disk
+SORT_CHUNK_ROWS = int(os.getenv("SCAN_SORT_CHUNK_ROWS", "100000"))
+MAX_REPORTED_ERRORS = 20
+
+
+class StreamRow(NamedTuple):
+    """Lightweight stand-in for ScanRow with the same attribute names."""
+
+    timestamp: datetime
+    target: str
+    port: int
+    state: str
+    banner: str
+
+
+class RowErrors:
+    def __init__(self) -> None:
+        self.count = 0
+        self.samples: List[str] = []
+
+    def add(self, line_no: int, message: str) -> None:
+        self.count += 1
+        if len(self.samples) < MAX_REPORTED_ERRORS:
+            self.samples.append(f"row {line_no}: {message}")
+
+
+def parse_row(raw: dict) -> StreamRow:
+    # fast path: the scanner always writes ISO timestamps and integer ports
+    try:
+        port = int(raw["port"])
+        if not 0 <= port <= 65535:
+            raise ValueError(f"port {port} out of range")
+        return StreamRow(
+            timestamp=_utc(datetime.fromisoformat(raw["timestamp"])),
+            target=str(raw["target"]),
+            port=port,
+            state=str(raw["state"]),
+            banner=raw.get("banner") or "",
+        )
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    # slow path: let pydantic coerce the odd row, or raise a readable error
+    row = ScanRow.model_validate(raw)
+    return StreamRow(_utc(row.timestamp), row.target, row.port, row.state, row.banner or "")
+
+
+def _utc(ts: datetime) -> datetime:
+    # naive UTC, like ScanFrame: mixed naive and aware rows must still compare while sorting
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes], errors: RowErrors) -> AsyncIterator[StreamRow]:
+    header: Optional[List[str]] = None
+    record = ""
+    line_no = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        # quoted banners may contain newlines, keep joining until the quotes balance
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+        fields = next(csv.reader([record]), [])
+        record = ""
+        if not fields:
+            continue
+        if header is None:
+            header = [f.strip() for f in fields]
+            continue
+        try:
+            yield parse_row(dict(zip(header, fields)))
+        except (ValidationError, ValueError) as exc:
+            errors.add(line_no, _describe(exc))
+
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes], errors: RowErrors) -> AsyncIterator[StreamRow]:
+    line_no = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            yield parse_row(json.loads(line))
+        except (ValidationError, ValueError, TypeError) as exc:
+            errors.add(line_no, _describe(exc))
+
+
+def _describe(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in exc.errors()
+        )
+    return str(exc)
+
+
+class ExternalSorter:
+    """
+    Sorts rows by timestamp with bounded memory.
+    Rows are buffered up to chunk_rows, each full buffer is sorted and spilled
+    to a temp file, and the runs are k-way merged on the way out.
+    """
+
+    def __init__(self, chunk_rows: int = SORT_CHUNK_ROWS) -> None:
+        self.chunk_rows = max(chunk_rows, 1)
+        self.buffer: List[StreamRow] = []
+        self.runs: List[str] = []
+
+    def add(self, row: StreamRow) -> bool:
+        self.buffer.append(row)
+        return len(self.buffer) >= self.chunk_rows
+
+    def spill(self) -> None:
+        if not self.buffer:
+            return
+        self.buffer.sort(key=_row_key)
+        fd, path = tempfile.mkstemp(prefix="scan_sort_", suffix=".run")
+        # one pickle per row: a shared (un)pickler memo would pin every row in memory
+        with os.fdopen(fd, "wb") as f:
+            for row in self.buffer:
+                pickle.dump(tuple(row), f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.runs.append(path)
+        self.buffer = []
+
+    def __iter__(self) -> Iterator[StreamRow]:
+        if not self.runs:
+            # everything fit in memory, no need to touch disk
+            self.buffer.sort(key=_row_key)
+            return iter(self.buffer)
+        self.spill()
+        return heapq.merge(*(_read_run(p) for p in self.runs), key=_row_key)
+
+    def close(self) -> None:
+        for path in self.runs:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self.runs = []
+        self.buffer = []
+
+
+def _row_key(row: StreamRow) -> datetime:
+    return row.timestamp
+
+
+def _read_run(path: str) -> Iterator[StreamRow]:
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield StreamRow(*pickle.load(f))
+            except EOFError:
+                return
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+logger = logging.getLogger("api")
+
+# how long browsers may reuse a cached body before asking again (with If-None-Match)
+STATIC_MAX_AGE_S = int(os.getenv("STATIC_MAX_AGE_S", "30"))
+
+# the source file is stat()ed at most this often; edits show up within this window
+STATIC_RECHECK_S = float(os.getenv("STATIC_RECHECK_S", "1.0"))
+
+
+def _encode(value: object) -> bytes:
+    # same separators/flags as FastAPI's JSONResponse, so the bytes match what it used to send
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    # If-None-Match is a list; weak validators compare equal to the strong one for GETs
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class CachedJSON:
+    """
+    A JSON response serialized once and served as bytes with a strong ETag.
+
+    build() returns the JSON-ready value. When a source file is given, it is
+    rebuilt after the file's mtime or size changes; a rebuild that fails keeps
+    serving the last good body instead of erroring every request.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[], object],
+        source: Optional[Path] = None,
+        max_age: int = STATIC_MAX_AGE_S,
+        recheck_s: float = STATIC_RECHECK_S,
+    ):
+        self.build = build
+        self.source = Path(source) if source is not None else None
+        self.recheck_s = recheck_s
+        self.cache_control = f"public, max-age={max_age}"
+        self.body = b""
+        self.etag = ""
+        self.built_at = 0.0
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self.refresh(force=True)
+
+    def _source_stamp(self) -> Optional[Tuple[int, int]]:
+        if self.source is None:
+            return None
+        try:
+            stat = self.source.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self, force: bool = False) -> bool:
+        """Rebuild if the source changed (or force); returns whether the body was replaced."""
+        self._checked_at = time.monotonic()
+        stamp = self._source_stamp()
+        if not force and stamp == self._stamp:
+            return False
+        try:
+            body = _encode(self.build())
+        except Exception as exc:
+            if force and not self.body:
+                raise
+            logger.warning("keeping cached %s, rebuild failed: %s", self.source or "response", exc)
+            # don't retry a broken file on every recheck, only once it changes again
+            self._stamp = stamp
+            return False
+
+        self._stamp = stamp
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.built_at = time.time()
+        return True
+
+    def response(self, request: Request) -> Response:
+        if self.source is not None and time.monotonic() - self._checked_at >= self.recheck_s:
+            self.refresh()
+
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control}
+        if _etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, Optional
+
+BASE_DIR = Path(__file__).parent
+
+# modules that used to load with the service and should now wait for the first model
+HEAVY_MODULES = ("sklearn", "xgboost", "scipy", "joblib")
+
+
+def import_time() -> Dict[str, object]:
+    """Seconds to import main in a fresh interpreter, and which heavy modules came with it."""
+    code = (
+        "import json, sys, time\n"
+        "t = time.perf_counter()\n"
+        "import main\n"
+        "elapsed = time.perf_counter() - t\n"
+        f"print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=BASE_DIR, capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _get(url: str) -> Optional[tuple]:
+    try:
+        with urllib.request.urlopen(url, timeout=1.0) as resp:
+            return resp.status, json.loads(resp.read() or b"null")
+    except urllib.error.HTTPError as exc:
+        return exc.code, json.loads(exc.read() or b"null")
+    except (urllib.error.URLError, ConnectionError, socket.timeout):
+        return None
+
+
+def measure(port: int = 8011, timeout_s: float = 600.0, poll_s: float = 0.02) -> Dict[str, object]:
+    """
+    Start the service and time, from the spawn:
+      -> the listening socket (first TCP connect)
+      -> the first /livez answer
+      -> every preloaded model turning ready in /readyz, and /readyz itself
+    """
+    base = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    start = time.perf_counter()
+    timings: Dict[str, object] = {}
+    models: Dict[str, float] = {}
+    try:
+        while time.perf_counter() - start < timeout_s:
+            if proc.poll() is not None:
+                raise RuntimeError(f"service exited with code {proc.returncode}")
+            now = time.perf_counter() - start
+            if "socket_s" not in timings:
+                with socket.socket() as sock:
+                    sock.settimeout(poll_s)
+                    if sock.connect_ex(("127.0.0.1", port)) == 0:
+                        timings["socket_s"] = now
+            elif "livez_s" not in timings:
+                if (_get(f"{base}/ml/livez") or (None,))[0] == 200:
+                    timings["livez_s"] = now
+            else:
+                answer = _get(f"{base}/ml/readyz")
+                if answer is not None:
+                    code, body = answer
+                    for name, state in body["models"].items():
+                        if state["state"] in ("ready", "failed") and name not in models:
+                            models[name] = now
+                            timings[f"model_{name}_{state['state']}_s"] = now
+                    if code == 200:
+                        timings["readyz_s"] = now
+                        timings["service_reported"] = body
+                        break
+            time.sleep(poll_s)
+        else:
+            raise TimeoutError(f"service not ready after {timeout_s}s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return timings
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # python bench_startup.py --port 8011
+    parser = argparse.ArgumentParser(description="Time to listening socket and to each startup model ready")
+    parser.add_argument("--port", type=int, default=int(os.getenv("BENCH_PORT", "8011")))
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    imported = import_time()
+    print(f"import main: {imported['seconds']:.3f}s, heavy modules loaded: {imported['heavy'] or 'none'}")
+    result = measure(args.port, args.timeout)
+    reported = result.pop("service_reported")
+    for key, value in result.items():
+        print(f"{key:<32} {value:8.3f}s")
+    print("\nas reported by /readyz (seconds after the service's imports):")
+    print(json.dumps(reported, indent=2))
@@ -0,0 +1,501 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from model_store import COMPACT_DIR, ModelArtifact, load_artifact, save_artifact, variant_path
+
+# rows are walked through the trees in chunks: rows x trees node ids per chunk stay cache-sized,
+#   -> and a big batch never allocates them all at once
+TRAVERSE_CHUNK_ROWS = int(os.getenv("ML_COMPACT_CHUNK_ROWS", "256"))
+
+# name -> settings; every variant keeps the full model's predict_proba/predict interface
+#   -> threshold_bits: None keeps every split threshold (lossless), 8/16 snaps each feature's
+#      thresholds to at most 2^bits - 2 values so split indices fit uint8/uint16
+#   -> leaf: float32 / float16 / int8 (one scale for the whole ensemble)
+#   -> max_trees: keep the first N trees (boosting order for XGBoost; forest trees are interchangeable)
+#   -> min_cover: collapse any subtree that saw less than this share of its tree's training weight
+VARIANTS: Dict[str, Dict[str, object]] = {
+    "exact": {"threshold_bits": None, "leaf": "float32", "max_trees": None, "min_cover": 0.0},
+    "f16": {"threshold_bits": 16, "leaf": "float16", "max_trees": None, "min_cover": 0.0},
+    "int8": {"threshold_bits": 8, "leaf": "int8", "max_trees": None, "min_cover": 0.0},
+    "pruned": {"threshold_bits": 8, "leaf": "int8", "max_trees": None, "min_cover": 0.001},
+    "pruned_half": {"threshold_bits": 8, "leaf": "int8", "max_trees": 0.5, "min_cover": 0.001},
+}
+
+
+@dataclass
+class _Tree:
+    """One tree in plain arrays; left/right are -1 at leaves, cover is the training weight reaching a node."""
+
+    feature: np.ndarray
+    threshold: np.ndarray
+    left: np.ndarray
+    right: np.ndarray
+    value: np.ndarray
+    cover: np.ndarray
+
+
+@dataclass
+class CompactForest:
+    """
+    A tree ensemble flattened into a few small arrays, scored with numpy alone.
+
+    Every node holds a feature id, the index of its threshold in that feature's
+    sorted threshold table, and its left child (the right child is the next
+    node); leaves point at themselves. Inputs are turned into per-feature table
+    positions once, then all trees advance one level per step for the whole
+    chunk, so a prediction costs depth numpy ops instead of a call per tree.
+    """
+
+    kind: str  # "xgboost": sigmoid of the summed leaf margins; "forest": mean of the leaf probabilities
+    feature_names_in_: np.ndarray
+    tables: List[np.ndarray]
+    feature: np.ndarray
+    split: np.ndarray
+    child: np.ndarray
+    value: np.ndarray
+    roots: np.ndarray
+    depth: int
+    value_scale: float = 1.0
+    base_margin: float = 0.0
+    # sklearn sends x <= threshold left, XGBoost x < threshold
+    left_inclusive: bool = False
+    settings: Dict[str, object] = field(default_factory=dict)
+    classes_: np.ndarray = field(default_factory=lambda: np.array([0, 1]))
+
+    # a compacted model can't be refit; incremental updates go back to the full artifact
+    compact = True
+
+    @property
+    def n_features_in_(self) -> int:
+        return len(self.feature_names_in_)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.feature, self.split, self.child, self.value, self.roots, *self.tables]
+        return int(sum(a.nbytes for a in arrays))
+
+    def _positions(self, X) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            X = X.reindex(columns=self.feature_names_in_).to_numpy(dtype=np.float32, na_value=np.nan)
+        # both libraries compare float32 inputs, so cast first to route exactly like the full model
+        X = np.asarray(X, dtype=np.float32)
+        side = "left" if self.left_inclusive else "right"
+        out = np.empty(X.shape, dtype=np.int32)
+        for f, table in enumerate(self.tables):
+            out[:, f] = np.searchsorted(table, X[:, f].astype(table.dtype), side=side)
+        return out
+
+    def _leaves(self, positions: np.ndarray) -> np.ndarray:
+        n, width = positions.shape
+        flat = positions.ravel()
+        # one slot per (row, tree); node ids stay intp so take() never converts its index array
+        row_offset = np.repeat(np.arange(n, dtype=np.intp) * width, self.roots.size)
+        node = np.tile(self.roots.astype(np.intp), n)
+        for _ in range(self.depth):
+            go_right = flat.take(row_offset + self.feature.take(node)) > self.split.take(node)
+            node = self.child.take(node).astype(np.intp)
+            node += go_right
+        return self.value.take(node).reshape(n, self.roots.size).astype(np.float32)
+
+    def predict_proba(self, X) -> np.ndarray:
+        positions = self._positions(X)
+        p1 = np.empty(positions.shape[0], dtype=np.float64)
+        for start in range(0, positions.shape[0], TRAVERSE_CHUNK_ROWS):
+            leaves = self._leaves(positions[start : start + TRAVERSE_CHUNK_ROWS]) * self.value_scale
+            if self.kind == "xgboost":
+                margin = leaves.sum(axis=1, dtype=np.float64) + self.base_margin
+                p1[start : start + TRAVERSE_CHUNK_ROWS] = 1.0 / (1.0 + np.exp(-margin))
+            else:
+                p1[start : start + TRAVERSE_CHUNK_ROWS] = leaves.mean(axis=1, dtype=np.float64)
+        return np.column_stack([1.0 - p1, p1])
+
+    def predict(self, X) -> np.ndarray:
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(int)
+
+
+# -- reading trees out of the fitted models -------------------------------------
+
+
+def _xgboost_trees(model) -> Tuple[List[_Tree], List[str], float]:
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    # the JSON model carries the exact float32 split values, unlike the text dump
+    learner = json.loads(bytes(booster.save_raw(raw_format="json")))["learner"]
+    objective = learner["objective"]["name"]
+    if objective != "binary:logistic":
+        raise ValueError(f"Only binary:logistic XGBoost models can be compacted, got {objective}")
+    names = booster.feature_names or [f"f{i}" for i in range(int(learner["learner_model_param"]["num_feature"]))]
+
+    trees = []
+    for tree in learner["gradient_booster"]["model"]["trees"]:
+        left = np.asarray(tree["left_children"], dtype=np.int64)
+        trees.append(
+            _Tree(
+                feature=np.asarray(tree["split_indices"], dtype=np.int64),
+                threshold=np.asarray(tree["split_conditions"], dtype=np.float32),
+                left=left,
+                right=np.asarray(tree["right_children"], dtype=np.int64),
+                # leaves keep their weight in split_conditions
+                value=np.where(left == -1, np.asarray(tree["split_conditions"], dtype=np.float64), 0.0),
+                cover=np.asarray(tree["sum_hessian"], dtype=np.float64),
+            )
+        )
+    # base_score is stored as a probability for the logistic objective
+    base_score = float(learner["learner_model_param"]["base_score"])
+    return trees, list(names), math.log(base_score / (1.0 - base_score))
+
+
+def _sklearn_trees(model) -> Tuple[List[_Tree], List[str]]:
+    estimators = getattr(model, "estimators_", None)
+    estimators = [model] if estimators is None else list(estimators)
+    if list(getattr(model, "classes_", [0, 1])) != [0, 1]:
+        raise ValueError("Only binary 0/1 classifiers can be compacted")
+    trees = []
+    for estimator in estimators:
+        tree = getattr(estimator, "tree_", None)
+        if tree is None:
+            raise ValueError(f"{type(model).__name__} is not a tree ensemble")
+        counts = tree.value[:, 0, :]
+        totals = counts.sum(axis=1)
+        trees.append(
+            _Tree(
+                feature=tree.feature.astype(np.int64),
+                threshold=tree.threshold.astype(np.float64),
+                left=tree.children_left.astype(np.int64),
+                right=tree.children_right.astype(np.int64),
+                value=np.divide(counts[:, 1], totals, out=np.zeros_like(totals), where=totals > 0),
+                cover=tree.weighted_n_node_samples.astype(np.float64),
+            )
+        )
+    names = getattr(model, "feature_names_in_", None)
+    if names is None:
+        names = [f"x{i}" for i in range(model.n_features_in_)]
+    return trees, list(names)
+
+
+# -- compaction -----------------------------------------------------------------
+
+
+def _prune(tree: _Tree, min_cover: float) -> _Tree:
+    """Collapse subtrees below min_cover of the root's weight into a leaf with their cover-weighted value."""
+    if min_cover <= 0:
+        return tree
+    left, right = tree.left.copy(), tree.right.copy()
+    value = tree.value.copy()
+    floor = min_cover * tree.cover[0]
+
+    # children always come after their parent in both layouts, so one reverse pass settles subtree values
+    for node in range(len(left) - 1, -1, -1):
+        if left[node] == -1:
+            continue
+        l, r = left[node], right[node]
+        weight = tree.cover[l] + tree.cover[r]
+        value[node] = (value[l] * tree.cover[l] + value[r] * tree.cover[r]) / weight if weight > 0 else value[l]
+        if tree.cover[node] < floor:
+            left[node] = right[node] = -1
+    return _Tree(tree.feature, tree.threshold, left, right, value, tree.cover)
+
+
+def _snap(thresholds: np.ndarray, bits: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted table for one feature, and each threshold's position in it."""
+    table = np.unique(thresholds)
+    limit = None if bits is None else 2**bits - 2
+    if limit is not None and table.size > limit:
+        # keep thresholds where the model splits most often: quantiles of all its split points
+        reps = np.unique(np.quantile(thresholds, np.linspace(0, 1, limit), method="nearest"))
+        idx = np.clip(np.searchsorted(reps, thresholds), 1, reps.size - 1)
+        nearer_low = np.abs(thresholds - reps[idx - 1]) <= np.abs(reps[idx] - thresholds)
+        snapped = np.where(nearer_low, reps[idx - 1], reps[idx])
+        table = np.unique(snapped)
+        thresholds = snapped
+    return table, np.searchsorted(table, thresholds)
+
+
+def _index_dtype(size: int):
+    # the largest value is reserved for leaves, which never go right
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    raise ValueError("threshold table too large")
+
+
+def compact(
+    model,
+    threshold_bits: Optional[int] = None,
+    leaf: str = "float32",
+    max_trees: Optional[float] = None,
+    min_cover: float = 0.0,
+) -> CompactForest:
+    """Flatten a fitted XGBoost model or sklearn forest/tree into a CompactForest."""
+    settings = {"threshold_bits": threshold_bits, "leaf": leaf, "max_trees": max_trees, "min_cover": min_cover}
+    if hasattr(model, "get_booster"):
+        trees, names, base_margin = _xgboost_trees(model)
+        kind, inclusive, threshold_dtype = "xgboost", False, np.float32
+    else:
+        trees, names = _sklearn_trees(model)
+        base_margin = 0.0
+        kind, inclusive, threshold_dtype = "forest", True, np.float64
+
+    if max_trees is not None:
+        keep = int(math.ceil(max_trees * len(trees))) if max_trees <= 1 else int(max_trees)
+        trees = trees[: max(keep, 1)]
+    trees = [_prune(t, min_cover) for t in trees]
+
+    # breadth-first renumbering of the reachable nodes, children side by side
+    features, thresholds, childs, values, roots = [], [], [], [], []
+    depth = 0
+    offset = 0
+    for tree in trees:
+        order = [0]
+        level = {0: 0}
+        child_of = {}
+        i = 0
+        while i < len(order):
+            node = order[i]
+            if tree.left[node] != -1:
+                child_of[node] = len(order)
+                order.extend((tree.left[node], tree.right[node]))
+                level[tree.left[node]] = level[tree.right[node]] = level[node] + 1
+            i += 1
+        depth = max(depth, max(level.values()))
+        roots.append(offset)
+        for local, node in enumerate(order):
+            leaf_node = tree.left[node] == -1
+            features.append(0 if leaf_node else tree.feature[node])
+            thresholds.append(np.nan if leaf_node else tree.threshold[node])
+            childs.append(offset + (local if leaf_node else child_of[node]))
+            values.append(tree.value[node])
+        offset += len(order)
+
+    feature = np.asarray(features, dtype=np.int64)
+    threshold = np.asarray(thresholds, dtype=np.float64)
+    is_leaf = np.isnan(threshold)
+    positions = np.zeros(feature.size, dtype=np.int64)
+    tables = []
+    for f in range(len(names)):
+        mask = (feature == f) & ~is_leaf
+        table, pos = _snap(threshold[mask].astype(threshold_dtype), threshold_bits)
+        tables.append(table.astype(threshold_dtype))
+        positions[mask] = pos
+    split_dtype = _index_dtype(max(t.size for t in tables))
+    split = positions.astype(split_dtype)
+    split[is_leaf] = np.iinfo(split_dtype).max
+
+    value = np.asarray(values, dtype=np.float64)
+    scale = 1.0
+    if leaf == "int8":
+        scale = float(np.abs(value).max() / 127) or 1.0
+        value = np.round(value / scale).astype(np.int8)
+    elif leaf in ("float16", "float32"):
+        value = value.astype(leaf)
+    else:
+        raise ValueError(f"Unknown leaf encoding '{leaf}'")
+
+    return CompactForest(
+        kind=kind,
+        feature_names_in_=np.asarray(names, dtype=object),
+        tables=tables,
+        feature=feature.astype(_index_dtype(len(names))),
+        split=split,
+        child=np.asarray(childs, dtype=np.int32),
+        value=value,
+        roots=np.asarray(roots, dtype=np.int32),
+        depth=depth,
+        value_scale=scale,
+        base_margin=base_margin,
+        left_inclusive=inclusive,
+        settings=settings,
+    )
+
+
+# -- reporting ------------------------------------------------------------------
+
+
+def _scorers() -> Dict[str, Tuple[Callable, Callable]]:
+    # the same split and the same scoring path the service uses (DoS pins its IP codes)
+    import dos
+    import port_probing
+
+    return {
+        "port_probing": (port_probing.load_training_split, port_probing.predict_port_probing_batch),
+        "dos": (dos.load_training_split, dos.predict_dos_encoded),
+    }
+
+
+_RSS_PROBE = """
+import importlib, os, sys
+import numpy, pandas, joblib
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+importlib.import_module(sys.argv[2])
+before = rss()
+data = joblib.load(sys.argv[1])
+print(rss() - before, rss())
+"""
+
+
+def _rss(path: Path, module: str) -> Tuple[int, int]:
+    """Resident bytes a fresh process gains loading the artifact, and its total RSS after."""
+    out = subprocess.run(
+        [sys.executable, "-c", _RSS_PROBE, str(path), module],
+        capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+    )
+    model_rss, process_rss = out.stdout.split()
+    return int(model_rss), int(process_rss)
+
+
+def _latency(score: Callable, model, X: pd.DataFrame, rows: int = 10_000, singles: int = 200) -> Dict[str, float]:
+    batch = X.iloc[:rows]
+    score(model, batch.iloc[:10])
+    start = time.perf_counter()
+    score(model, batch)
+    batch_s = time.perf_counter() - start
+
+    timings = []
+    for i in range(min(singles, len(X))):
+        row = X.iloc[i : i + 1]
+        start = time.perf_counter()
+        score(model, row)
+        timings.append(time.perf_counter() - start)
+    return {
+        "single_row_ms": float(np.median(timings) * 1000),
+        "batch_us_per_row": float(batch_s / max(len(batch), 1) * 1e6),
+    }
+
+
+def _quality(y: np.ndarray, labels: np.ndarray) -> Dict[str, float]:
+    tp = int(np.sum((labels == 1) & (y == 1)))
+    fp = int(np.sum((labels == 1) & (y == 0)))
+    fn = int(np.sum((labels == 0) & (y == 1)))
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "accuracy": float(np.mean(labels == y)),
+        "f1_score": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+    }
+
+
+def compact_model(
+    name: str,
+    variants: Sequence[str] = tuple(VARIANTS),
+    base: Optional[ModelArtifact] = None,
+    write: bool = True,
+) -> Dict[str, object]:
+    """
+    Build every variant of one model, score it on the hold-out split against the
+    full model and measure what it costs to hold and to run.
+    """
+    base = base or load_artifact(name)
+    attack = "dos" if name.startswith("dos") else "port_probing"
+    load_split, score = _scorers()[attack]
+    _, X_test, _, y_test = load_split()
+    y = np.asarray(y_test, dtype=int)
+
+    full_labels, full_proba = score(base.model, X_test)
+    full_quality = _quality(y, np.asarray(full_labels, dtype=int))
+    report: Dict[str, object] = {
+        "model": name,
+        "version": base.version,
+        "holdout_rows": int(len(y)),
+        "variants": {},
+    }
+
+    full_entry = {**full_quality, **_latency(score, base.model, X_test)}
+    if base.path is not None and base.path.exists():
+        full_entry["disk_bytes"] = base.path.stat().st_size
+        full_entry["model_rss_bytes"], full_entry["process_rss_bytes"] = _rss(base.path, type(base.model).__module__)
+    report["variants"]["full"] = full_entry
+
+    for variant in variants:
+        settings = VARIANTS[variant]
+        start = time.perf_counter()
+        model = compact(base.model, **settings)
+        build_s = time.perf_counter() - start
+        labels, proba = score(model, X_test)
+        labels = np.asarray(labels, dtype=int)
+        quality = _quality(y, labels)
+        entry = {
+            **settings,
+            "trees": int(model.roots.size),
+            "nodes": int(model.child.size),
+            "depth": model.depth,
+            "array_bytes": model.nbytes,
+            "build_s": round(build_s, 3),
+            **quality,
+            "accuracy_delta": quality["accuracy"] - full_quality["accuracy"],
+            "f1_delta": quality["f1_score"] - full_quality["f1_score"],
+            "agreement": float(np.mean(labels == np.asarray(full_labels, dtype=int))),
+            "max_proba_diff": float(np.max(np.abs(np.asarray(proba) - np.asarray(full_proba)))),
+            **_latency(score, model, X_test),
+        }
+        if write:
+            path = save_artifact(
+                name, model, {**(base.metrics or {}), **quality},
+                version=f"{base.version}.{variant}", path=variant_path(name, variant),
+                reference=base.reference,
+            )
+            entry["path"] = str(path)
+            entry["disk_bytes"] = path.stat().st_size
+            entry["model_rss_bytes"], entry["process_rss_bytes"] = _rss(path, CompactForest.__module__)
+        report["variants"][variant] = entry
+    return report
+
+
+def pick_variant(report: Dict[str, object], budget_mb: float, max_f1_drop: float = 0.01) -> Optional[str]:
+    """Smallest-RSS variant within the budget whose F1 is no more than max_f1_drop below the full model."""
+    budget = budget_mb * 1024 * 1024
+    fitting = [
+        (entry["model_rss_bytes"], variant)
+        for variant, entry in report["variants"].items()
+        if "model_rss_bytes" in entry
+        and entry["model_rss_bytes"] <= budget
+        and entry.get("f1_delta", 0.0) >= -max_f1_drop
+    ]
+    return min(fitting)[1] if fitting else None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # run through the importable module, so pickled variants reference compact.CompactForest, not __main__
+    import compact as module
+
+    # build, score and write every variant, then pick one for a memory budget
+    #   -> python compact.py port_probing dos --budget-mb 32
+    #   -> serve it with ML_MODEL_VARIANT=<variant>
+    parser = argparse.ArgumentParser(description="Compact tree models for memory-constrained pods")
+    parser.add_argument("names", nargs="*", default=["port_probing", "dos"])
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--budget-mb", type=float, default=None)
+    parser.add_argument("--max-f1-drop", type=float, default=0.01)
+    args = parser.parse_args()
+
+    for model_name in args.names:
+        result = module.compact_model(model_name, [v for v in args.variants.split(",") if v])
+        COMPACT_DIR.mkdir(parents=True, exist_ok=True)
+        (COMPACT_DIR / f"{model_name}.report.json").write_text(json.dumps(result, indent=2))
+
+        print(f"\n{model_name} (version {result['version']}, {result['holdout_rows']} hold-out rows)")
+        print(f"{'variant':12s} {'nodes':>8s} {'model RSS':>10s} {'disk':>10s} {'1-row ms':>9s} {'us/row':>7s} {'acc':>7s} {'d-acc':>8s} {'d-f1':>8s}")
+        for variant, entry in result["variants"].items():
+            print(
+                f"{variant:12s} {entry.get('nodes', ''):>8} "
+                f"{entry.get('model_rss_bytes', 0) / 2**20:9.2f}M {entry.get('disk_bytes', 0) / 2**20:9.2f}M "
+                f"{entry['single_row_ms']:9.3f} {entry['batch_us_per_row']:7.2f} {entry['accuracy']:7.4f} "
+                f"{entry.get('accuracy_delta', 0.0):+8.4f} {entry.get('f1_delta', 0.0):+8.4f}"
+            )
+        if args.budget_mb is not None:
+            choice = module.pick_variant(result, args.budget_mb, args.max_f1_drop)
+            print(f"under {args.budget_mb} MB: {choice or 'nothing fits'}")
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
+
+import feature_store
+from sampling import SamplerConfig
+
+# sklearn is imported where it's used: it's most of the service's import time,
+#   -> and the HTTP server should be listening before any model is touched
+if TYPE_CHECKING:
+    from sklearn.ensemble import RandomForestClassifier
 
 BASE_DIR = Path(__file__).parent
 SOURCE_FILE = BASE_DIR / "data" / "DoS-HTTP_Flood.pcap_Flow.csv"
@@ -25,6 +29,27 @@ DETECTION_FEATURES = [
     "Dst IP",
 ]
 
+# engineered model-input column -> the detection feature it is derived from
+DERIVED_FEATURES = {
+    "is_ssh": "Dst Port",
+    "is_telnet": "Dst Port",
+    "is_web": "Dst Port",
+    "src_ip_code": "Src IP",
+    "dst_ip_code": "Dst IP",
+}
+
+# DoSSample / DoSBatch field -> CICFlowMeter column the DoS model was trained on
+SAMPLE_COLUMNS = {
+    "dst_port": "Dst Port",
+    "flow_packets_s": "Flow Packets/s",
+    "flow_bytes_s": "Flow Bytes/s",
+    "total_fwd_packet": "Total Fwd Packet",
+    "flow_duration": "Flow Duration",
+    "total_length_of_fwd_packet": "Total Length of Fwd Packet",
+    "src_ip": "Src IP",
+    "dst_ip": "Dst IP",
+}
+
 MODEL_PARAMS = {
     "n_estimators": 35,
     "random_state": 42,
@@ -56,13 +81,13 @@ def engineer_features(df: pd.DataFrame) -> pd.DataFrame:
         df["is_telnet"] = (df["Dst Port"] == 23).astype(int)
         df["is_web"] = df["Dst Port"].isin([80, 443, 8080, 8443]).astype(int)
 
+    # sorted factorize gives the same codes as sklearn's LabelEncoder,
+    #   -> without importing sklearn on the serving path (a compacted model needs nothing else from it)
     if "Src IP" in df.columns:
-        le = LabelEncoder()
-        df["src_ip_code"] = le.fit_transform(df["Src IP"].fillna("0.0.0.0").astype(str))
+        df["src_ip_code"] = pd.factorize(df["Src IP"].fillna("0.0.0.0").astype(str), sort=True)[0]
 
     if "Dst IP" in df.columns:
-        le = LabelEncoder()
-        df["dst_ip_code"] = le.fit_transform(df["Dst IP"].fillna("0.0.0.0").astype(str))
+        df["dst_ip_code"] = pd.factorize(df["Dst IP"].fillna("0.0.0.0").astype(str), sort=True)[0]
 
     # remove any remaining features with string values, we've already converted what we need
     #   -> precaution more than anything
@@ -163,8 +188,12 @@ def find_dos(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
-def train_dos_model() -> Tuple[RandomForestClassifier, Dict[str, float]]:
-    df = load_dataframe()
+def load_training_data(sampler: Optional[SamplerConfig] = None) -> Tuple[pd.DataFrame, pd.Series]:
+    sampler = sampler or SamplerConfig.from_env()
+    if not SOURCE_FILE.exists():
+        raise FileNotFoundError(f"Training data not found at {SOURCE_FILE}")
+
+    df = sampler.read_csv(SOURCE_FILE)
     df_scored = find_dos(df)
 
     missing = [c for c in DETECTION_FEATURES if c not in df_scored.columns]
@@ -174,13 +203,48 @@ def train_dos_model() -> Tuple[RandomForestClassifier, Dict[str, float]]:
     X = df_scored[DETECTION_FEATURES]
     y = df_scored["is_dos"].astype(int)
 
-    X_encoded = engineer_features(X)
-
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_encoded, y, test_size=0.2, random_state=42, stratify=y
+    return engineer_features(X), y
+
+def build_model(params: Optional[Dict[str, object]] = None) -> RandomForestClassifier:
+    from sklearn.ensemble import RandomForestClassifier
+
+    return RandomForestClassifier(**{**MODEL_PARAMS, **(params or {})})
+
+def _split_training_data(sampler: SamplerConfig) -> feature_store.Split:
+    from sklearn.model_selection import train_test_split
+
+    X_encoded, y = load_training_data(sampler)
+    return train_test_split(X_encoded, y, test_size=0.2, random_state=42, stratify=y)
+
+def load_training_split(sampler: Optional[SamplerConfig] = None) -> feature_store.Split:
+    # find_dos + engineer_features over ~900k rows run once, later runs mmap the result
+    sampler = sampler or SamplerConfig.from_env()
+    return feature_store.load_or_build(
+        "dos",
+        [SOURCE_FILE],
+        lambda: _split_training_data(sampler),
+        parts={
+            "sampler": sampler.load_key(),
+            "features": DETECTION_FEATURES,
+            "code": feature_store.code_digest(
+                find_dos, engineer_features, load_training_data, _split_training_data
+            ),
+        },
     )
 
-    rf = RandomForestClassifier(**MODEL_PARAMS)
+def train_dos_model(
+    sampler: Optional[SamplerConfig] = None,
+) -> Tuple[RandomForestClassifier, Dict[str, float]]:
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+    sampler = sampler or SamplerConfig.from_env()
+    X_train, X_test, y_train, y_test = load_training_split(sampler)
+
+    # only the training split is down-sampled, test metrics stay on the natural class mix
+    #   -> find_dos flags ~the top 2 std. dev., so the majority class is most of the fit time
+    X_train, y_train = sampler.apply(X_train, y_train)
+
+    rf = build_model()
     rf.fit(X_train, y_train)
 
     y_pred = rf.predict(X_test)
@@ -190,6 +254,7 @@ def train_dos_model() -> Tuple[RandomForestClassifier, Dict[str, float]]:
         "precision": float(precision_score(y_test, y_pred, zero_division=0)),
         "recall": float(recall_score(y_test, y_pred, zero_division=0)),
         "f1_score": float(f1_score(y_test, y_pred, zero_division=0)),
+        "train_rows": int(len(X_train)),
     }
 
     return rf, metrics
@@ -209,6 +274,36 @@ def predict_dos(
 
     return label, proba
 
+def predict_dos_batch(
+    model: RandomForestClassifier, frame: pd.DataFrame
+) -> Tuple[np.ndarray, np.ndarray]:
+    return predict_dos_encoded(model, engineer_features(frame.reindex(columns=DETECTION_FEATURES)))
+
+def pin_ip_codes(frame: pd.DataFrame) -> pd.DataFrame:
+    # predict_dos label-encodes each sample on its own, so every IP becomes code 0
+    #   -> fitting the encoder across the batch would give different codes (and scores)
+    #   -> pin them to 0 so a batch scores exactly like the same rows sent one by one
+    frame = frame.copy()
+    for col in ("src_ip_code", "dst_ip_code"):
+        if col in frame.columns:
+            frame[col] = 0
+    return frame
+
+def model_inputs(frame: pd.DataFrame) -> pd.DataFrame:
+    """The exact matrix the model scores for a frame of DETECTION_FEATURES columns."""
+    return pin_ip_codes(engineer_features(frame.reindex(columns=DETECTION_FEATURES)))
+
+def predict_dos_encoded(
+    model: RandomForestClassifier, frame: pd.DataFrame
+) -> Tuple[np.ndarray, np.ndarray]:
+    # frame is already through engineer_features (a request batch, or the feature-store split)
+    frame = pin_ip_codes(frame)
+
+    # one predict_proba pass; argmax over it is exactly what model.predict does
+    proba = model.predict_proba(frame)
+    labels = model.classes_[proba.argmax(axis=1)]
+    return labels.astype(int), proba[:, -1]
+
 if __name__ == "__main__":
     model, metrics = train_dos_model()
     print("\nRANDOM FOREST MODEL RESULTS:")
@@ -0,0 +1,511 @@
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from bisect import bisect_right
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# live sketches cover the current window plus the one before it, so scores follow
+#   -> recent traffic instead of averaging over the whole process lifetime
+DRIFT_WINDOW_S = float(os.getenv("ML_DRIFT_WINDOW_S", "3600"))
+# below this many rows in the live windows a drift score is mostly noise, so none is reported
+DRIFT_MIN_ROWS = int(os.getenv("ML_DRIFT_MIN_ROWS", "200"))
+# ports and IPs: reference keeps this many most frequent keys, live sketches track twice as many
+DRIFT_TOP_K = int(os.getenv("ML_DRIFT_TOP_K", "20"))
+# numeric features are binned on reference quantiles (deciles by default)
+DRIFT_BINS = int(os.getenv("ML_DRIFT_BINS", "10"))
+# rows of the hold-out split scored to get the reference confidence distribution
+REFERENCE_SCORE_ROWS = int(os.getenv("ML_DRIFT_REFERENCE_ROWS", "20000"))
+
+REFERENCE_FORMAT = 1
+
+# keys are counted, not binned: their values are identifiers, not magnitudes
+CATEGORICAL_FEATURES = {"dst_port", "src_port", "Dst Port", "Src IP", "Dst IP"}
+
+# equal-width bins over [0, 1] for the confidence the model returns
+CONFIDENCE_EDGES = [i / 10 for i in range(1, 10)]
+
+# both models see NaN as 0 and CICFlowMeter's infinities as 1e9, so the sketches do too
+INF_VALUE = 1e9
+
+# PSI terms are smoothed so an empty bin on either side doesn't make the score infinite
+PSI_EPSILON = 1e-4
+
+
+def _clean(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    return np.nan_to_num(values, nan=0.0, posinf=INF_VALUE, neginf=-INF_VALUE)
+
+
+def _clean_one(value) -> float:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if value != value:
+        return 0.0
+    if value in (math.inf, -math.inf):
+        return math.copysign(INF_VALUE, value)
+    return value
+
+
+def _key(value):
+    # ports arrive as ints, floats or strings depending on the route, counted as one key
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return int(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+# -- scores ---------------------------------------------------------------------
+
+
+def psi(expected: Sequence[float], actual: Sequence[float]) -> float:
+    """Population stability index between two distributions over the same bins."""
+    e = np.maximum(np.asarray(expected, dtype=np.float64), PSI_EPSILON)
+    a = np.maximum(np.asarray(actual, dtype=np.float64), PSI_EPSILON)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def ks(expected: Sequence[float], actual: Sequence[float]) -> float:
+    """Largest CDF gap between two binned distributions; exact at the bin edges."""
+    return float(np.max(np.abs(np.cumsum(expected) - np.cumsum(actual))))
+
+
+# -- reference ------------------------------------------------------------------
+
+
+def _numeric_reference(values: np.ndarray, bins: int) -> dict:
+    values = _clean(values)
+    quantiles = np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])
+    edges = np.unique(quantiles)
+    counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=edges.size + 1)
+    return {
+        "kind": "numeric",
+        "edges": edges.tolist(),
+        "proportions": (counts / max(values.size, 1)).tolist(),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+
+
+def _categorical_reference(values: np.ndarray, top: int) -> dict:
+    keys, counts = np.unique(np.asarray(values), return_counts=True)
+    order = np.argsort(-counts, kind="stable")[:top]
+    n = max(int(counts.sum()), 1)
+    return {
+        "kind": "categorical",
+        "top": {str(_key(keys[i].item())): counts[i] / n for i in order},
+        "other": float(1.0 - counts[order].sum() / n),
+    }
+
+
+def build_reference(
+    features: Sequence[str],
+    X_train: pd.DataFrame,
+    X_test: Optional[pd.DataFrame] = None,
+    score: Optional[Callable[[pd.DataFrame], Tuple[np.ndarray, np.ndarray]]] = None,
+    bins: int = DRIFT_BINS,
+    top: int = DRIFT_TOP_K,
+) -> dict:
+    """
+    Training-time sketches the live ones are compared against: quantile bins and
+    moments per numeric feature, key frequencies per port/IP feature, and the
+    confidence distribution the model gives its own hold-out split.
+    Features the training matrix doesn't carry raw (the DoS IPs are label-encoded)
+    get live sketches but no reference.
+    """
+    reference: dict = {"format": REFERENCE_FORMAT, "rows": int(len(X_train)), "features": {}}
+    for name in features:
+        if name not in X_train.columns:
+            continue
+        values = X_train[name].to_numpy()
+        if name in CATEGORICAL_FEATURES:
+            reference["features"][name] = _categorical_reference(values, top)
+        else:
+            reference["features"][name] = _numeric_reference(values, bins)
+
+    if score is not None and X_test is not None and len(X_test):
+        rows = X_test.iloc[:REFERENCE_SCORE_ROWS]
+        labels, confidences = score(rows)
+        conf = _clean(confidences)
+        counts = np.bincount(np.searchsorted(CONFIDENCE_EDGES, conf, side="right"), minlength=len(CONFIDENCE_EDGES) + 1)
+        reference["prediction"] = {
+            "rows": int(conf.size),
+            "proportions": (counts / conf.size).tolist(),
+            "positive_rate": float(np.mean(np.asarray(labels) == 1)),
+            "mean_confidence": float(conf.mean()),
+        }
+    return reference
+
+
+def reference_builder(
+    load_split: Callable[[], Tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]],
+    score: Callable[[object, pd.DataFrame], Tuple[np.ndarray, np.ndarray]],
+    features: Sequence[str],
+) -> Callable[[object], dict]:
+    # the feature-store split the trainer just read, so this is an mmap away, not another CSV pass
+    #   -> score takes rows in the split's (engineered) layout, which is not always the request layout
+    def build(model: object) -> dict:
+        X_train, X_test, _, _ = load_split()
+        return build_reference(features, X_train, X_test, lambda X: score(model, X))
+
+    return build
+
+
+# -- live sketches --------------------------------------------------------------
+
+
+class NumericSketch:
+    """Running count/mean/variance (Welford, merged with Chan's update) plus bin counts on fixed edges."""
+
+    __slots__ = ("edges", "counts", "n", "mean", "m2", "min", "max")
+
+    def __init__(self, edges: Sequence[float] = ()):
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.counts[bisect_right(self.edges, value)] += 1
+
+    def add_many(self, values: np.ndarray) -> None:
+        if values.size == 0:
+            return
+        self._merge(values.size, float(values.mean()), float(values.var() * values.size), float(values.min()), float(values.max()))
+        counts = np.bincount(np.searchsorted(self.edges, values, side="right"), minlength=len(self.counts))
+        self.counts = [a + b for a, b in zip(self.counts, counts.tolist())]
+
+    def _merge(self, n: int, mean: float, m2: float, lo: float, hi: float) -> None:
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+
+    def merged(self, other: "NumericSketch") -> "NumericSketch":
+        out = NumericSketch(self.edges)
+        out.n, out.mean, out.m2, out.min, out.max = self.n, self.mean, self.m2, self.min, self.max
+        out.counts = list(self.counts)
+        if other.n:
+            out._merge(other.n, other.mean, other.m2, other.min, other.max)
+            out.counts = [a + b for a, b in zip(out.counts, other.counts)]
+        return out
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / self.n) if self.n else 0.0
+
+
+class TopKSketch:
+    """
+    Approximate key counts in bounded memory: exact until 2*capacity keys are
+    tracked, then compacted to the capacity most frequent ones. A key dropped by
+    a compaction starts over if it comes back, so only rare keys are undercounted.
+    """
+
+    __slots__ = ("capacity", "counts", "n", "dropped")
+
+    def __init__(self, capacity: int = 2 * DRIFT_TOP_K):
+        self.capacity = capacity
+        self.counts: Dict[object, int] = {}
+        self.n = 0
+        self.dropped = 0
+
+    def add(self, key) -> None:
+        self.n += 1
+        counts = self.counts
+        counts[key] = counts.get(key, 0) + 1
+        if len(counts) > 2 * self.capacity:
+            self._compact()
+
+    def add_many(self, values: np.ndarray) -> None:
+        if values.size == 0:
+            return
+        keys, counts = np.unique(values, return_counts=True)
+        self.n += int(values.size)
+        if keys.size > self.capacity:
+            # a batch's own long tail would be compacted away anyway, skip it before the Python loop
+            keep = np.argpartition(-counts, self.capacity)[: self.capacity]
+            self.dropped += int(values.size - counts[keep].sum())
+            keys, counts = keys[keep], counts[keep]
+        own = self.counts
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            key = _key(key)
+            own[key] = own.get(key, 0) + count
+        if len(own) > 2 * self.capacity:
+            self._compact()
+
+    def _compact(self) -> None:
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)
+        self.dropped += sum(c for _, c in ranked[self.capacity:])
+        self.counts = dict(ranked[: self.capacity])
+
+    def merged(self, other: "TopKSketch") -> "TopKSketch":
+        out = TopKSketch(self.capacity)
+        out.counts = dict(self.counts)
+        for key, count in other.counts.items():
+            out.counts[key] = out.counts.get(key, 0) + count
+        out.n = self.n + other.n
+        out.dropped = self.dropped + other.dropped
+        if len(out.counts) > 2 * out.capacity:
+            out._compact()
+        return out
+
+    def top(self, k: int) -> List[Tuple[object, int]]:
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+
+class _Window:
+    """One time window of sketches for one model, laid out like its reference."""
+
+    def __init__(self, features: Sequence[str], reference: Optional[dict]):
+        ref_features = (reference or {}).get("features", {})
+        self.started_at = time.time()
+        self.rows = 0
+        self.numeric: Dict[str, NumericSketch] = {}
+        self.categorical: Dict[str, TopKSketch] = {}
+        for name in features:
+            if name in CATEGORICAL_FEATURES:
+                self.categorical[name] = TopKSketch()
+            else:
+                self.numeric[name] = NumericSketch(ref_features.get(name, {}).get("edges", ()))
+        self.confidence = NumericSketch(CONFIDENCE_EDGES)
+        self.positives = 0
+
+    def merged(self, other: "_Window") -> "_Window":
+        out = _Window((), None)
+        out.started_at = min(self.started_at, other.started_at)
+        out.rows = self.rows + other.rows
+        out.numeric = {k: s.merged(other.numeric[k]) for k, s in self.numeric.items()}
+        out.categorical = {k: s.merged(other.categorical[k]) for k, s in self.categorical.items()}
+        out.confidence = self.confidence.merged(other.confidence)
+        out.positives = self.positives + other.positives
+        return out
+
+
+class ModelDrift:
+    """Live sketches for one model, compared against the reference saved with its artifact."""
+
+    def __init__(self, name: str, features: Sequence[str], reference: Optional[dict], version: Optional[str]):
+        self.name = name
+        self.features = list(features)
+        self.reference = reference
+        self.version = version
+        self.lock = threading.Lock()
+        self.previous: Optional[_Window] = None
+        self.current = _Window(self.features, reference)
+
+    def _rotate(self, now: float) -> None:
+        if now - self.current.started_at >= DRIFT_WINDOW_S:
+            # an idle gap longer than a window leaves nothing worth keeping
+            stale = now - self.current.started_at >= 2 * DRIFT_WINDOW_S
+            self.previous = None if stale else self.current
+            self.current = _Window(self.features, self.reference)
+
+    def observe(self, sample: Dict[str, object], label: int, confidence: Optional[float]) -> None:
+        with self.lock:
+            self._rotate(time.time())
+            window = self.current
+            window.rows += 1
+            for name, sketch in window.numeric.items():
+                sketch.add(_clean_one(sample.get(name)))
+            for name, sketch in window.categorical.items():
+                sketch.add(_key(sample.get(name)))
+            if confidence is not None:
+                window.confidence.add(float(confidence))
+            window.positives += int(label == 1)
+
+    def observe_batch(self, frame: pd.DataFrame, labels: np.ndarray, confidences: np.ndarray) -> None:
+        # column arrays are pulled out before the lock, only the sketch updates hold it
+        numeric = {n: _clean(frame[n].to_numpy()) for n in self.current.numeric if n in frame.columns}
+        categorical = {n: frame[n].to_numpy() for n in self.current.categorical if n in frame.columns}
+        conf = _clean(confidences)
+        positives = int(np.count_nonzero(np.asarray(labels) == 1))
+        with self.lock:
+            self._rotate(time.time())
+            window = self.current
+            window.rows += len(frame)
+            for name, values in numeric.items():
+                window.numeric[name].add_many(values)
+            for name, values in categorical.items():
+                window.categorical[name].add_many(values)
+            window.confidence.add_many(conf)
+            window.positives += positives
+
+    def snapshot(self) -> _Window:
+        with self.lock:
+            self._rotate(time.time())
+            if self.previous is None:
+                return self.current.merged(_Window(self.features, self.reference))
+            return self.previous.merged(self.current)
+
+    def report(self, top: int = DRIFT_TOP_K) -> dict:
+        window = self.snapshot()
+        ref_features = (self.reference or {}).get("features", {})
+        scored = window.rows >= DRIFT_MIN_ROWS
+        features: Dict[str, dict] = {}
+
+        for name, sketch in window.numeric.items():
+            entry = {"mean": sketch.mean if sketch.n else None, "std": sketch.std if sketch.n else None}
+            ref = ref_features.get(name)
+            if ref is not None:
+                entry["reference"] = {"mean": ref["mean"], "std": ref["std"]}
+                if scored:
+                    live = np.asarray(sketch.counts, dtype=np.float64) / sketch.n
+                    entry["psi"] = psi(ref["proportions"], live)
+                    entry["ks"] = ks(ref["proportions"], live)
+                    # standardized shift of the mean, in reference standard deviations
+                    entry["mean_shift"] = (sketch.mean - ref["mean"]) / ref["std"] if ref["std"] > 0 else 0.0
+            features[name] = entry
+
+        for name, sketch in window.categorical.items():
+            entry: dict = {
+                "top": [{"key": k, "rows": c} for k, c in sketch.top(top)],
+                "tracked": len(sketch.counts),
+            }
+            ref = ref_features.get(name)
+            if ref is not None and scored:
+                # reference keys + "other": keys the reference never saw in its top-k all land in other
+                expected = list(ref["top"].values()) + [ref["other"]]
+                live = [sketch.counts.get(_key(_parse_key(k)), 0) / sketch.n for k in ref["top"]]
+                live.append(max(0.0, 1.0 - sum(live)))
+                entry["psi"] = psi(expected, live)
+            features[name] = entry
+
+        report: dict = {
+            "model": self.name,
+            "version": self.version,
+            "has_reference": self.reference is not None,
+            "window_started_at": window.started_at,
+            "rows": window.rows,
+            "features": features,
+        }
+        conf = window.confidence
+        prediction: dict = {
+            "positive_rate": window.positives / window.rows if window.rows else None,
+            "mean_confidence": conf.mean if conf.n else None,
+        }
+        ref_prediction = (self.reference or {}).get("prediction")
+        if ref_prediction is not None:
+            prediction["reference"] = {
+                "positive_rate": ref_prediction["positive_rate"],
+                "mean_confidence": ref_prediction["mean_confidence"],
+            }
+            if scored and conf.n:
+                prediction["psi"] = psi(ref_prediction["proportions"], np.asarray(conf.counts) / conf.n)
+        report["prediction"] = prediction
+        return report
+
+
+def _parse_key(key: str):
+    # reference keys went through JSON-safe str(); ports come back as ints
+    try:
+        return int(key)
+    except ValueError:
+        return key
+
+
+class DriftMonitor:
+    """
+    Per-model live sketches. Observing takes one lock and a handful of scalar
+    updates per feature (or one vectorized pass per column for a batch); all
+    scoring happens when a report is asked for.
+    """
+
+    def __init__(self):
+        self.models: Dict[str, ModelDrift] = {}
+        self._lock = threading.Lock()
+
+    def _model(self, name: str, features: Sequence[str], artifact) -> ModelDrift:
+        monitored = self.models.get(name)
+        reference = getattr(artifact, "reference", None)
+        # a new version brings its own reference bins, so live sketches start over with it
+        if monitored is None or monitored.version != artifact.version or monitored.reference is not reference:
+            with self._lock:
+                monitored = self.models.get(name)
+                if monitored is None or monitored.version != artifact.version or monitored.reference is not reference:
+                    monitored = ModelDrift(name, features, reference, artifact.version)
+                    self.models[name] = monitored
+        return monitored
+
+    def observe(self, name: str, features: Sequence[str], artifact, sample: Dict[str, object], label: int, confidence: Optional[float]) -> None:
+        self._model(name, features, artifact).observe(sample, label, confidence)
+
+    def observe_batch(self, name: str, features: Sequence[str], artifact, frame: pd.DataFrame, labels: np.ndarray, confidences: np.ndarray) -> None:
+        self._model(name, features, artifact).observe_batch(frame, labels, confidences)
+
+    def reports(self, names: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        names = list(self.models) if names is None else names
+        return {name: self.models[name].report() for name in names if name in self.models}
+
+
+if __name__ == "__main__":
+    import sys
+
+    # per-request overhead of the sketches
+    #   -> python drift.py 200000
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = np.random.default_rng(7)
+    features = ["dst_port", "src_port", "inter_arrival_time", "stream_1_count", "l4_tcp", "l4_udp"]
+    train = pd.DataFrame(
+        {
+            "dst_port": rng.integers(0, 1024, n),
+            "src_port": rng.integers(1024, 65536, n),
+            "inter_arrival_time": rng.exponential(0.01, n),
+            "stream_1_count": rng.poisson(3, n),
+            "l4_tcp": rng.integers(0, 2, n),
+            "l4_udp": rng.integers(0, 2, n),
+        }
+    )
+    start = time.perf_counter()
+    reference = build_reference(features, train)
+    print(f"reference: {(time.perf_counter() - start) * 1000:.1f} ms for {n} rows")
+
+    class _Artifact:
+        version = "bench"
+
+    artifact = _Artifact()
+    artifact.reference = reference
+    monitor = DriftMonitor()
+    samples = train.iloc[:20_000].to_dict("records")
+    start = time.perf_counter()
+    for sample in samples:
+        monitor.observe("port_probing", features, artifact, sample, 0, 0.1)
+    per_sample = (time.perf_counter() - start) / len(samples)
+    print(f"observe:       {per_sample * 1e6:6.2f} us/request")
+
+    shifted = train.assign(inter_arrival_time=train["inter_arrival_time"] * 3, dst_port=rng.integers(8000, 8100, n))
+    batch = shifted.iloc[:10_000]
+    start = time.perf_counter()
+    monitor.observe_batch("port_probing", features, artifact, batch, np.zeros(len(batch)), np.full(len(batch), 0.9))
+    per_batch = time.perf_counter() - start
+    print(f"observe_batch: {per_batch * 1e6 / len(batch):6.2f} us/row ({per_batch * 1000:.2f} ms per {len(batch)} rows)")
+
+    start = time.perf_counter()
+    report = monitor.reports()["port_probing"]
+    print(f"report:        {(time.perf_counter() - start) * 1000:6.2f} ms")
+    for name, entry in report["features"].items():
+        print(f"  {name:20s} psi={entry.get('psi', float('nan')):.3f} ks={entry.get('ks', float('nan')):.3f}")
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import dos
+import port_probing
+from incremental import evaluate
+
+ENSEMBLE_METHODS = ("vote", "mean", "weighted")
+
+# a cascade's cheap model answers on its own when its probability is outside (low, high)
+CASCADE_LOW = float(os.getenv("CASCADE_LOW", "0.1"))
+CASCADE_HIGH = float(os.getenv("CASCADE_HIGH", "0.9"))
+
+def _decision_tree():
+    from sklearn.tree import DecisionTreeClassifier
+
+    # the cheap families gate a cascade, so their probabilities must mean what they say
+    #   -> no class_weight="balanced" here: it pushes minority-class scores past the cascade band
+    return DecisionTreeClassifier(max_depth=6, random_state=42)
+
+
+def _logistic_regression():
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    # flow rates run up to 1e9, so the features are scaled before the linear model sees them
+    return make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000))
+
+
+# model family -> estimator; the tree ensembles reuse the tuned params of the detector that uses them
+#   -> family names follow MLModel in apps/api/models.py, lower-cased
+FAMILY_ESTIMATORS: Dict[str, Callable[[], object]] = {
+    "gradient_boosting": port_probing.build_model,
+    "random_forest": dos.build_model,
+    "decision_tree": _decision_tree,
+    "logistic_regression": _logistic_regression,
+}
+
+# families cheap enough to sit in front of the tree ensembles
+CHEAP_FAMILIES = ("decision_tree", "logistic_regression")
+
+
+def train_family(module, family: str) -> Callable[[], Tuple[object, Dict[str, float]]]:
+    # same feature-store split as the module's own trainer, different estimator
+    def train() -> Tuple[object, Dict[str, float]]:
+        X_train, X_test, y_train, y_test = module.load_training_split()
+        model = FAMILY_ESTIMATORS[family]()
+        model.fit(X_train, y_train)
+        return model, evaluate(model, X_test, y_test)
+
+    return train
+
+
+# hold-out metrics members can be weighted by, best first
+WEIGHT_METRICS = ("f1_score", "test_accuracy", "accuracy")
+
+
+def model_weights(metrics: Sequence[Optional[Dict[str, float]]]) -> Tuple[Optional[str], List[float]]:
+    """
+    One weight per member, all from the same hold-out metric: the first of
+    WEIGHT_METRICS every member recorded. Equal weights (metric None) if none is shared.
+    """
+    metrics = [m or {} for m in metrics]
+    for key in WEIGHT_METRICS:
+        values = [m.get(key) for m in metrics]
+        if all(isinstance(v, (int, float)) and v > 0 for v in values):
+            return key, [float(v) for v in values]
+    return None, [1.0] * len(metrics)
+
+
+def combine(
+    probas: Sequence[np.ndarray],
+    method: str = "weighted",
+    weights: Optional[Sequence[float]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge per-model attack probabilities into one label and confidence per row.
+      -> vote: majority of the members' labels; confidence is the share voting attack
+         (an even split falls back to the mean probability)
+      -> mean: plain average of the probabilities
+      -> weighted: average weighted by each member's hold-out score
+    """
+    if method not in ENSEMBLE_METHODS:
+        raise ValueError(f"Unknown ensemble method '{method}', expected one of {ENSEMBLE_METHODS}")
+    stacked = np.vstack([np.asarray(p, dtype=np.float64) for p in probas])
+
+    if method == "vote":
+        share = (stacked > 0.5).mean(axis=0)
+        labels = np.where(share == 0.5, stacked.mean(axis=0) > 0.5, share > 0.5)
+        return labels.astype(int), share
+
+    if method == "weighted" and weights is not None:
+        w = np.asarray(weights, dtype=np.float64)
+        confidence = (w / w.sum()) @ stacked
+    else:
+        confidence = stacked.mean(axis=0)
+    return (confidence > 0.5).astype(int), confidence
+
+
+def confident_mask(proba: np.ndarray, low: float = CASCADE_LOW, high: float = CASCADE_HIGH) -> np.ndarray:
+    """Rows the cheap model settles on its own; the rest escalate to the ensemble."""
+    return (proba <= low) | (proba >= high)
+
+
+def _scores(y_true: np.ndarray, labels: np.ndarray) -> Dict[str, float]:
+    from sklearn.metrics import accuracy_score, f1_score
+
+    return {
+        "accuracy": float(accuracy_score(y_true, labels)),
+        "f1_score": float(f1_score(y_true, labels, zero_division=0)),
+    }
+
+
+def benchmark(
+    name: str,
+    members: Sequence[str] = ("random_forest", "gradient_boosting"),
+    gates: Sequence[str] = CHEAP_FAMILIES,
+    method: str = "weighted",
+    repeats: int = 3,
+) -> List[dict]:
+    """
+    Throughput and accuracy of the full ensemble versus each cascade on the
+    model's hold-out split. Every family is trained once on the same split.
+    """
+    module = {"dos": dos, "port_probing": port_probing}[name]
+    X_train, X_test, y_train, y_test = module.load_training_split()
+    y_true = y_test.to_numpy()
+
+    models, scores = {}, {}
+    for family in set(members) | set(gates):
+        model = FAMILY_ESTIMATORS[family]()
+        model.fit(X_train, y_train)
+        models[family] = model
+        scores[family] = evaluate(model, X_test, y_test)
+    _, weights = model_weights([scores[f] for f in members])
+
+    def proba(family: str, X) -> np.ndarray:
+        return models[family].predict_proba(X)[:, 1]
+
+    def run_ensemble(X) -> Tuple[np.ndarray, np.ndarray]:
+        return combine([proba(f, X) for f in members], method, weights)
+
+    def run_cascade(gate: str) -> Tuple[np.ndarray, float]:
+        p = proba(gate, X_test)
+        labels = (p > 0.5).astype(int)
+        escalate = np.flatnonzero(~confident_mask(p))
+        if escalate.size:
+            labels[escalate], _ = run_ensemble(X_test.iloc[escalate])
+        return labels, escalate.size / max(len(p), 1)
+
+    def timed(fn) -> Tuple[object, float]:
+        best, out = float("inf"), None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            out = fn()
+            best = min(best, time.perf_counter() - start)
+        return out, best
+
+    (ens_labels, _), ens_seconds = timed(lambda: run_ensemble(X_test))
+    baseline = _scores(y_true, ens_labels)
+    rows = [
+        {
+            "mode": f"ensemble({'+'.join(members)})",
+            "rows_per_s": len(y_true) / ens_seconds,
+            "escalated": 1.0,
+            **baseline,
+            "speedup": 1.0,
+            "accuracy_delta": 0.0,
+            "f1_delta": 0.0,
+        }
+    ]
+    for gate in gates:
+        (labels, escalated), seconds = timed(lambda: run_cascade(gate))
+        scores = _scores(y_true, labels)
+        rows.append(
+            {
+                "mode": f"cascade({gate} -> ensemble)",
+                "rows_per_s": len(y_true) / seconds,
+                "escalated": escalated,
+                **scores,
+                "speedup": ens_seconds / seconds,
+                "accuracy_delta": scores["accuracy"] - baseline["accuracy"],
+                "f1_delta": scores["f1_score"] - baseline["f1_score"],
+            }
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    # python ensemble.py dos --method weighted
+    parser = argparse.ArgumentParser(description="Ensemble vs. cascade throughput and accuracy")
+    parser.add_argument("model", choices=["dos", "port_probing"])
+    parser.add_argument("--method", choices=ENSEMBLE_METHODS, default="weighted")
+    parser.add_argument("--members", default="random_forest,gradient_boosting")
+    args = parser.parse_args()
+
+    report = benchmark(args.model, members=args.members.split(","), method=args.method)
+    print(f"cascade band: confident when p <= {CASCADE_LOW} or p >= {CASCADE_HIGH}")
+    print(pd.DataFrame(report).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
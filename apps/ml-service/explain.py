@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# explanations per (model, version, feature vector) kept in memory, least recently used dropped first
+EXPLAIN_CACHE_ROWS = int(os.getenv("ML_EXPLAIN_CACHE_ROWS", "10000"))
+# rows explained per vectorized call; a latency budget shrinks them to what still fits
+EXPLAIN_CHUNK_ROWS = int(os.getenv("ML_EXPLAIN_CHUNK_ROWS", "256"))
+# rows in the first chunk of a request, timed to size the chunks after it
+PROBE_ROWS = 16
+# XGBoost threads per explanation, so an explain request can't take every core from /predict
+EXPLAIN_THREADS = int(os.getenv("ML_EXPLAIN_THREADS", "1"))
+
+
+class ExplainUnsupported(ValueError):
+    pass
+
+
+@dataclass
+class Explanation:
+    """Per-row feature contributions in model-input column order; contributions + base add up to the model output."""
+
+    columns: List[str]
+    units: str  # "log_odds" (XGBoost, logistic regression) or "probability" (sklearn trees)
+    contributions: np.ndarray  # (rows, columns), NaN for rows the budget ran out on
+    base: np.ndarray  # (rows,)
+    explained: np.ndarray  # bool per row
+    cache_hits: int = 0
+
+    @property
+    def probability(self) -> np.ndarray:
+        total = np.nansum(self.contributions, axis=1) + self.base
+        if self.units == "log_odds":
+            return 1.0 / (1.0 + np.exp(-total))
+        return total
+
+    def grouped(self, sources: Optional[Dict[str, str]] = None) -> Tuple[List[str], np.ndarray]:
+        """Sum model-input columns into the request fields they were derived from (e.g. is_web -> dst_port)."""
+        if not sources:
+            return list(self.columns), self.contributions
+        names: List[str] = []
+        for column in self.columns:
+            name = sources.get(column, column)
+            if name not in names:
+                names.append(name)
+        out = np.zeros((self.contributions.shape[0], len(names)))
+        for i, column in enumerate(self.columns):
+            out[:, names.index(sources.get(column, column))] += self.contributions[:, i]
+        return names, out
+
+
+class TreeExplainer:
+    """
+    Additive per-feature attributions for the model families the service trains.
+
+    XGBoost: the booster's own pred_contribs (TreeSHAP), on a private copy of
+    the booster so its thread count can be capped without touching /predict;
+    approximate=True asks it for tree-path contributions instead, ~40x cheaper.
+    sklearn trees and forests: tree-path attribution. Every node's change in
+    class-1 probability from its parent is credited to the parent's split
+    feature; the path weights of all trees are stacked into one sparse matrix,
+    so a chunk is one decision_path call and one sparse product. Logistic
+    regression: coef * standardized value, exact for a linear model.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        if hasattr(model, "get_booster"):
+            self.kind, self.units = "xgboost", "log_odds"
+            self.booster = model.get_booster().copy()
+            self.booster.set_param({"nthread": EXPLAIN_THREADS})
+            self.columns = list(self.booster.feature_names or [])
+        elif hasattr(model, "decision_path") and hasattr(model, "classes_"):
+            self.kind, self.units = "tree_path", "probability"
+            self._build_paths(model)
+            self.columns = list(getattr(model, "feature_names_in_", range(model.n_features_in_)))
+        elif hasattr(model, "steps") and hasattr(model.steps[-1][1], "coef_"):
+            self.kind, self.units = "linear", "log_odds"
+            scaler, linear = model.steps[0][1], model.steps[-1][1]
+            if len(model.steps) != 2 or not hasattr(scaler, "scale_"):
+                raise ExplainUnsupported("Only StandardScaler + linear model pipelines can be explained")
+            self.weights = linear.coef_[0] / scaler.scale_
+            self.center = scaler.mean_
+            self.intercept = float(linear.intercept_[0])
+            self.columns = list(getattr(model, "feature_names_in_", range(len(self.weights))))
+        else:
+            raise ExplainUnsupported(f"No explainer for {type(model).__name__}")
+
+    def _build_paths(self, model) -> None:
+        from scipy import sparse
+
+        if list(model.classes_) != [0, 1]:
+            raise ExplainUnsupported("Only binary 0/1 classifiers can be explained")
+        estimators = list(getattr(model, "estimators_", [model]))
+        blocks, bases = [], []
+        for estimator in estimators:
+            tree = estimator.tree_
+            counts = tree.value[:, 0, :]
+            totals = counts.sum(axis=1)
+            p1 = np.divide(counts[:, 1], totals, out=np.zeros_like(totals), where=totals > 0)
+            parent = np.full(tree.node_count, -1)
+            internal = tree.children_left != -1
+            parent[tree.children_left[internal]] = np.flatnonzero(internal)
+            parent[tree.children_right[internal]] = np.flatnonzero(internal)
+            nodes = np.flatnonzero(parent >= 0)
+            blocks.append(
+                sparse.csr_matrix(
+                    (p1[nodes] - p1[parent[nodes]], (nodes, tree.feature[parent[nodes]])),
+                    shape=(tree.node_count, model.n_features_in_),
+                )
+            )
+            bases.append(p1[0])
+        # forests average their trees, so every tree's path weights are scaled by 1/trees up front
+        self.paths = (sparse.vstack(blocks) / len(estimators)).tocsr()
+        self.base_value = float(np.mean(bases))
+
+    def _explain(self, X: pd.DataFrame, approximate: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        if self.kind == "xgboost":
+            from xgboost import DMatrix
+
+            out = self.booster.predict(
+                DMatrix(X, nthread=EXPLAIN_THREADS), pred_contribs=True, approx_contribs=approximate
+            )
+            return out[:, :-1].astype(np.float64), out[:, -1].astype(np.float64)
+        if self.kind == "tree_path":
+            indicator = self.model.decision_path(X)
+            # a forest returns (indicator, per-tree node offsets); the offsets match the stacked layout
+            indicator = indicator[0] if isinstance(indicator, tuple) else indicator
+            return np.asarray((indicator @ self.paths).todense()), np.full(len(X), self.base_value)
+        values = X.to_numpy(dtype=np.float64)
+        return (values - self.center) * self.weights, np.full(len(X), self.intercept)
+
+
+class ExplanationCache:
+    """LRU of explained rows keyed by model, version, method and the exact model-input vector."""
+
+    def __init__(self, max_rows: int = EXPLAIN_CACHE_ROWS):
+        self.max_rows = max_rows
+        self._rows: "OrderedDict[Tuple[str, str, bool, bytes], Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[Tuple[np.ndarray, float]]:
+        with self._lock:
+            hit = self._rows.get(key)
+            if hit is not None:
+                self._rows.move_to_end(key)
+            return hit
+
+    def put(self, key, value: Tuple[np.ndarray, float]) -> None:
+        if self.max_rows <= 0:
+            return
+        with self._lock:
+            self._rows[key] = value
+            self._rows.move_to_end(key)
+            while len(self._rows) > self.max_rows:
+                self._rows.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def row_keys(X: pd.DataFrame) -> List[bytes]:
+    # the float64 bytes of each model-input row; blake2b keeps keys short for wide rows
+    values = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+    return [hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in values]
+
+
+def explain_rows(
+    explainer: TreeExplainer,
+    X: pd.DataFrame,
+    cache: Optional[ExplanationCache],
+    model: str,
+    version: str,
+    deadline: Optional[float] = None,
+    approximate: bool = False,
+    chunk_rows: int = EXPLAIN_CHUNK_ROWS,
+) -> Explanation:
+    """
+    Explain X (model-input columns), answering repeated vectors from cache and the
+    rest in vectorized chunks. Chunks are sized to end by deadline (a
+    time.perf_counter() value); rows that don't fit are left unexplained rather
+    than blowing the budget. The first probe chunk always runs.
+    """
+    X = X.reindex(columns=explainer.columns)
+    n, width = len(X), len(explainer.columns)
+    contributions = np.full((n, width), np.nan)
+    base = np.full(n, np.nan)
+    explained = np.zeros(n, dtype=bool)
+
+    keys = [(model, version, approximate, k) for k in row_keys(X)] if cache is not None else []
+    misses = []
+    for i, key in enumerate(keys):
+        hit = cache.get(key)
+        if hit is None:
+            misses.append(i)
+        else:
+            contributions[i], base[i] = hit
+            explained[i] = True
+    hits = int(explained.sum())
+    if cache is None:
+        misses = list(range(n))
+
+    # identical rows inside one batch are explained once
+    unique: Dict[bytes, List[int]] = {}
+    for i in misses:
+        unique.setdefault(keys[i][-1] if keys else i, []).append(i)
+    first = [rows[0] for rows in unique.values()]
+
+    # the first chunk is a small probe; later ones are sized from its per-row cost to fit what's left
+    start, size, per_row = 0, min(chunk_rows, PROBE_ROWS), None
+    while start < len(first):
+        if deadline is not None and per_row is not None:
+            remaining = deadline - time.perf_counter()
+            size = min(chunk_rows, int(remaining / per_row))
+            if size < 1:
+                break
+        rows = first[start : start + size]
+        started = time.perf_counter()
+        values, bias = explainer._explain(X.iloc[rows], approximate)
+        per_row = (time.perf_counter() - started) / len(rows)
+        start += len(rows)
+        for j, i in enumerate(rows):
+            group = unique[keys[i][-1] if keys else i]
+            contributions[group] = values[j]
+            base[group] = bias[j]
+            explained[group] = True
+            if cache is not None:
+                cache.put(keys[i], (values[j].copy(), float(bias[j])))
+
+    return Explanation(
+        columns=list(explainer.columns),
+        units=explainer.units,
+        contributions=contributions,
+        base=base,
+        explained=explained,
+        cache_hits=hits,
+    )
+
+
+if __name__ == "__main__":
+    import sys
+
+    # cost per row, cold and from cache, and the additivity check, for a trained model
+    #   -> python explain.py dos
+    from model_store import load_artifact
+
+    name = sys.argv[1] if len(sys.argv) > 1 else "port_probing"
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    import dos
+    import port_probing
+
+    module = dos if name.startswith("dos") else port_probing
+    _, X_test, _, _ = module.load_training_split()
+    X = X_test.iloc[:rows]
+    if module is dos:
+        X = dos.pin_ip_codes(X)
+    artifact = load_artifact(name)
+    explainer = TreeExplainer(artifact.model)
+    cache = ExplanationCache()
+
+    start = time.perf_counter()
+    cold = explain_rows(explainer, X, cache, name, artifact.version)
+    cold_s = time.perf_counter() - start
+    start = time.perf_counter()
+    warm = explain_rows(explainer, X, cache, name, artifact.version)
+    warm_s = time.perf_counter() - start
+    start = time.perf_counter()
+    explain_rows(explainer, X.iloc[:1], None, name, artifact.version)
+    single_s = time.perf_counter() - start
+    start = time.perf_counter()
+    explain_rows(explainer, X, None, name, artifact.version, approximate=True)
+    approximate_s = time.perf_counter() - start
+
+    proba = artifact.model.predict_proba(X)[:, 1]
+    print(f"{name}: {explainer.kind}, {len(X)} rows ({len(set(row_keys(X)))} distinct)")
+    print(f"cold:   {cold_s * 1e6 / len(X):8.1f} us/row")
+    print(f"cached: {warm_s * 1e6 / len(X):8.1f} us/row ({warm.cache_hits} hits)")
+    print(f"single: {single_s * 1000:8.2f} ms")
+    print(f"path:   {approximate_s * 1e6 / len(X):8.1f} us/row (approximate)")
+    print(f"max |sum(contributions) + base - predict_proba|: {np.max(np.abs(cold.probability - proba)):.2e}")
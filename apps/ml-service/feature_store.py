@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).parent
+
+# labeled, engineered training matrices, one directory per model and fingerprint
+#   -> data/features/dos/<fingerprint>/{X.npy, y.npy, manifest.json}
+FEATURE_STORE_DIR = Path(os.getenv("FEATURE_STORE_DIR", BASE_DIR / "data" / "features"))
+FEATURE_STORE_ENABLED = os.getenv("FEATURE_STORE", "1").lower() not in ("0", "false", "no")
+
+# bump when the on-disk layout changes so old directories stop matching
+FORMAT_VERSION = 1
+
+# stores kept per model, the one just published included; only splits of the same data and
+#   -> code (e.g. other samplers) count, stale ones are dropped on every publish
+FEATURE_STORE_KEEP = int(os.getenv("FEATURE_STORE_KEEP", "4"))
+
+# both models work in float32 internally (sklearn trees and XGBoost alike),
+#   -> so storing X as float32 halves the pages without changing what they see
+X_DTYPE = np.float32
+Y_DTYPE = np.int8
+
+Split = Tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]
+
+
+@dataclass
+class FeatureSet:
+    """
+    A labeled feature matrix opened read-only with mmap.
+    Rows are stored in train/test split order, so both halves are plain
+    slices: views over the same pages, shared by every process that opens them.
+    """
+
+    name: str
+    path: Path
+    manifest: Dict[str, object]
+    X: np.ndarray
+    y: np.ndarray
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.manifest["columns"])
+
+    @property
+    def train_rows(self) -> int:
+        return int(self.manifest["train_rows"])
+
+    def frame(self, rows: slice = slice(None)) -> Tuple[pd.DataFrame, pd.Series]:
+        # copy=False matters: pandas copies ndarrays into new frames by default
+        X = pd.DataFrame(self.X[rows], columns=self.columns, copy=False)
+        y = pd.Series(self.y[rows], name=self.manifest["label"], copy=False)
+        return X, y
+
+    def split(self) -> Split:
+        X_train, y_train = self.frame(slice(0, self.train_rows))
+        X_test, y_test = self.frame(slice(self.train_rows, None))
+        return X_train, X_test, y_train, y_test
+
+
+def code_digest(*objects) -> str:
+    """Hash the source of the labeling / feature functions, so editing them invalidates the store."""
+    digest = hashlib.sha256()
+    for obj in objects:
+        try:
+            digest.update(inspect.getsource(obj).encode("utf-8"))
+        except (OSError, TypeError):
+            digest.update(repr(obj).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _describe_sources(sources: Sequence[Path]) -> List[dict]:
+    # source files are identified by size + mtime, like the pickle cache in port_probing
+    #   -> hashing a ~1 GB CSV on every start would cost more than the store saves
+    described = []
+    for source in sources:
+        stat = Path(source).stat()
+        described.append({"path": str(Path(source).resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+    return described
+
+
+def _digest(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:20]
+
+
+def fingerprint(name: str, sources: Sequence[Path], parts: Dict[str, object]) -> str:
+    return _digest({"name": name, "format": FORMAT_VERSION, "sources": _describe_sources(sources), "parts": parts})
+
+
+def lineage(name: str, sources: Sequence[Path], parts: Dict[str, object]) -> str:
+    """The fingerprint without the sampler: stores that differ only there are all still current."""
+    parts = {k: v for k, v in parts.items() if k != "sampler"}
+    return _digest({"name": name, "format": FORMAT_VERSION, "sources": _describe_sources(sources), "parts": parts})
+
+
+def store_path(name: str, key: str) -> Path:
+    return FEATURE_STORE_DIR / name / key
+
+
+def open_features(name: str, key: str) -> Optional[FeatureSet]:
+    path = store_path(name, key)
+    manifest_file = path / "manifest.json"
+    if not manifest_file.exists():
+        return None
+    with manifest_file.open("r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return FeatureSet(
+        name=name,
+        path=path,
+        manifest=manifest,
+        X=np.load(path / "X.npy", mmap_mode="r"),
+        y=np.load(path / "y.npy", mmap_mode="r"),
+    )
+
+
+def write_features(
+    name: str, key: str, split: Split, sources: Sequence[Path] = (), parts: Optional[Dict[str, object]] = None
+) -> FeatureSet:
+    X_train, X_test, y_train, y_test = split
+    columns = [str(c) for c in X_train.columns]
+    if list(X_test.columns) != list(X_train.columns):
+        raise ValueError(f"train/test columns differ for '{name}'")
+
+    final = store_path(name, key)
+    tmp = final.parent / f".{key}.tmp-{os.getpid()}-{time.time_ns()}"
+    tmp.mkdir(parents=True, exist_ok=True)
+    try:
+        n_train, n_test = len(X_train), len(X_test)
+        # write straight into the memmap in two slices; no concatenated copy in memory
+        X = np.lib.format.open_memmap(tmp / "X.npy", mode="w+", dtype=X_DTYPE, shape=(n_train + n_test, len(columns)))
+        X[:n_train] = X_train.to_numpy(dtype=X_DTYPE)
+        X[n_train:] = X_test.to_numpy(dtype=X_DTYPE)
+        X.flush()
+        del X
+        y = np.concatenate([y_train.to_numpy(), y_test.to_numpy()]).astype(Y_DTYPE)
+        np.save(tmp / "y.npy", y)
+
+        manifest = {
+            "name": name,
+            "fingerprint": key,
+            "format": FORMAT_VERSION,
+            "created_at": time.time(),
+            "rows": n_train + n_test,
+            "train_rows": n_train,
+            "columns": columns,
+            "source_dtypes": {c: str(t) for c, t in X_train.dtypes.items()},
+            "dtype": np.dtype(X_DTYPE).str,
+            "label": str(y_train.name or "label"),
+            "label_dtype": np.dtype(Y_DTYPE).str,
+            "positive_rows": int(y.sum()),
+            "sources": [str(s) for s in sources],
+            "lineage": lineage(name, sources, parts or {}),
+        }
+        with (tmp / "manifest.json").open("w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        # publishing is one directory rename: readers see all of it or none of it
+        try:
+            os.rename(tmp, final)
+        except OSError:
+            # another job published the same fingerprint first; theirs is identical
+            if not (final / "manifest.json").exists():
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    features = open_features(name, key)
+    prune(name, keep=key, current=features.manifest.get("lineage"))
+    return features
+
+
+def prune(name: str, keep: str, current: Optional[str] = None, max_kept: int = FEATURE_STORE_KEEP) -> List[str]:
+    """
+    Drop stale fingerprints: built from other source files, code or format than
+    the current lineage (all but keep when there is none). Current ones, other
+    samplers' splits that concurrent jobs may be using, stay up to max_kept
+    newest. Jobs that still have a dropped store mapped keep its pages until they close.
+    """
+    removed = []
+    directory = FEATURE_STORE_DIR / name
+    if not directory.exists():
+        return removed
+    live: List[Tuple[float, Path]] = []
+    for path in directory.iterdir():
+        if not path.is_dir() or path.name == keep or path.name.startswith("."):
+            continue
+        try:
+            with (path / "manifest.json").open("r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        if current is not None and manifest.get("lineage") == current:
+            live.append((float(manifest.get("created_at", 0)), path))
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path.name)
+    live.sort(reverse=True)
+    for _, path in live[max(0, max_kept - 1):]:
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path.name)
+    return removed
+
+
+def load_or_build(
+    name: str,
+    sources: Sequence[Path],
+    build: Callable[[], Split],
+    parts: Optional[Dict[str, object]] = None,
+) -> Split:
+    """
+    The train/test split for a model: opened from the store when its fingerprint
+    matches, otherwise built once, written, and opened from disk.
+    """
+    if not FEATURE_STORE_ENABLED:
+        return build()
+
+    missing = [s for s in sources if not Path(s).exists()]
+    if missing:
+        raise FileNotFoundError(f"Training data not found at {missing[0]}")
+
+    key = fingerprint(name, sources, parts or {})
+    features = open_features(name, key)
+    if features is None:
+        features = write_features(name, key, build(), sources, parts or {})
+    return features.split()
+
+
+def describe(names: Iterable[str]) -> List[dict]:
+    found = []
+    for name in names:
+        directory = FEATURE_STORE_DIR / name
+        for manifest_file in sorted(directory.glob("*/manifest.json")):
+            with manifest_file.open("r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            size = sum(p.stat().st_size for p in manifest_file.parent.iterdir())
+            found.append({**manifest, "size_bytes": size})
+    return found
+
+
+if __name__ == "__main__":
+    import sys
+
+    from sampling import model_module
+
+    # python feature_store.py build dos port_probing
+    # python feature_store.py list
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    names = sys.argv[2:] or ["port_probing", "dos"]
+
+    if command == "build":
+        for model_name in names:
+            start = time.perf_counter()
+            model_module(model_name).load_training_split()
+            print(f"{model_name}: ready in {time.perf_counter() - start:.2f}s")
+    for entry in describe(names):
+        print(
+            f"{entry['name']:<14} {entry['fingerprint']}  rows={entry['rows']:,} "
+            f"cols={len(entry['columns'])} size={entry['size_bytes'] / 1e6:.1f} MB"
+        )
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import copy
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+import dos
+import port_probing
+from model_store import MODEL_DIR, ModelArtifact, load_artifact, new_version, save_artifact
+
+BASE_DIR = Path(__file__).parent
+
+# labeled batches waiting to be folded in, one directory per model
+#   -> data/spool/port_probing/*.csv, data/spool/dos/*.csv
+SPOOL_DIR = Path(os.getenv("SPOOL_DIR", BASE_DIR / "data" / "spool"))
+LABEL_COLUMN = "label"
+
+# how much the model grows per update
+#   -> extra boosting rounds on top of the existing XGBoost booster
+#   -> extra trees added to the RandomForest via warm_start
+INCREMENTAL_ROUNDS = int(os.getenv("INCREMENTAL_ROUNDS", "25"))
+INCREMENTAL_TREES = int(os.getenv("INCREMENTAL_TREES", "10"))
+
+# rows sampled from the original training CSV and mixed into every update
+#   -> the simulations only produce attack traffic, so this keeps both classes present
+#   -> and a base hold-out catches the update forgetting what the model already knew
+REPLAY_ROWS = int(os.getenv("INCREMENTAL_REPLAY_ROWS", "20000"))
+
+# a candidate is promoted unless its hold-out F1 drops by more than this
+PROMOTION_TOLERANCE = float(os.getenv("PROMOTION_TOLERANCE", "0.0"))
+
+
+@dataclass
+class IncrementalSpec:
+    features: List[str]
+    prepare: Callable[[pd.DataFrame], pd.DataFrame]
+    base_dataset: Callable[[], pd.DataFrame]
+    # (model, X, y, labels of the original training data or None) -> candidate
+    continue_fit: Callable[[object, pd.DataFrame, pd.Series, Optional[pd.Series]], object]
+
+
+def _port_base() -> pd.DataFrame:
+    df = port_probing.find_port_prob(port_probing.load_dataframe())
+    return df[port_probing.DETECTION_FEATURES].assign(**{LABEL_COLUMN: df["is_port_prob"]})
+
+
+def _dos_base() -> pd.DataFrame:
+    df = dos.find_dos(dos.load_dataframe())
+    return df[dos.DETECTION_FEATURES].assign(**{LABEL_COLUMN: df["is_dos"].astype(int)})
+
+
+def _continue_xgboost(model, X: pd.DataFrame, y: pd.Series, base_labels: Optional[pd.Series] = None):
+    # continued boosting: the new rounds start from the existing booster's margins
+    params = {**model.get_params(), "n_estimators": INCREMENTAL_ROUNDS}
+    candidate = type(model)(**params)
+    candidate.fit(X, y, xgb_model=model.get_booster())
+    return candidate
+
+
+def _continue_forest(model, X: pd.DataFrame, y: pd.Series, base_labels: Optional[pd.Series] = None):
+    # warm start keeps every existing tree and fits only the extra ones on the new batch
+    candidate = copy.deepcopy(model)
+    candidate.set_params(
+        warm_start=True,
+        n_estimators=model.n_estimators + INCREMENTAL_TREES,
+        class_weight=_fixed_class_weight(model.class_weight, base_labels),
+    )
+    candidate.fit(X, y)
+    candidate.set_params(warm_start=False, class_weight=model.class_weight)
+    return candidate
+
+
+def _fixed_class_weight(class_weight, base_labels: Optional[pd.Series]):
+    # "balanced" would reweight every update by its own batch (and sklearn warns about it with warm_start)
+    #   -> the new trees get the weights the original training data gave, or none without that data
+    if class_weight not in ("balanced", "balanced_subsample"):
+        return class_weight
+    if base_labels is None or base_labels.empty:
+        return None
+    counts = base_labels.astype(int).value_counts()
+    return {int(label): len(base_labels) / (len(counts) * n) for label, n in counts.items()}
+
+
+SPECS: Dict[str, IncrementalSpec] = {
+    "port_probing": IncrementalSpec(
+        features=port_probing.DETECTION_FEATURES,
+        prepare=lambda X: X.fillna(0),
+        base_dataset=_port_base,
+        continue_fit=_continue_xgboost,
+    ),
+    "dos": IncrementalSpec(
+        features=dos.DETECTION_FEATURES,
+        prepare=dos.engineer_features,
+        base_dataset=_dos_base,
+        continue_fit=_continue_forest,
+    ),
+}
+
+
+def spool_path(name: str) -> Path:
+    return SPOOL_DIR / name
+
+
+def append_to_spool(name: str, rows: pd.DataFrame) -> Path:
+    """Write one labeled batch (feature columns + `label`) to the model's spool."""
+    spec = SPECS[name]
+    missing = [c for c in spec.features + [LABEL_COLUMN] if c not in rows.columns]
+    if missing:
+        raise ValueError(f"Spool batch for '{name}' is missing columns: {missing}")
+
+    directory = spool_path(name)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{time.strftime('%Y%m%d_%H%M%S')}_{time.time_ns() % 10**9:09d}.csv"
+    tmp_path = path.with_suffix(".tmp")
+    rows[spec.features + [LABEL_COLUMN]].to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def pending_batches(name: str) -> List[Path]:
+    return sorted(spool_path(name).glob("*.csv"))
+
+
+def versions_path(name: str) -> Path:
+    return MODEL_DIR / f"{name}.versions.json"
+
+
+def load_versions(name: str) -> List[dict]:
+    path = versions_path(name)
+    if not path.exists():
+        return []
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _record_version(name: str, entry: dict) -> None:
+    history = load_versions(name)
+    history.append(entry)
+    path = versions_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def evaluate(model, X: pd.DataFrame, y: pd.Series) -> Dict[str, float]:
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+    y_pred = model.predict(X)
+    return {
+        "accuracy": float(accuracy_score(y, y_pred)),
+        "precision": float(precision_score(y, y_pred, zero_division=0)),
+        "recall": float(recall_score(y, y_pred, zero_division=0)),
+        "f1_score": float(f1_score(y, y_pred, zero_division=0)),
+    }
+
+
+def _split(df: pd.DataFrame, test_size: float = 0.2):
+    from sklearn.model_selection import train_test_split
+
+    y = df[LABEL_COLUMN].astype(int)
+    stratify = y if y.nunique() > 1 and y.value_counts().min() >= 2 else None
+    return train_test_split(df, test_size=test_size, random_state=42, stratify=stratify)
+
+
+def update_model(
+    name: str,
+    base: Optional[ModelArtifact] = None,
+    replay_rows: int = REPLAY_ROWS,
+    tolerance: float = PROMOTION_TOLERANCE,
+) -> Dict[str, object]:
+    """
+    Fold every pending spool batch into the current model.
+    The candidate is trained from the existing model (continued boosting /
+    warm-started trees), both models are scored on the same hold-out, and the
+    candidate is only saved as the new artifact when it doesn't regress.
+    """
+    spec = SPECS[name]
+    batches = pending_batches(name)
+    if not batches:
+        return {"model": name, "status": "no_data"}
+
+    base = base or load_artifact(name)
+    if getattr(base.model, "compact", False):
+        # a compacted variant is serving; it can't be refit, so continue from the full artifact
+        base = load_artifact(name)
+    new_rows = pd.concat([pd.read_csv(p) for p in batches], ignore_index=True)
+    new_train, new_holdout = _split(new_rows)
+
+    train_parts, holdout_parts = [new_train], [new_holdout]
+    try:
+        reference = spec.base_dataset()
+    except FileNotFoundError:
+        reference = None
+    base_labels = reference[LABEL_COLUMN] if reference is not None else None
+    if replay_rows > 0:
+        if reference is not None and len(reference):
+            # a different (but reproducible) replay sample for every version
+            sample = reference.sample(
+                n=min(len(reference), 2 * replay_rows), random_state=len(load_versions(name))
+            )
+            replay_train, replay_holdout = _split(sample, test_size=0.5)
+            train_parts.append(replay_train)
+            holdout_parts.append(replay_holdout)
+
+    train = pd.concat(train_parts, ignore_index=True)
+    holdout = pd.concat(holdout_parts, ignore_index=True)
+    if train[LABEL_COLUMN].nunique() < 2:
+        raise ValueError(
+            f"Incremental update for '{name}' needs both classes in the training data; "
+            "spool benign traffic too or make the base dataset available for replay"
+        )
+
+    X_train = spec.prepare(train[spec.features])
+    X_holdout = spec.prepare(holdout[spec.features])
+    y_train = train[LABEL_COLUMN].astype(int)
+    y_holdout = holdout[LABEL_COLUMN].astype(int)
+
+    start = time.perf_counter()
+    candidate = spec.continue_fit(base.model, X_train, y_train, base_labels)
+    fit_seconds = time.perf_counter() - start
+
+    previous_metrics = evaluate(base.model, X_holdout, y_holdout)
+    candidate_metrics = evaluate(candidate, X_holdout, y_holdout)
+    promoted = candidate_metrics["f1_score"] >= previous_metrics["f1_score"] - tolerance
+
+    version = new_version()
+    entry = {
+        "version": version,
+        "parent": base.version,
+        "created_at": time.time(),
+        "promoted": promoted,
+        "new_rows": int(len(new_rows)),
+        "train_rows": int(len(train)),
+        "holdout_rows": int(len(holdout)),
+        "fit_seconds": fit_seconds,
+        "spool_files": [p.name for p in batches],
+        "holdout_metrics": {"previous": previous_metrics, "candidate": candidate_metrics},
+    }
+
+    if promoted:
+        # drift is measured against the original training distribution, not the spooled rows
+        save_artifact(name, candidate, candidate_metrics, version=version, reference=base.reference)
+
+    # consumed batches are kept per version so an update can be audited or replayed
+    archive = spool_path(name) / ("consumed" if promoted else "rejected") / version
+    archive.mkdir(parents=True, exist_ok=True)
+    for path in batches:
+        shutil.move(str(path), archive / path.name)
+
+    _record_version(name, entry)
+    return {"model": name, "status": "promoted" if promoted else "rejected", **entry}
+
+
+if __name__ == "__main__":
+    import sys
+
+    # fold pending spool batches into the saved artifacts
+    #   -> python incremental.py port_probing
+    for model_name in sys.argv[1:] or list(SPECS):
+        result = update_model(model_name)
+        print(json.dumps(result, indent=2, default=str))
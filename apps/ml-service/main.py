@@ -1,55 +1,138 @@
 from __future__ import annotations
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+import hmac
 import logging
+import os
+import random
+import threading
 import time
-from typing import Dict, Optional
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException
-from starlette.responses import Response
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
-from pydantic import BaseModel, Field
+import numpy as np
+import pandas as pd
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from starlette.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, Response
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from pydantic import BaseModel, Field, ValidationError, model_validator
 
+import wire
+import dos
+import drift
+import explain
+import port_probing
 from dos import (
     DETECTION_FEATURES as DOS_FEATURES,
+    SAMPLE_COLUMNS as DOS_COLUMN_NAMES,
     predict_dos,
+    predict_dos_batch,
     train_dos_model,
 )
 from port_probing import (
     DETECTION_FEATURES,
     predict_port_probing,
+    predict_port_probing_batch,
     train_port_probing_model,
 )
+import ensemble
+from ensemble import FAMILY_ESTIMATORS, train_family
+from incremental import SPECS, LABEL_COLUMN, append_to_spool, pending_batches, update_model
+from model_store import MODEL_DIR, ModelArtifact, artifact_path, load_artifact
+from registry import Detector, ModelLoadError, ModelRegistry, UnknownModelError
+
+# required by every /admin route; unset, the routes answer 403
+ADMIN_TOKEN = os.getenv("ML_ADMIN_TOKEN")
+# poll MODEL_DIR for new artifacts every N seconds, 0 disables the watcher
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+
+# detectors loaded during startup; every other registered detector loads on its first request
+PRELOAD_MODELS = [m.strip() for m in os.getenv("ML_PRELOAD_MODELS", "port_probing,dos").split(",") if m.strip()]
+
+# after the startup models, the preload step trains every other family of their attacks that has
+#   -> no artifact yet, so ensembles, cascade gates and the API's mlModels find one; 0 turns it off
+TRAIN_FAMILIES = os.getenv("ML_TRAIN_FAMILIES", "1").lower() not in ("0", "false", "no")
+
+# artifacts saved before drift monitoring get their reference built in the background on first use
+#   -> it reads the training split, so turn it off where the feature store isn't available
+DRIFT_BACKFILL = os.getenv("ML_DRIFT_BACKFILL", "1").lower() not in ("0", "false", "no")
+
+# explanations run on their own small pool, never on the threads /predict uses
+#   -> requests past ML_EXPLAIN_MAX_PENDING (running + queued) wait for a slot until their budget runs out
+EXPLAIN_BUDGET_MS = float(os.getenv("ML_EXPLAIN_BUDGET_MS", "1000"))
+EXPLAIN_MAX_BUDGET_MS = float(os.getenv("ML_EXPLAIN_MAX_BUDGET_MS", "10000"))
+EXPLAIN_WORKERS = int(os.getenv("ML_EXPLAIN_WORKERS", "1"))
+EXPLAIN_MAX_PENDING = int(os.getenv("ML_EXPLAIN_MAX_PENDING", "4"))
+
+# startup timings in /readyz are measured from here (just after the imports)
+STARTED_AT = time.perf_counter()
+
+async def _preload_models(app: FastAPI) -> None:
+    # one at a time: loading both at once would just split the same CPU and double peak memory
+    for name in PRELOAD_MODELS:
+        state = app.state.startup[name]
+        state.update(state="loading", started_after_s=round(time.perf_counter() - STARTED_AT, 3))
+        try:
+            # the only place a missing artifact is trained; requests answer 503 instead
+            artifact = await asyncio.to_thread(REGISTRY.get, name, True)
+        except UnknownModelError:
+            logger.error("ML_PRELOAD_MODELS names unknown model '%s'", name)
+            state.update(state="failed", error=f"unknown model '{name}'")
+            continue
+        except ModelLoadError as exc:
+            logger.error("%s model load failed: %s", name, exc)
+            state.update(state="failed", error=str(exc))
+            continue
+        state.update(state="ready", ready_after_s=round(time.perf_counter() - STARTED_AT, 3))
+        logger.info(
+            "%s model loaded version=%s after=%ss metrics=%s",
+            name, artifact.version, state["ready_after_s"], artifact.metrics,
+        )
+    if TRAIN_FAMILIES:
+        await _train_missing_families()
+
+async def _train_missing_families() -> None:
+    # after readiness, so a fresh deployment serves its default models while the rest train
+    attacks = sorted({REGISTRY.detectors[n].attack for n in PRELOAD_MODELS if n in REGISTRY.detectors})
+    for attack in attacks:
+        for detector in REGISTRY.families(attack):
+            if _has_artifact(detector):
+                continue
+            try:
+                artifact = await asyncio.to_thread(REGISTRY.get, detector.name, True)
+            except ModelLoadError as exc:
+                logger.error("%s model training failed: %s", detector.name, exc)
+                continue
+            logger.info("%s model trained version=%s metrics=%s", detector.name, artifact.version, artifact.metrics)
+
+def _has_artifact(detector: Detector) -> bool:
+    return REGISTRY.peek(detector.name) is not None or artifact_path(detector.name).exists()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.model = None
-    app.state.model_metrics = None
-    app.state.dos_model = None
-    app.state.dos_model_metrics = None
-    app.state.startup_error = None
-    app.state.startup_errors = {}
-    try:
-        app.state.model, app.state.model_metrics = train_port_probing_model()
-        logger.info("ML model loaded successfully with metrics: %s", app.state.model_metrics)
-    except FileNotFoundError as exc:
-        app.state.startup_error = str(exc)
-        app.state.startup_errors["port_probing"] = str(exc)
-        logger.error("Model file not found: %s", exc)
-    except Exception as exc:
-        app.state.startup_error = f"Failed to load model: {exc}"
-        app.state.startup_errors["port_probing"] = str(exc)
-        logger.error("Model load failed: %s", exc)
-    try:
-        app.state.dos_model, app.state.dos_model_metrics = train_dos_model()
-        logger.info("DoS ML model loaded successfully with metrics: %s", app.state.dos_model_metrics)
-    except FileNotFoundError as exc:
-        app.state.startup_errors["dos"] = str(exc)
-        logger.error("DoS model file not found: %s", exc)
-    except Exception as exc:
-        app.state.startup_errors["dos"] = f"Failed to load model: {exc}"
-        logger.error("DoS model load failed: %s", exc)
+    app.state.shadow_models = {}
+    app.state.reload_status = {}
+    app.state.reload_tasks = {}
+    # one lock per model: manual reloads, promotions, updates and the watcher never swap concurrently
+    app.state.model_locks = {}
+    # models load behind the running server; /readyz turns 200 once they're done
+    app.state.startup = {name: {"state": "pending"} for name in PRELOAD_MODELS}
+    app.state.listening_after_s = round(time.perf_counter() - STARTED_AT, 3)
+    preload = asyncio.create_task(_preload_models(app))
+
+    watcher = None
+    if MODEL_WATCH_INTERVAL > 0:
+        watcher = asyncio.create_task(_watch_model_dir(MODEL_WATCH_INTERVAL))
     yield
+    preload.cancel()
+    if watcher is not None:
+        watcher.cancel()
 
 app = FastAPI(
     title="ML Port Probing Service", version="0.1.0", lifespan=lifespan
@@ -67,6 +150,69 @@ REQUEST_COUNT = Counter(
 REQUEST_LATENCY = Histogram(
     "ml_service_request_duration_seconds", "ML service request latency", ["path", "method"]
 )
+MODEL_INFERENCE_LATENCY = Histogram(
+    "ml_service_model_inference_seconds", "Model inference latency", ["model", "role"]
+)
+MODEL_RELOADS = Counter(
+    "ml_service_model_reloads_total", "Model artifact reloads", ["model", "role", "status"]
+)
+SHADOW_PREDICTIONS = Counter(
+    "ml_service_shadow_predictions_total", "Predictions scored by a shadow model", ["model"]
+)
+SHADOW_DISAGREEMENTS = Counter(
+    "ml_service_shadow_disagreements_total", "Shadow predictions whose label differs from the primary", ["model"]
+)
+SHADOW_DISAGREEMENT_RATIO = Gauge(
+    "ml_service_shadow_disagreement_ratio", "Share of shadow predictions that disagree with the primary", ["model"]
+)
+MODEL_LOADS = Counter(
+    "ml_service_model_loads_total", "Lazy model loads", ["model", "source", "status"]
+)
+MODEL_LOAD_LATENCY = Histogram(
+    "ml_service_model_load_seconds", "Time to load (or train) a model on first use", ["model"]
+)
+MODEL_EVICTIONS = Counter(
+    "ml_service_model_evictions_total", "Models evicted from memory by the LRU budget", ["model"]
+)
+RESIDENT_MODEL_BYTES = Gauge(
+    "ml_service_resident_model_bytes", "Artifact size of every model currently held in memory"
+)
+CASCADE_ROWS = Counter(
+    "ml_service_cascade_rows_total", "Rows answered by a cascade's cheap model or escalated", ["attack", "stage"]
+)
+FEATURE_DRIFT_PSI = Gauge(
+    "ml_service_feature_drift_psi", "PSI of live feature values against the training reference", ["model", "feature"]
+)
+FEATURE_DRIFT_KS = Gauge(
+    "ml_service_feature_drift_ks", "KS distance of live feature values against the training reference", ["model", "feature"]
+)
+FEATURE_MEAN_SHIFT = Gauge(
+    "ml_service_feature_mean_shift", "Live feature mean minus reference mean, in reference std devs", ["model", "feature"]
+)
+PREDICTION_DRIFT_PSI = Gauge(
+    "ml_service_prediction_drift_psi", "PSI of live confidences against the hold-out reference", ["model"]
+)
+PREDICTION_POSITIVE_RATE = Gauge(
+    "ml_service_prediction_positive_rate", "Share of live predictions flagged as attacks", ["model"]
+)
+DRIFT_WINDOW_ROWS = Gauge(
+    "ml_service_drift_window_rows", "Rows in the live drift sketches", ["model"]
+)
+
+EXPLAIN_ROWS = Counter(
+    "ml_service_explain_rows_total", "Rows explained, by where the answer came from", ["model", "source"]
+)
+EXPLAIN_LATENCY = Histogram(
+    "ml_service_explain_seconds", "Explanation request latency, queueing included", ["model"]
+)
+
+DRIFT = drift.DriftMonitor()
+
+EXPLAIN_CACHE = explain.ExplanationCache()
+EXPLAIN_EXECUTOR = ThreadPoolExecutor(max_workers=EXPLAIN_WORKERS, thread_name_prefix="explain")
+EXPLAIN_SLOTS = asyncio.Semaphore(EXPLAIN_MAX_PENDING)
+# detector name -> (artifact version, explainer); rebuilt when the version changes
+_EXPLAINERS: Dict[str, Tuple[str, explain.TreeExplainer]] = {}
 
 @app.middleware("http")
 async def strip_ml_prefix(request, call_next):
@@ -88,7 +234,29 @@ class TrafficSample(BaseModel):
 class PredictionResponse(BaseModel):
     is_port_probe: bool
     confidence: Optional[float] = None
-    model_metrics: Optional[dict] = None
+    model_version: Optional[str] = None
+
+class TrafficBatch(BaseModel):
+    """Columnar TrafficSample batch: one list per feature, all the same length."""
+
+    dst_port: List[int]
+    src_port: List[int]
+    inter_arrival_time: List[float]
+    stream_1_count: List[int]
+    l4_tcp: List[bool]
+    l4_udp: List[bool]
+
+    @model_validator(mode="after")
+    def same_length(self) -> "TrafficBatch":
+        lengths = {len(v) for v in self.model_dump().values()}
+        if len(lengths) > 1:
+            raise ValueError("all feature columns must have the same length")
+        return self
+
+class BatchPredictionResponse(BaseModel):
+    is_port_probe: List[bool]
+    confidence: List[float]
+    model_version: Optional[str] = None
 
 class DoSSample(BaseModel):
     dst_port: int = Field(..., ge=0, le=65535, description="Destination port")
@@ -100,10 +268,45 @@ class DoSSample(BaseModel):
     src_ip: str = Field(..., description="Source IP address")
     dst_ip: str = Field(..., description="Destination IP address")
 
+class DoSBatch(BaseModel):
+    """Columnar DoSSample batch: one list per feature, all the same length."""
+
+    dst_port: List[int]
+    flow_packets_s: List[float]
+    flow_bytes_s: List[float]
+    total_fwd_packet: List[int]
+    flow_duration: List[float]
+    total_length_of_fwd_packet: List[float]
+    src_ip: List[str]
+    dst_ip: List[str]
+
+    @model_validator(mode="after")
+    def same_length(self) -> "DoSBatch":
+        lengths = {len(v) for v in self.model_dump().values()}
+        if len(lengths) > 1:
+            raise ValueError("all feature columns must have the same length")
+        return self
+
 class DoSPredictionResponse(BaseModel):
     is_dos: bool
     confidence: Optional[float] = None
-    model_metrics: Optional[dict] = None
+    model_version: Optional[str] = None
+
+class DoSBatchPredictionResponse(BaseModel):
+    is_dos: List[bool]
+    confidence: List[float]
+    model_version: Optional[str] = None
+
+def _batch_openapi(schema: type) -> Dict[str, object]:
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": schema.model_json_schema()},
+                wire.CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    }
 
 @app.get("/")
 @app.get("/ml")
@@ -112,9 +315,22 @@ def index() -> Dict[str, str]:
     return {
         "message": "ML service is running",
         "predict_endpoint": "/ml/predict",
+        "predict_batch_endpoint": "/ml/predict/batch",
         "dos_predict_endpoint": "/ml/dos/predict",
+        "dos_predict_batch_endpoint": "/ml/dos/predict/batch",
+        "attack_predict_endpoint": "/ml/predict/{attack}",
+        "attack_predict_batch_endpoint": "/ml/predict/{attack}/batch",
+        "attack_ensemble_endpoint": "/ml/predict/{attack}/ensemble",
+        "models_endpoint": "/ml/models",
         "health_endpoint": "/ml/health",
+        "liveness_endpoint": "/ml/livez",
+        "readiness_endpoint": "/ml/readyz",
         "metrics_endpoint": "/ml/metrics",
+        "drift_endpoint": "/ml/drift",
+        "explain_endpoint": "/ml/explain",
+        "dos_explain_endpoint": "/ml/dos/explain",
+        "attack_explain_endpoint": "/ml/explain/{attack}",
+        "attack_explain_batch_endpoint": "/ml/explain/{attack}/batch",
     }
 
 @app.get("/health")
@@ -122,43 +338,824 @@ def index() -> Dict[str, str]:
 def health() -> Dict[str, object]:
     REQUEST_COUNT.labels(path="/health", method="GET", status=200).inc()
     REQUEST_LATENCY.labels(path="/health", method="GET").observe(0.0)
+    # model_ready is false for detectors that simply haven't been asked for yet
     return {
         "status": "ok",
-        "port_probing": {
-            "model_ready": app.state.model is not None,
-            "startup_error": app.state.startup_errors.get("port_probing"),
-            "features": DETECTION_FEATURES,
-        },
-        "dos": {
-            "model_ready": app.state.dos_model is not None,
-            "startup_error": app.state.startup_errors.get("dos"),
-            "features": DOS_FEATURES,
+        **{
+            name: {
+                key: value
+                for key, value in REGISTRY.describe(name).items()
+                if key in ("attack", "family", "model_ready", "version", "load_error", "features")
+            }
+            for name in REGISTRY.detectors
         },
     }
 
+@app.get("/livez")
+@app.get("/ml/livez")
+async def livez() -> Dict[str, str]:
+    # liveness only says the event loop answers; it never waits on models
+    return {"status": "ok"}
+
+@app.get("/readyz")
+@app.get("/ml/readyz")
+async def readyz() -> JSONResponse:
+    """
+    503 while startup models are still loading, and when every one of them failed;
+    200 once each is ready or has failed and at least one is ready.
+    """
+    startup = app.state.startup
+    done = all(s["state"] in ("ready", "failed") for s in startup.values())
+    failed = [name for name, s in startup.items() if s["state"] == "failed"]
+    # a pod that can't score anything must not receive traffic
+    unavailable = done and bool(startup) and len(failed) == len(startup)
+    status = "loading" if not done else ("unavailable" if unavailable else ("degraded" if failed else "ready"))
+    body = {
+        "status": status,
+        "listening_after_s": app.state.listening_after_s,
+        "models": startup,
+    }
+    return JSONResponse(body, status_code=200 if done and not unavailable else 503)
+
+@app.get("/readyz/{name}")
+@app.get("/ml/readyz/{name}")
+async def readyz_model(name: str) -> JSONResponse:
+    """Per-model readiness: 200 only while the detector is resident."""
+    if name not in REGISTRY.detectors:
+        raise HTTPException(status_code=404, detail=f"Unknown model '{name}'")
+    described = REGISTRY.describe(name)
+    state = "ready" if described["model_ready"] else ("loading" if described["loading"] else "not_loaded")
+    if described["load_error"] and state != "ready":
+        state = "failed"
+    body = {"model": name, "state": state, "load_error": described["load_error"]}
+    return JSONResponse(body, status_code=200 if state == "ready" else 503)
+
+@app.get("/models")
+@app.get("/ml/models")
+def models_metadata() -> Dict[str, object]:
+    """Model versions and training metrics; kept out of the per-prediction responses."""
+    models = {}
+    for name in REGISTRY.detectors:
+        artifact = REGISTRY.peek(name)
+        models[name] = {**REGISTRY.describe(name), "metrics": artifact.metrics if artifact else None}
+    return {
+        **models,
+        "resident_bytes": REGISTRY.resident_bytes(),
+        "memory_budget_bytes": REGISTRY.memory_budget,
+    }
+
 @app.get("/metrics")
 @app.get("/ml/metrics")
 def metrics():
+    # drift scores are computed per scrape from the sketches, never on the request path
+    _export_drift(DRIFT.reports())
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
+@app.get("/drift")
+@app.get("/ml/drift")
+def drift_report(model: Optional[str] = None) -> Dict[str, object]:
+    """Live feature and confidence sketches per model, next to the training reference they're scored against."""
+    if model is not None:
+        _check_model_name(model)
+    return {
+        "window_s": drift.DRIFT_WINDOW_S,
+        "min_rows": drift.DRIFT_MIN_ROWS,
+        "models": DRIFT.reports([model] if model is not None else None),
+    }
+
 @app.post("/predict", response_model=PredictionResponse)
 @app.post("/ml/predict", response_model=PredictionResponse)
-def predict(sample: TrafficSample) -> PredictionResponse:
+def predict(sample: TrafficSample, background_tasks: BackgroundTasks) -> PredictionResponse:
+    label, confidence, model_version = _predict_one(
+        REGISTRY.detectors["port_probing"], sample, background_tasks, path="/predict"
+    )
+    return PredictionResponse(
+        is_port_probe=bool(label),
+        confidence=confidence,
+        model_version=model_version,
+    )
+
+@app.post(
+    "/predict/batch",
+    response_model=BatchPredictionResponse,
+    openapi_extra=_batch_openapi(TrafficBatch),
+)
+@app.post(
+    "/ml/predict/batch",
+    response_model=BatchPredictionResponse,
+    openapi_extra=_batch_openapi(TrafficBatch),
+)
+async def predict_batch(request: Request):
+    """
+    Columnar batch scoring. Takes a TrafficBatch as JSON or as an
+    application/x-ml-batch body (see wire.py) and answers in the format the
+    caller lists in Accept.
+    """
+    return await _score_batch(request, REGISTRY.detectors["port_probing"], path="/predict/batch")
+
+@app.post("/dos/predict", response_model=DoSPredictionResponse)
+@app.post("/ml/dos/predict", response_model=DoSPredictionResponse)
+def predict_dos_attack(sample: DoSSample, background_tasks: BackgroundTasks) -> DoSPredictionResponse:
+    label, confidence, model_version = _predict_one(
+        REGISTRY.detectors["dos"], sample, background_tasks, path="/dos/predict"
+    )
+    return DoSPredictionResponse(
+        is_dos=bool(label),
+        confidence=confidence,
+        model_version=model_version,
+    )
+
+@app.post(
+    "/dos/predict/batch",
+    response_model=DoSBatchPredictionResponse,
+    openapi_extra=_batch_openapi(DoSBatch),
+)
+@app.post(
+    "/ml/dos/predict/batch",
+    response_model=DoSBatchPredictionResponse,
+    openapi_extra=_batch_openapi(DoSBatch),
+)
+async def predict_dos_batch_route(request: Request):
+    return await _score_batch(request, REGISTRY.detectors["dos"], path="/dos/predict/batch")
+
+@app.post("/predict/{attack}")
+@app.post("/ml/predict/{attack}")
+async def predict_attack(
+    attack: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    family: Optional[str] = None,
+) -> Dict[str, object]:
+    """
+    Any registered detector, by attack type (or alias, e.g. DDOS) and optional
+    model family. The body is that detector's single-sample schema; the model
+    is loaded on the first request for it.
+    """
+    detector = _resolve_detector(attack, family)
+    sample = await _read_sample(request, detector.sample_schema)
+    label, confidence, model_version = await run_in_threadpool(
+        _predict_one, detector, sample, background_tasks, f"/predict/{detector.attack}"
+    )
+    return {
+        "attack": detector.attack,
+        "family": detector.family,
+        "label": bool(label),
+        "confidence": confidence,
+        "model_version": model_version,
+    }
+
+@app.post("/predict/{attack}/batch")
+@app.post("/ml/predict/{attack}/batch")
+async def predict_attack_batch(attack: str, request: Request, family: Optional[str] = None):
+    detector = _resolve_detector(attack, family)
+    return await _score_batch(request, detector, path=f"/predict/{detector.attack}/batch", label_key="label")
+
+@app.post("/explain")
+@app.post("/ml/explain")
+async def explain_port_probe(
+    sample: TrafficSample, budget_ms: Optional[float] = None, method: str = "shap", top: Optional[int] = None
+) -> Dict[str, object]:
+    """Per-feature contributions behind a port-probing verdict; see _explain for the options."""
+    detector = REGISTRY.detectors["port_probing"]
+    return await _explain_one(detector, sample, budget_ms, method, top, label_key=detector.label_key)
+
+@app.post("/dos/explain")
+@app.post("/ml/dos/explain")
+async def explain_dos(
+    sample: DoSSample, budget_ms: Optional[float] = None, method: str = "shap", top: Optional[int] = None
+) -> Dict[str, object]:
+    detector = REGISTRY.detectors["dos"]
+    return await _explain_one(detector, sample, budget_ms, method, top, label_key=detector.label_key)
+
+@app.post("/explain/{attack}")
+@app.post("/ml/explain/{attack}")
+async def explain_attack(
+    attack: str,
+    request: Request,
+    family: Optional[str] = None,
+    budget_ms: Optional[float] = None,
+    method: str = "shap",
+    top: Optional[int] = None,
+) -> Dict[str, object]:
+    detector = _resolve_detector(attack, family)
+    sample = await _read_sample(request, detector.sample_schema)
+    return await _explain_one(detector, sample, budget_ms, method, top, label_key="label")
+
+@app.post("/explain/{attack}/batch")
+@app.post("/ml/explain/{attack}/batch")
+async def explain_attack_batch(
+    attack: str,
+    request: Request,
+    family: Optional[str] = None,
+    budget_ms: Optional[float] = None,
+    method: str = "shap",
+) -> Dict[str, object]:
+    """
+    Columnar contributions for a batch (the detector's batch schema, JSON or
+    application/x-ml-batch). Rows the budget didn't reach come back with
+    explained=false and null contributions; "complete" says whether any did.
+    """
+    detector = _resolve_detector(attack, family)
+    columns = await _read_batch(request, detector.batch_schema)
+    frame = detector.to_frame(columns)
+    artifact, explanation, duration = await _explain(detector, frame, budget_ms, method)
+    names, contributions = explanation.grouped(detector.input_fields)
+    proba = explanation.probability
+    explained = explanation.explained
+    return {
+        "attack": detector.attack,
+        "family": detector.family,
+        "model_version": artifact.version,
+        "method": method,
+        "units": explanation.units,
+        "features": names,
+        "contributions": {
+            name: [float(v) if ok else None for v, ok in zip(contributions[:, i].tolist(), explained.tolist())]
+            for i, name in enumerate(names)
+        },
+        "base_value": [float(v) if ok else None for v, ok in zip(explanation.base.tolist(), explained.tolist())],
+        "label": [bool(p > 0.5) if ok else None for p, ok in zip(proba.tolist(), explained.tolist())],
+        "confidence": [float(p) if ok else None for p, ok in zip(proba.tolist(), explained.tolist())],
+        "explained": explained.tolist(),
+        "complete": bool(explained.all()),
+        "cache_hits": explanation.cache_hits,
+        "duration_ms": round(duration * 1000, 3),
+    }
+
+@app.post("/predict/{attack}/ensemble")
+@app.post("/ml/predict/{attack}/ensemble")
+async def predict_attack_ensemble(
+    attack: str,
+    request: Request,
+    families: Optional[str] = None,
+    method: str = "weighted",
+    cascade: Optional[str] = None,
+    low: float = ensemble.CASCADE_LOW,
+    high: float = ensemble.CASCADE_HIGH,
+):
+    """
+    Score a batch with several model families of one attack at once and merge
+    them (vote, mean, or weighted by hold-out score). With cascade=<family>,
+    that cheap model answers the rows it is sure about (p <= low or p >= high)
+    and only the rest go to the ensemble.
+    """
     start = time.perf_counter()
-    path = "/predict"
-    method = "POST"
-    if app.state.model is None:
+    path = f"/predict/{_resolve_detector(attack, None).attack}/ensemble"
+    if method not in ensemble.ENSEMBLE_METHODS:
+        raise HTTPException(status_code=422, detail=f"method must be one of {list(ensemble.ENSEMBLE_METHODS)}")
+    if not 0 <= low <= high <= 1:
+        raise HTTPException(status_code=422, detail="Need 0 <= low <= high <= 1")
+
+    gate = _resolve_detector(attack, cascade) if cascade else None
+    missing: List[str] = []
+    if families:
+        members = [_resolve_detector(attack, f.strip()) for f in families.split(",") if f.strip()]
+    else:
+        # by default the expensive tree ensembles that are trained; the cheap families are there to gate them
+        candidates = [
+            d for d in REGISTRY.families(_resolve_detector(attack, None).attack)
+            if d.family not in ensemble.CHEAP_FAMILIES
+        ]
+        members = [d for d in candidates if _has_artifact(d)]
+        missing = [d.family for d in candidates if d not in members]
+        if candidates and not members:
+            raise HTTPException(
+                status_code=503, detail=f"No ensemble family is trained yet; missing {missing}"
+            )
+    if not members:
+        raise HTTPException(status_code=422, detail="The ensemble needs at least one member family")
+
+    # every family of an attack takes the same request schema
+    columns = await _read_batch(request, members[0].batch_schema)
+    frame = members[0].to_frame(columns)
+    # the gate resolves with the members, so a missing artifact is a 503 here, not a 500 below
+    artifacts = await asyncio.gather(*(_aget_model(d) for d in members + ([gate] if gate else [])))
+    gate_artifact = artifacts.pop() if gate is not None else None
+    n = len(frame)
+    labels = np.zeros(n, dtype=int)
+    confidences = np.zeros(n, dtype=float)
+    escalate = np.arange(n)
+    meta: Dict[str, object] = {
+        "attack": members[0].attack,
+        "method": method,
+        "families": [d.family for d in members],
+        "model_versions": {d.family: a.version for d, a in zip(members, artifacts)},
+    }
+    if missing:
+        meta["missing_families"] = missing
+
+    try:
+        if gate is not None:
+            gate_labels, gate_proba = await run_in_threadpool(gate.predict_batch, gate_artifact.model, frame)
+            confident = ensemble.confident_mask(gate_proba, low, high)
+            labels[confident] = gate_labels[confident]
+            confidences[confident] = gate_proba[confident]
+            escalate = np.flatnonzero(~confident)
+            CASCADE_ROWS.labels(attack=gate.attack, stage="early_exit").inc(int(confident.sum()))
+            CASCADE_ROWS.labels(attack=gate.attack, stage="escalated").inc(int(escalate.size))
+            meta["cascade"] = {
+                "family": gate.family,
+                "version": gate_artifact.version,
+                "early_exit": int(confident.sum()),
+                "escalated": int(escalate.size),
+            }
+
+        if escalate.size:
+            subset = frame.iloc[escalate] if escalate.size < n else frame
+            # members score in parallel threads; the tree predictors release the GIL
+            outputs = await asyncio.gather(
+                *(run_in_threadpool(d.predict_batch, a.model, subset) for d, a in zip(members, artifacts))
+            )
+            weight_metric, weights = ensemble.model_weights([a.metrics for a in artifacts])
+            if method == "weighted":
+                meta["weight_metric"] = weight_metric
+            labels[escalate], confidences[escalate] = ensemble.combine(
+                [proba for _, proba in outputs], method, weights
+            )
+    except Exception as exc:
+        REQUEST_COUNT.labels(path=path, method="POST", status=500).inc()
+        raise HTTPException(status_code=500, detail=f"Failed to run ensemble inference: {exc}")
+
+    response = _batch_response(request, members[0].label_key, labels, confidences, meta)
+    duration = time.perf_counter() - start
+    REQUEST_COUNT.labels(path=path, method="POST", status=200).inc()
+    REQUEST_LATENCY.labels(path=path, method="POST").observe(duration)
+    logger.info(
+        "%s ensemble completed rows=%d families=%s cascade=%s escalated=%d duration_ms=%.2f",
+        members[0].attack,
+        n,
+        ",".join(meta["families"]),
+        gate.family if gate else "-",
+        int(escalate.size),
+        duration * 1000,
+    )
+    return response
+
+class ReloadRequest(BaseModel):
+    path: Optional[str] = Field(
+        default=None, description="Artifact file inside MODEL_DIR; defaults to <name>.joblib"
+    )
+    shadow: bool = Field(
+        default=False, description="Load as a shadow candidate instead of replacing the primary model"
+    )
+    sample_rate: Optional[float] = Field(
+        default=None, ge=0, le=1, description="Share of traffic the shadow model scores"
+    )
+
+@app.get("/admin/models")
+@app.get("/ml/admin/models")
+def list_models(x_admin_token: Optional[str] = Header(default=None)) -> Dict[str, object]:
+    _check_admin(x_admin_token)
+    return {
+        name: {
+            **REGISTRY.describe(name),
+            "reload": app.state.reload_status.get(name),
+            "shadow": _describe_shadow(name),
+        }
+        for name in REGISTRY.detectors
+    }
+
+@app.post("/admin/models/{name}/reload", status_code=202)
+@app.post("/ml/admin/models/{name}/reload", status_code=202)
+async def reload_model(
+    name: str,
+    body: Optional[ReloadRequest] = None,
+    x_admin_token: Optional[str] = Header(default=None),
+) -> Dict[str, object]:
+    _check_admin(x_admin_token)
+    _check_model_name(name)
+    body = body or ReloadRequest()
+    path = _resolve_artifact(name, body.path)
+
+    running = app.state.reload_tasks.get(name)
+    if running is not None and not running.done():
+        raise HTTPException(status_code=409, detail=f"A reload of '{name}' is already in progress")
+
+    # load off the request path; the swap happens once the artifact is fully deserialized
+    app.state.reload_status[name] = {"state": "loading", "path": str(path), "shadow": body.shadow}
+    app.state.reload_tasks[name] = asyncio.create_task(
+        _reload_model(name, path, shadow=body.shadow, sample_rate=body.sample_rate)
+    )
+    return {"status": "loading", "model": name, "path": str(path), "shadow": body.shadow}
+
+@app.post("/admin/models/{name}/promote")
+@app.post("/ml/admin/models/{name}/promote")
+async def promote_shadow(name: str, x_admin_token: Optional[str] = Header(default=None)) -> Dict[str, object]:
+    _check_admin(x_admin_token)
+    _check_model_name(name)
+    async with _model_lock(name):
+        shadow = app.state.shadow_models.pop(name, None)
+        if shadow is None:
+            raise HTTPException(status_code=404, detail=f"No shadow model loaded for '{name}'")
+        await asyncio.to_thread(_install_model, name, shadow["artifact"])
+    logger.info("promoted shadow model=%s version=%s", name, shadow["artifact"].version)
+    return {"status": "promoted", "model": name, "version": shadow["artifact"].version}
+
+@app.delete("/admin/models/{name}/shadow")
+@app.delete("/ml/admin/models/{name}/shadow")
+async def drop_shadow(name: str, x_admin_token: Optional[str] = Header(default=None)) -> Dict[str, object]:
+    _check_admin(x_admin_token)
+    _check_model_name(name)
+    async with _model_lock(name):
+        shadow = app.state.shadow_models.pop(name, None)
+    return {"status": "dropped" if shadow else "absent", "model": name}
+
+class SpoolBatch(BaseModel):
+    columns: Dict[str, List[object]] = Field(
+        ..., description="Columnar batch in the same shape /predict/batch or /dos/predict/batch take"
+    )
+    label: Optional[int] = Field(default=None, ge=0, le=1, description="Label for every row")
+    labels: Optional[List[int]] = Field(default=None, description="Per-row labels")
+
+@app.post("/admin/spool/{name}", status_code=201)
+@app.post("/ml/admin/spool/{name}", status_code=201)
+def spool_batch(
+    name: str, body: SpoolBatch, x_admin_token: Optional[str] = Header(default=None)
+) -> Dict[str, object]:
+    _check_admin(x_admin_token)
+    _check_incremental(name)
+    detector = REGISTRY.detectors[name]
+    try:
+        columns = detector.batch_schema.model_validate(body.columns).model_dump()
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors(include_url=False))
+    frame = detector.to_frame(columns)
+
+    if body.labels is not None:
+        if len(body.labels) != len(frame):
+            raise HTTPException(status_code=422, detail="labels must have one entry per row")
+        frame[LABEL_COLUMN] = body.labels
+    elif body.label is not None:
+        frame[LABEL_COLUMN] = body.label
+    else:
+        raise HTTPException(status_code=422, detail="Provide label or labels")
+
+    path = append_to_spool(name, frame)
+    return {"model": name, "rows": len(frame), "path": path.name, "pending": len(pending_batches(name))}
+
+@app.post("/admin/models/{name}/update", status_code=202)
+@app.post("/ml/admin/models/{name}/update", status_code=202)
+async def update_model_route(
+    name: str, x_admin_token: Optional[str] = Header(default=None)
+) -> Dict[str, object]:
+    _check_admin(x_admin_token)
+    _check_incremental(name)
+    running = app.state.reload_tasks.get(name)
+    if running is not None and not running.done():
+        raise HTTPException(status_code=409, detail=f"A reload or update of '{name}' is already in progress")
+
+    pending = len(pending_batches(name))
+    app.state.reload_status[name] = {"state": "updating", "pending_batches": pending}
+    app.state.reload_tasks[name] = asyncio.create_task(_update_model(name))
+    return {"status": "updating", "model": name, "pending_batches": pending}
+
+async def _update_model(name: str) -> None:
+    try:
+        # continue from whatever is serving right now, loading it first if nobody has used it yet
+        base = await REGISTRY.aget(name)
+        result = await asyncio.to_thread(update_model, name, base)
+    except Exception as exc:
+        app.state.reload_status[name] = {"state": "update_failed", "error": str(exc)}
+        logger.error("incremental update failed model=%s: %s", name, exc)
+        return
+
+    app.state.reload_status[name] = {"state": f"update_{result['status']}", "result": result}
+    logger.info("incremental update model=%s status=%s", name, result["status"])
+    if result["status"] == "promoted":
+        await _reload_model(name, artifact_path(name))
+
+def _check_admin(token: Optional[str]) -> None:
+    # fail closed: no configured token means nobody may call the admin routes
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin routes are disabled; set ML_ADMIN_TOKEN to enable them")
+    if token is None or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def _check_model_name(name: str) -> None:
+    if name not in REGISTRY.detectors:
         raise HTTPException(
-            status_code=503,
-            detail=app.state.startup_error
-            or "Model not yet available for inference",
+            status_code=404, detail=f"Unknown model '{name}'; expected one of {sorted(REGISTRY.detectors)}"
         )
 
-    normalized_sample = _normalize_port_sample(sample)
+def _check_incremental(name: str) -> None:
+    _check_model_name(name)
+    if name not in SPECS:
+        raise HTTPException(
+            status_code=404, detail=f"Model '{name}' doesn't support incremental updates; expected one of {sorted(SPECS)}"
+        )
+
+def _resolve_detector(attack: str, family: Optional[str]) -> Detector:
+    try:
+        return REGISTRY.resolve(attack, family)
+    except UnknownModelError as exc:
+        raise HTTPException(status_code=404, detail=str(exc.args[0]))
+
+def _get_model(detector: Detector) -> ModelArtifact:
+    try:
+        return REGISTRY.get(detector.name)
+    except ModelLoadError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+
+async def _aget_model(detector: Detector) -> ModelArtifact:
+    try:
+        return await REGISTRY.aget(detector.name)
+    except ModelLoadError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+
+def _resolve_artifact(name: str, raw_path: Optional[str]) -> Path:
+    if raw_path is None:
+        return artifact_path(name)
+
+    # artifacts are pickles, so only ever load them from the model directory
+    path = (MODEL_DIR / raw_path).resolve()
+    if not path.is_relative_to(MODEL_DIR.resolve()):
+        raise HTTPException(status_code=400, detail="Artifact path must be inside MODEL_DIR")
+    return path
+
+def _observe_drift(
+    detector: Detector, artifact: ModelArtifact, sample: Dict[str, object], label: int, confidence: Optional[float]
+) -> None:
+    _ensure_reference(detector, artifact)
+    DRIFT.observe(detector.name, detector.features, artifact, sample, label, confidence)
+
+def _observe_drift_batch(
+    detector: Detector, artifact: ModelArtifact, frame: pd.DataFrame, labels: np.ndarray, confidences: np.ndarray
+) -> None:
+    _ensure_reference(detector, artifact)
+    DRIFT.observe_batch(detector.name, detector.features, artifact, frame, labels, confidences)
+
+_REFERENCE_BUILDS: Dict[Tuple[str, str], threading.Thread] = {}
+
+def _ensure_reference(detector: Detector, artifact: ModelArtifact) -> None:
+    if artifact.reference is not None or not DRIFT_BACKFILL or detector.reference is None:
+        return
+    key = (detector.name, artifact.version)
+    if key in _REFERENCE_BUILDS:
+        return
+
+    def build() -> None:
+        reference = REGISTRY.build_reference(detector, artifact.model)
+        if reference is not None:
+            # kept in memory only; the artifact on disk is left as it was saved
+            artifact.reference = reference
+            logger.info("drift reference built model=%s version=%s", detector.name, artifact.version)
+
+    thread = threading.Thread(target=build, name=f"drift-reference-{detector.name}", daemon=True)
+    _REFERENCE_BUILDS[key] = thread
+    thread.start()
+
+def _export_drift(reports: Dict[str, dict]) -> None:
+    for name, report in reports.items():
+        DRIFT_WINDOW_ROWS.labels(model=name).set(report["rows"])
+        if report["prediction"]["positive_rate"] is not None:
+            PREDICTION_POSITIVE_RATE.labels(model=name).set(report["prediction"]["positive_rate"])
+        # NaN until the window holds enough rows to score, so a stale value is never left behind
+        PREDICTION_DRIFT_PSI.labels(model=name).set(report["prediction"].get("psi", float("nan")))
+        for feature, entry in report["features"].items():
+            if "reference" in entry or "psi" in entry:
+                FEATURE_DRIFT_PSI.labels(model=name, feature=feature).set(entry.get("psi", float("nan")))
+            if "reference" in entry:
+                FEATURE_DRIFT_KS.labels(model=name, feature=feature).set(entry.get("ks", float("nan")))
+                FEATURE_MEAN_SHIFT.labels(model=name, feature=feature).set(entry.get("mean_shift", float("nan")))
+
+def _explainer(detector: Detector, artifact: ModelArtifact) -> explain.TreeExplainer:
+    cached = _EXPLAINERS.get(detector.name)
+    if cached is not None and cached[0] == artifact.version:
+        return cached[1]
+    model = artifact.model
+    if getattr(model, "compact", False):
+        # compacted variants keep no estimator to explain; their full artifact gives the same verdicts
+        model = load_artifact(detector.name).model
+    explainer = explain.TreeExplainer(model)
+    _EXPLAINERS[detector.name] = (artifact.version, explainer)
+    return explainer
+
+def _compute_explanation(
+    detector: Detector, artifact: ModelArtifact, frame: pd.DataFrame, deadline: float, approximate: bool
+) -> explain.Explanation:
+    explainer = _explainer(detector, artifact)
+    return explain.explain_rows(
+        explainer,
+        detector.model_inputs(frame),
+        EXPLAIN_CACHE,
+        detector.name,
+        artifact.version,
+        deadline=deadline,
+        approximate=approximate,
+    )
+
+async def _explain(
+    detector: Detector, frame: pd.DataFrame, budget_ms: Optional[float], method: str
+) -> Tuple[ModelArtifact, explain.Explanation, float]:
+    """
+    Explain a frame of detection features off the prediction path.
+
+    method=shap is exact TreeSHAP for XGBoost; method=path is tree-path
+    attribution, which sklearn trees always use and XGBoost answers ~40x faster.
+    budget_ms covers the wait for an explain slot and the chunks computed;
+    a batch stops at the first chunk boundary past it.
+    """
+    if method not in ("shap", "path"):
+        raise HTTPException(status_code=422, detail="method must be 'shap' or 'path'")
+    if detector.model_inputs is None:
+        raise HTTPException(status_code=422, detail=f"Model '{detector.name}' has no explainer")
+    start = time.perf_counter()
+    budget_s = min(budget_ms if budget_ms is not None else EXPLAIN_BUDGET_MS, EXPLAIN_MAX_BUDGET_MS) / 1000
+    deadline = start + budget_s
+    artifact = await _aget_model(detector)
+
+    try:
+        await asyncio.wait_for(EXPLAIN_SLOTS.acquire(), timeout=max(deadline - time.perf_counter(), 0.001))
+    except asyncio.TimeoutError:
+        EXPLAIN_ROWS.labels(model=detector.name, source="skipped").inc(len(frame))
+        raise HTTPException(status_code=503, detail="Explanation queue is full", headers={"Retry-After": "1"})
+    try:
+        explanation = await asyncio.get_running_loop().run_in_executor(
+            EXPLAIN_EXECUTOR, _compute_explanation, detector, artifact, frame, deadline, method == "path"
+        )
+    except explain.ExplainUnsupported as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    finally:
+        EXPLAIN_SLOTS.release()
+
+    duration = time.perf_counter() - start
+    explained = int(explanation.explained.sum())
+    EXPLAIN_LATENCY.labels(model=detector.name).observe(duration)
+    EXPLAIN_ROWS.labels(model=detector.name, source="cached").inc(explanation.cache_hits)
+    EXPLAIN_ROWS.labels(model=detector.name, source="computed").inc(explained - explanation.cache_hits)
+    EXPLAIN_ROWS.labels(model=detector.name, source="skipped").inc(len(frame) - explained)
+    logger.info(
+        "%s explain completed rows=%d explained=%d cached=%d method=%s duration_ms=%.2f",
+        detector.name, len(frame), explained, explanation.cache_hits, method, duration * 1000,
+    )
+    return artifact, explanation, duration
+
+async def _explain_one(
+    detector: Detector,
+    sample: BaseModel,
+    budget_ms: Optional[float],
+    method: str,
+    top: Optional[int],
+    label_key: str,
+) -> Dict[str, object]:
+    frame = pd.DataFrame([detector.normalize(sample)])
+    artifact, explanation, duration = await _explain(detector, frame, budget_ms, method)
+    names, contributions = explanation.grouped(detector.input_fields)
+    values = sample.model_dump()
+    ranked = sorted(zip(names, contributions[0].tolist()), key=lambda item: abs(item[1]), reverse=True)
+    confidence = float(explanation.probability[0])
+    return {
+        "attack": detector.attack,
+        "family": detector.family,
+        "model_version": artifact.version,
+        label_key: confidence > 0.5,
+        "confidence": confidence,
+        "method": method,
+        "units": explanation.units,
+        "base_value": float(explanation.base[0]),
+        "contributions": [
+            {"feature": name, "value": values.get(name), "contribution": contribution}
+            for name, contribution in ranked[:top]
+        ],
+        "cached": explanation.cache_hits == 1,
+        "duration_ms": round(duration * 1000, 3),
+    }
+
+def _install_model(name: str, artifact: ModelArtifact) -> None:
+    # the swap is atomic, requests already in flight keep the model they read
+    REGISTRY.install(name, artifact)
+
+def _model_lock(name: str) -> asyncio.Lock:
+    return app.state.model_locks.setdefault(name, asyncio.Lock())
+
+async def _reload_model(
+    name: str, path: Optional[Path], shadow: bool = False, sample_rate: Optional[float] = None
+) -> None:
+    async with _model_lock(name):
+        await _reload_model_locked(name, path, shadow, sample_rate)
+
+async def _reload_model_locked(
+    name: str, path: Optional[Path], shadow: bool, sample_rate: Optional[float]
+) -> None:
+    role = "shadow" if shadow else "primary"
+    try:
+        artifact = await asyncio.to_thread(load_artifact, name, path)
+    except Exception as exc:
+        MODEL_RELOADS.labels(model=name, role=role, status="failed").inc()
+        app.state.reload_status[name] = {"state": "failed", "path": str(path), "error": str(exc)}
+        logger.error("model reload failed model=%s path=%s: %s", name, path, exc)
+        return
+
+    if shadow:
+        app.state.shadow_models[name] = {
+            "artifact": artifact,
+            "sample_rate": SHADOW_SAMPLE_RATE if sample_rate is None else sample_rate,
+            "scored": 0,
+            "disagreed": 0,
+        }
+        SHADOW_DISAGREEMENT_RATIO.labels(model=name).set(0.0)
+    else:
+        _install_model(name, artifact)
+
+    MODEL_RELOADS.labels(model=name, role=role, status="ok").inc()
+    app.state.reload_status[name] = {
+        "state": "ok",
+        "path": str(artifact.path),
+        "version": artifact.version,
+        "shadow": shadow,
+    }
+    logger.info("model reload complete model=%s role=%s version=%s", name, role, artifact.version)
+
+async def _watch_model_dir(interval: float) -> None:
+    def _mtime(name: str) -> Optional[float]:
+        path = artifact_path(name)
+        return path.stat().st_mtime if path.exists() else None
+
+    seen = {name: _mtime(name) for name in REGISTRY.detectors}
+    while True:
+        await asyncio.sleep(interval)
+        for name in REGISTRY.detectors:
+            mtime = _mtime(name)
+            if mtime is None or mtime == seen.get(name):
+                continue
+            seen[name] = mtime
+            # a detector that isn't resident will read the new artifact on its next request anyway
+            if REGISTRY.peek(name) is None:
+                continue
+            logger.info("model artifact changed on disk model=%s; reloading", name)
+            await _reload_model(name, artifact_path(name))
+
+# shadow counters are bumped from threadpool background tasks
+_SHADOW_LOCK = threading.Lock()
+
+def _describe_shadow(name: str) -> Optional[Dict[str, object]]:
+    shadow = app.state.shadow_models.get(name)
+    if shadow is None:
+        return None
+    with _SHADOW_LOCK:
+        scored, disagreed = shadow["scored"], shadow["disagreed"]
+    return {
+        **shadow["artifact"].describe(),
+        "sample_rate": shadow["sample_rate"],
+        "scored": scored,
+        "disagreement_rate": disagreed / scored if scored else None,
+    }
+
+def _maybe_shadow(
+    background_tasks: BackgroundTasks,
+    name: str,
+    predict_fn: Callable,
+    sample: Dict[str, object],
+    primary_label: int,
+) -> None:
+    shadow = app.state.shadow_models.get(name)
+    if shadow is None or random.random() >= shadow["sample_rate"]:
+        return
+    # background tasks run after the response is sent, so the shadow never adds latency
+    background_tasks.add_task(_run_shadow, name, shadow, predict_fn, sample, primary_label)
 
+def _run_shadow(
+    name: str,
+    shadow: Dict[str, object],
+    predict_fn: Callable,
+    sample: Dict[str, object],
+    primary_label: int,
+) -> None:
+    start = time.perf_counter()
     try:
-        label, confidence = predict_port_probing(
-            app.state.model, normalized_sample
+        label, _ = predict_fn(shadow["artifact"].model, sample)
+    except Exception as exc:
+        logger.warning("shadow inference failed model=%s: %s", name, exc)
+        return
+    MODEL_INFERENCE_LATENCY.labels(model=name, role="shadow").observe(time.perf_counter() - start)
+
+    disagrees = int(label) != int(primary_label)
+    with _SHADOW_LOCK:
+        shadow["scored"] += 1
+        shadow["disagreed"] += disagrees
+        ratio = shadow["disagreed"] / shadow["scored"]
+    SHADOW_PREDICTIONS.labels(model=name).inc()
+    if disagrees:
+        SHADOW_DISAGREEMENTS.labels(model=name).inc()
+    SHADOW_DISAGREEMENT_RATIO.labels(model=name).set(ratio)
+
+def _predict_one(
+    detector: Detector,
+    sample: BaseModel,
+    background_tasks: BackgroundTasks,
+    path: str,
+) -> Tuple[int, Optional[float], Optional[str]]:
+    start = time.perf_counter()
+    method = "POST"
+    # read the model once: a hot reload or eviction may swap it mid-request
+    artifact = _get_model(detector)
+    normalized_sample = detector.normalize(sample)
+
+    inference_start = time.perf_counter()
+    try:
+        label, confidence = detector.predict(artifact.model, normalized_sample)
+        MODEL_INFERENCE_LATENCY.labels(model=detector.name, role="primary").observe(
+            time.perf_counter() - inference_start
         )
     except Exception as exc:
         REQUEST_COUNT.labels(path=path, method=method, status=500).inc()
@@ -168,71 +1165,238 @@ def predict(sample: TrafficSample) -> PredictionResponse:
     REQUEST_COUNT.labels(path=path, method=method, status=200).inc()
     REQUEST_LATENCY.labels(path=path, method=method).observe(duration)
     logger.info(
-        "predict completed status=200 duration_ms=%.2f confidence=%s",
+        "%s predict completed status=200 duration_ms=%.2f confidence=%s",
+        detector.name,
         duration * 1000,
         confidence,
     )
 
-    return PredictionResponse(
-        is_port_probe=bool(label),
-        confidence=confidence,
-        model_metrics=app.state.model_metrics,
-    )
+    _observe_drift(detector, artifact, normalized_sample, label, confidence)
+    _maybe_shadow(background_tasks, detector.name, detector.predict, normalized_sample, label)
+    return label, confidence, artifact.version
 
-@app.post("/dos/predict", response_model=DoSPredictionResponse)
-@app.post("/ml/dos/predict", response_model=DoSPredictionResponse)
-def predict_dos_attack(sample: DoSSample) -> DoSPredictionResponse:
+async def _read_sample(request: Request, schema: type) -> BaseModel:
+    try:
+        return schema.model_validate_json(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors(include_url=False))
+
+async def _score_batch(
+    request: Request,
+    detector: Detector,
+    path: str,
+    label_key: Optional[str] = None,
+) -> Response:
     start = time.perf_counter()
-    path = "/dos/predict"
     method = "POST"
-    if app.state.dos_model is None:
-        raise HTTPException(
-            status_code=503,
-            detail=app.state.startup_errors.get("dos")
-            or "DoS model not yet available for inference",
-        )
-
-    normalized_sample = _normalize_dos_sample(sample)
+    name = detector.name
+    label_key = label_key or detector.label_key
+    artifact = await _aget_model(detector)
+    model = artifact.model
+    model_version = artifact.version
 
+    columns = await _read_batch(request, detector.batch_schema)
+    frame = detector.to_frame(columns)
+    inference_start = time.perf_counter()
     try:
-        label, confidence = predict_dos(app.state.dos_model, normalized_sample)
+        labels, confidences = await run_in_threadpool(detector.predict_batch, model, frame)
+        MODEL_INFERENCE_LATENCY.labels(model=name, role="primary").observe(
+            time.perf_counter() - inference_start
+        )
     except Exception as exc:
         REQUEST_COUNT.labels(path=path, method=method, status=500).inc()
-        raise HTTPException(status_code=500, detail=f"Failed to run DoS inference: {exc}")
+        raise HTTPException(status_code=500, detail=f"Failed to run inference: {exc}")
+
+    response = _batch_response(request, label_key, labels, confidences, {"model_version": model_version})
+    # sketch the batch once the response has gone out
+    response.background = BackgroundTask(_observe_drift_batch, detector, artifact, frame, labels, confidences)
 
     duration = time.perf_counter() - start
     REQUEST_COUNT.labels(path=path, method=method, status=200).inc()
     REQUEST_LATENCY.labels(path=path, method=method).observe(duration)
     logger.info(
-        "dos predict completed status=200 duration_ms=%.2f confidence=%s",
+        "%s batch completed status=200 rows=%d format=%s duration_ms=%.2f",
+        name,
+        len(frame),
+        response.media_type,
         duration * 1000,
-        confidence,
     )
+    return response
 
-    return DoSPredictionResponse(
-        is_dos=bool(label),
-        confidence=confidence,
-        model_metrics=app.state.dos_model_metrics,
+def _batch_response(
+    request: Request,
+    label_key: str,
+    labels: np.ndarray,
+    confidences: np.ndarray,
+    meta: Dict[str, object],
+) -> Response:
+    # binary when the caller lists application/x-ml-batch in Accept, columnar JSON otherwise
+    if wire.accepts_batch(request.headers.get("accept")):
+        return Response(
+            wire.encode_batch({label_key: labels, "confidence": confidences}, meta=meta),
+            media_type=wire.CONTENT_TYPE,
+        )
+    return JSONResponse(
+        {
+            label_key: labels.astype(bool).tolist(),
+            "confidence": confidences.astype(float).tolist(),
+            **meta,
+        }
     )
 
+async def _read_batch(request: Request, schema: type) -> Dict[str, object]:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    body = await request.body()
+    if content_type == wire.CONTENT_TYPE:
+        try:
+            columns, _ = wire.decode_batch(body)
+        except wire.WireFormatError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid batch payload: {exc}")
+        missing = [f for f in schema.model_fields if f not in columns]
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Missing batch columns: {missing}")
+        # no pydantic on this path, and NaN/inf slip through every range check
+        for name in schema.model_fields:
+            values = columns[name]
+            if values.dtype.kind == "f" and not np.isfinite(values).all():
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"{name}[{int((~np.isfinite(values)).argmax())}] must be a finite number",
+                )
+        return columns
+    if content_type not in ("", "application/json"):
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported content type '{content_type}'; use application/json or {wire.CONTENT_TYPE}",
+        )
+    try:
+        return schema.model_validate_json(body).model_dump()
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors(include_url=False))
+
+def _check_batch_bounds(frame: pd.DataFrame, bounds: Dict[str, tuple]) -> None:
+    # same bounds the single-row models enforce per field, checked once per column
+    for col, (lower, upper) in bounds.items():
+        # NaN compares False both ways, so it is rejected explicitly
+        bad = ~np.isfinite(frame[col].astype(float)) | (frame[col] < lower)
+        if upper is not None:
+            bad |= frame[col] > upper
+        if bad.any():
+            limit = f"between {lower} and {upper}" if upper is not None else f">= {lower}"
+            raise HTTPException(
+                status_code=422, detail=f"{col}[{int(bad.to_numpy().argmax())}] must be {limit}"
+            )
+
 def _normalize_port_sample(sample: TrafficSample) -> Dict[str, float]:
     payload = sample.model_dump()
     payload["l4_tcp"] = int(payload["l4_tcp"])
     payload["l4_udp"] = int(payload["l4_udp"])
     return payload
 
+def _port_batch_frame(columns: Dict[str, object]) -> pd.DataFrame:
+    frame = pd.DataFrame({f: columns[f] for f in DETECTION_FEATURES})
+    _check_batch_bounds(
+        frame,
+        {
+            "dst_port": (0, 65535),
+            "src_port": (0, 65535),
+            "inter_arrival_time": (0, None),
+            "stream_1_count": (0, None),
+        },
+    )
+    frame["l4_tcp"] = frame["l4_tcp"].astype(int)
+    frame["l4_udp"] = frame["l4_udp"].astype(int)
+    return frame
+
+def _dos_batch_frame(columns: Dict[str, object]) -> pd.DataFrame:
+    frame = pd.DataFrame({field: columns[field] for field in DoSBatch.model_fields})
+    _check_batch_bounds(
+        frame,
+        {
+            "dst_port": (0, 65535),
+            "flow_packets_s": (0, None),
+            "flow_bytes_s": (0, None),
+            "total_fwd_packet": (0, None),
+            "flow_duration": (0, None),
+            "total_length_of_fwd_packet": (0, None),
+        },
+    )
+    return frame.rename(columns=DOS_COLUMN_NAMES)
+
 def _normalize_dos_sample(sample: DoSSample) -> Dict[str, object]:
     data = sample.model_dump()
-    return {
-        "Dst Port": data["dst_port"],
-        "Flow Packets/s": data["flow_packets_s"],
-        "Flow Bytes/s": data["flow_bytes_s"],
-        "Total Fwd Packet": data["total_fwd_packet"],
-        "Flow Duration": data["flow_duration"],
-        "Total Length of Fwd Packet": data["total_length_of_fwd_packet"],
-        "Src IP": data["src_ip"],
-        "Dst IP": data["dst_ip"],
-    }
+    return {DOS_COLUMN_NAMES[field]: value for field, value in data.items()}
+
+def _on_registry_event(kind: str, name: Optional[str], **labels) -> None:
+    if kind == "load":
+        MODEL_LOADS.labels(model=name, source=labels["source"], status=labels["status"]).inc()
+        if "seconds" in labels:
+            MODEL_LOAD_LATENCY.labels(model=name).observe(labels["seconds"])
+        logger.info("model load model=%s source=%s status=%s", name, labels["source"], labels["status"])
+    elif kind == "evict":
+        MODEL_EVICTIONS.labels(model=name).inc()
+        logger.info("model evicted model=%s (memory budget)", name)
+    elif kind == "resident":
+        RESIDENT_MODEL_BYTES.set(labels["bytes"])
+
+def _build_registry() -> ModelRegistry:
+    registry = ModelRegistry(on_event=_on_registry_event)
+    port_io = dict(
+        features=DETECTION_FEATURES,
+        label_key="is_port_probe",
+        predict=predict_port_probing,
+        predict_batch=predict_port_probing_batch,
+        sample_schema=TrafficSample,
+        batch_schema=TrafficBatch,
+        normalize=_normalize_port_sample,
+        to_frame=_port_batch_frame,
+        reference=drift.reference_builder(
+            port_probing.load_training_split, predict_port_probing_batch, DETECTION_FEATURES
+        ),
+        model_inputs=port_probing.model_inputs,
+    )
+    dos_fields = {column: field for field, column in DOS_COLUMN_NAMES.items()}
+    dos_io = dict(
+        features=DOS_FEATURES,
+        label_key="is_dos",
+        predict=predict_dos,
+        predict_batch=predict_dos_batch,
+        sample_schema=DoSSample,
+        batch_schema=DoSBatch,
+        normalize=_normalize_dos_sample,
+        to_frame=_dos_batch_frame,
+        reference=drift.reference_builder(dos.load_training_split, dos.predict_dos_encoded, DOS_FEATURES),
+        model_inputs=dos.model_inputs,
+        # CIC columns and the columns engineered from them, back to the DoSSample field
+        input_fields={
+            **dos_fields,
+            **{derived: dos_fields[source] for derived, source in dos.DERIVED_FEATURES.items()},
+        },
+    )
+    # names double as artifact names (<name>.joblib), shadow keys and metric labels
+    registry.register(
+        Detector(name="port_probing", attack="port_probing", family="gradient_boosting",
+                 train=train_port_probing_model, **port_io),
+        default=True,
+        aliases=("port_scan", "recon"),
+    )
+    registry.register(
+        Detector(name="dos", attack="dos", family="random_forest", train=train_dos_model, **dos_io),
+        default=True,
+        aliases=("ddos", "http_flood"),
+    )
+
+    # every other family is trained on the same feature-store split the first time it's asked for
+    for attack, module, io in (("port_probing", port_probing, port_io), ("dos", dos, dos_io)):
+        for family in FAMILY_ESTIMATORS:
+            if (attack, family) not in registry.by_key:
+                registry.register(
+                    Detector(name=f"{attack}_{family}", attack=attack, family=family,
+                             train=train_family(module, family), **io)
+                )
+    return registry
+
+REGISTRY = _build_registry()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+BASE_DIR = Path(__file__).parent
+
+# trained models are written here as joblib artifacts, one file per model name
+#   -> e.g., models/port_probing.joblib, models/dos.joblib
+MODEL_DIR = Path(os.getenv("MODEL_DIR", BASE_DIR / "models"))
+ARTIFACT_SUFFIX = ".joblib"
+
+# compacted variants (compact.py) sit next to the full artifacts, one file per model and variant
+#   -> e.g., models/compact/port_probing.int8.joblib
+COMPACT_DIR = MODEL_DIR / "compact"
+# serve this variant wherever one has been written, the full artifact otherwise
+#   -> e.g., ML_MODEL_VARIANT=int8 on memory-constrained pods
+MODEL_VARIANT = os.getenv("ML_MODEL_VARIANT", "").strip()
+
+
+@dataclass
+class ModelArtifact:
+    name: str
+    model: object
+    metrics: Optional[Dict[str, float]]
+    version: str
+    path: Optional[Path] = None
+    loaded_at: float = field(default_factory=time.time)
+    # training-time feature and confidence sketches live traffic is compared against (drift.py)
+    reference: Optional[Dict[str, object]] = None
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "path": str(self.path) if self.path else None,
+            "loaded_at": self.loaded_at,
+            "metrics": self.metrics,
+            "has_reference": self.reference is not None,
+        }
+
+
+def artifact_path(name: str, model_dir: Path = MODEL_DIR) -> Path:
+    return model_dir / f"{name}{ARTIFACT_SUFFIX}"
+
+
+def variant_path(name: str, variant: str, compact_dir: Path = COMPACT_DIR) -> Path:
+    return compact_dir / f"{name}.{variant}{ARTIFACT_SUFFIX}"
+
+
+def new_version() -> str:
+    return time.strftime("%Y%m%d_%H%M%S")
+
+
+def save_artifact(
+    name: str,
+    model: object,
+    metrics: Optional[Dict[str, float]],
+    version: Optional[str] = None,
+    path: Optional[Path] = None,
+    reference: Optional[Dict[str, object]] = None,
+) -> Path:
+    path = path or artifact_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # write to a temp file first and rename, so a watcher never sees half an artifact
+    import joblib
+
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    joblib.dump(
+        {
+            "name": name,
+            "model": model,
+            "metrics": metrics,
+            "version": version or new_version(),
+            "reference": reference,
+        },
+        tmp_path,
+    )
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_artifact(name: str, path: Optional[Path] = None) -> ModelArtifact:
+    path = path or artifact_path(name)
+    if not path.exists():
+        raise FileNotFoundError(f"Model artifact not found at {path}")
+
+    import joblib
+
+    data = joblib.load(path)
+    if data.get("name") not in (None, name):
+        raise ValueError(f"Artifact at {path} holds model '{data.get('name')}', expected '{name}'")
+
+    return ModelArtifact(
+        name=name,
+        model=data["model"],
+        metrics=data.get("metrics"),
+        version=str(data.get("version") or new_version()),
+        path=path,
+        # artifacts written before drift monitoring have no reference; the service builds one lazily
+        reference=data.get("reference"),
+    )
+
+
+def _trainers() -> Dict[str, Tuple[Callable[[], Tuple[object, Dict[str, float]]], Callable[[object], Dict[str, object]]]]:
+    import dos
+    import port_probing
+    from drift import reference_builder
+
+    return {
+        "port_probing": (
+            port_probing.train_port_probing_model,
+            reference_builder(
+                port_probing.load_training_split,
+                port_probing.predict_port_probing_batch,
+                port_probing.DETECTION_FEATURES,
+            ),
+        ),
+        "dos": (
+            dos.train_dos_model,
+            reference_builder(dos.load_training_split, dos.predict_dos_encoded, dos.DETECTION_FEATURES),
+        ),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    # train and write an artifact the running service can hot-reload
+    #   -> python model_store.py port_probing
+    #   -> python model_store.py dos_gradient_boosting (any other registered detector)
+    names = sys.argv[1:] or ["port_probing", "dos"]
+    trainers = _trainers()
+    for model_name in names:
+        if model_name not in trainers:
+            # the service never trains on a request, so the other families are trained here
+            from main import REGISTRY
+
+            artifact = REGISTRY.get(model_name, train=True)
+            print(f"{model_name}: wrote {artifact.path} metrics={artifact.metrics}")
+            continue
+        train, reference = trainers[model_name]
+        model, metrics = train()
+        out = save_artifact(model_name, model, metrics, reference=reference(model))
+        print(f"{model_name}: wrote {out} metrics={metrics}")
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from xgboost import XGBClassifier
+
+import feature_store
+from sampling import SamplerConfig
+
+# xgboost (and the sklearn it pulls in) load on first use, not with the service
+if TYPE_CHECKING:
+    from xgboost import XGBClassifier
 
 BASE_DIR = Path(__file__).parent
 
@@ -75,8 +81,14 @@ def find_port_prob(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
-def train_port_probing_model() -> Tuple[XGBClassifier, Dict[str, float]]:
-    df = load_dataframe()
+def load_training_data(sampler: Optional[SamplerConfig] = None) -> Tuple[pd.DataFrame, pd.Series]:
+    sampler = sampler or SamplerConfig.from_env()
+
+    # reservoir sampling reads the CSV itself, the pickle cache would mean loading all of it
+    if sampler.strategy == "reservoir":
+        df = sampler.read_csv(SOURCE_FILE)
+    else:
+        df = load_dataframe()
 
     # apply labeling for supervised learning
     df = find_port_prob(df)
@@ -84,17 +96,60 @@ def train_port_probing_model() -> Tuple[XGBClassifier, Dict[str, float]]:
     # fill missing values w/ 0 to avoid complications w/ analysis
     X = df[DETECTION_FEATURES].fillna(0)
     y = df["is_port_prob"]
+    return X, y
+
+def build_model(params: Optional[Dict[str, object]] = None) -> XGBClassifier:
+    from xgboost import XGBClassifier
+
+    return XGBClassifier(**{**MODEL_PARAMS, **(params or {})})
+
+def _split_training_data(sampler: SamplerConfig) -> feature_store.Split:
+    from sklearn.model_selection import train_test_split
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
+    X, y = load_training_data(sampler)
+
+    # stratify so the (small) probing class shows up in both splits at the same rate
+    return train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y if y.nunique() > 1 else None
+    )
+
+def load_training_split(sampler: Optional[SamplerConfig] = None) -> feature_store.Split:
+    # labeled + split once, then memory-mapped from data/features by every later run
+    sampler = sampler or SamplerConfig.from_env()
+    return feature_store.load_or_build(
+        "port_probing",
+        [SOURCE_FILE],
+        lambda: _split_training_data(sampler),
+        parts={
+            "sampler": sampler.load_key(),
+            "features": DETECTION_FEATURES,
+            "code": feature_store.code_digest(find_port_prob, load_training_data, _split_training_data),
+        },
     )
 
-    model = XGBClassifier(**MODEL_PARAMS)
+def train_port_probing_model(
+    sampler: Optional[SamplerConfig] = None,
+) -> Tuple[XGBClassifier, Dict[str, float]]:
+    sampler = sampler or SamplerConfig.from_env()
+    X_train, X_test, y_train, y_test = load_training_split(sampler)
+
+    # only the training split is down-sampled, test metrics stay on the natural class mix
+    X_train, y_train = sampler.apply(X_train, y_train)
+
+    from sklearn.metrics import f1_score, precision_score, recall_score
+
+    model = build_model()
     model.fit(X_train, y_train)
 
+    # the same hold-out scores the other detectors record, so ensembles weight every member alike
+    y_pred = model.predict(X_test)
     metrics = {
         "train_accuracy": float(model.score(X_train, y_train)),
         "test_accuracy": float(model.score(X_test, y_test)),
+        "precision": float(precision_score(y_test, y_pred, zero_division=0)),
+        "recall": float(recall_score(y_test, y_pred, zero_division=0)),
+        "f1_score": float(f1_score(y_test, y_pred, zero_division=0)),
+        "train_rows": int(len(X_train)),
     }
 
     return model, metrics
@@ -112,6 +167,18 @@ def predict_port_probing(
 
     return label, proba
 
+def model_inputs(frame: pd.DataFrame) -> pd.DataFrame:
+    """The exact matrix the model scores for a frame of DETECTION_FEATURES columns."""
+    return frame.reindex(columns=DETECTION_FEATURES).fillna(0)
+
+def predict_port_probing_batch(
+    model: XGBClassifier, frame: pd.DataFrame
+) -> Tuple[np.ndarray, np.ndarray]:
+    # one predict_proba call for the whole batch, the label is the same > 0.5 cut XGBoost uses
+    frame = model_inputs(frame)
+    proba = model.predict_proba(frame)[:, 1]
+    return (proba > 0.5).astype(int), proba
+
 if __name__ == "__main__":
     model, metrics = train_port_probing_model()
     print("\nXGBOOST MODEL RESULTS:")
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from model_store import MODEL_VARIANT, ModelArtifact, artifact_path, load_artifact, new_version, save_artifact, variant_path
+
+# resident models are evicted least-recently-used first once their artifacts add up to more than this
+#   -> 0 disables eviction
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("ML_MODEL_MEMORY_MB", "1024"))
+
+# a failed load is not retried for this many seconds, so a missing dataset doesn't
+#   -> turn every request into another training attempt
+LOAD_RETRY_S = float(os.getenv("ML_MODEL_LOAD_RETRY_S", "30"))
+
+
+class UnknownModelError(KeyError):
+    pass
+
+
+class ModelLoadError(RuntimeError):
+    pass
+
+
+class ModelNotTrainedError(ModelLoadError):
+    """No artifact on disk; requests never train, the preload step or model_store.py does."""
+
+
+@dataclass
+class Detector:
+    """
+    One servable model: an attack type, the model family that detects it, and
+    the functions every route calls through, whatever the family.
+    """
+
+    name: str
+    attack: str
+    family: str
+    features: List[str]
+    label_key: str
+    train: Callable[[], Tuple[object, Dict[str, float]]]
+    predict: Callable[[object, Dict[str, object]], Tuple[int, Optional[float]]]
+    predict_batch: Callable[[object, pd.DataFrame], Tuple[np.ndarray, np.ndarray]]
+    # request schemas and payload -> model-input converters, supplied by the service
+    sample_schema: Optional[type] = None
+    batch_schema: Optional[type] = None
+    normalize: Optional[Callable] = None
+    to_frame: Optional[Callable] = None
+    # model -> training-time reference sketches, saved in the artifact for drift monitoring
+    reference: Optional[Callable[[object], Dict[str, object]]] = None
+    # detection-feature frame -> the exact matrix the model scores, and each of its columns -> the
+    #   -> request field it came from (explanations are reported per request field)
+    model_inputs: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None
+    input_fields: Optional[Dict[str, str]] = None
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.attack, self.family)
+
+
+@dataclass
+class _Resident:
+    artifact: ModelArtifact
+    size_bytes: int
+    source: str
+    loaded_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class ModelRegistry:
+    """
+    Detectors keyed by (attack, family), loaded on first use.
+
+    A load reads <name>.joblib from MODEL_DIR. Only get(train=True) (the
+    startup preload) trains and saves a missing artifact; on the request path
+    a missing artifact raises ModelNotTrainedError. A model evicted under
+    memory pressure comes back from disk. Loads are single-flight per
+    detector; requests racing a load wait for it.
+    """
+
+    def __init__(self, memory_budget_mb: float = MODEL_MEMORY_BUDGET_MB, on_event: Optional[Callable] = None):
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.detectors: Dict[str, Detector] = {}
+        self.by_key: Dict[Tuple[str, str], str] = {}
+        self.defaults: Dict[str, str] = {}
+        self.aliases: Dict[str, str] = {}
+        self.errors: Dict[str, Tuple[float, str]] = {}
+        self._resident: "OrderedDict[str, _Resident]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        # on_event(kind, name, **labels) lets the service count loads/evictions in Prometheus
+        self._on_event = on_event or (lambda *args, **kwargs: None)
+
+    # -- registration / lookup -------------------------------------------------
+
+    def register(self, detector: Detector, default: bool = False, aliases: Tuple[str, ...] = ()) -> None:
+        self.detectors[detector.name] = detector
+        self.by_key[detector.key] = detector.name
+        self._load_locks[detector.name] = threading.Lock()
+        if default or detector.attack not in self.defaults:
+            self.defaults[detector.attack] = detector.name
+        for alias in aliases:
+            self.aliases[alias.lower()] = detector.attack
+
+    def attacks(self) -> List[str]:
+        return sorted(self.defaults)
+
+    def families(self, attack: str) -> List[Detector]:
+        """Every detector registered for an attack, default first."""
+        default = self.defaults.get(attack)
+        found = [d for d in self.detectors.values() if d.attack == attack]
+        return sorted(found, key=lambda d: d.name != default)
+
+    def resolve(self, attack: str, family: Optional[str] = None) -> Detector:
+        """Detector for an attack (name or alias, any case) and optional family."""
+        attack = attack.lower()
+        attack = self.aliases.get(attack, attack)
+        if family is None:
+            name = self.defaults.get(attack) or (attack if attack in self.detectors else None)
+        else:
+            name = self.by_key.get((attack, family.lower()))
+        if name is None:
+            known = sorted(f"{a}/{f}" for a, f in self.by_key)
+            raise UnknownModelError(f"No detector for '{attack}'{f' ({family})' if family else ''}; known: {known}")
+        return self.detectors[name]
+
+    # -- loading -----------------------------------------------------------------
+
+    def peek(self, name: str) -> Optional[ModelArtifact]:
+        """The resident artifact, without loading or touching LRU order."""
+        resident = self._resident.get(name)
+        return resident.artifact if resident is not None else None
+
+    def get(self, name: str, train: bool = False) -> ModelArtifact:
+        """Resident artifact for a detector, loading it (blocking) on first use; train=True fits a missing one."""
+        with self._lock:
+            resident = self._resident.get(name)
+            if resident is not None:
+                self._resident.move_to_end(name)
+                resident.hits += 1
+                return resident.artifact
+        if name not in self.detectors:
+            raise UnknownModelError(name)
+
+        with self._load_locks[name]:
+            # someone else may have finished the load while we waited on the lock
+            with self._lock:
+                resident = self._resident.get(name)
+                if resident is not None:
+                    self._resident.move_to_end(name)
+                    resident.hits += 1
+                    return resident.artifact
+
+            failed = self.errors.get(name)
+            if failed is not None and time.time() - failed[0] < LOAD_RETRY_S:
+                raise ModelLoadError(failed[1])
+
+            started = time.perf_counter()
+            try:
+                artifact, size, source = self._load(self.detectors[name], train)
+            except ModelNotTrainedError:
+                # not cached in errors: the artifact may appear any moment (model_store.py, a reload)
+                self._on_event("load", name, source="none", status="failed")
+                raise
+            except Exception as exc:
+                message = str(exc) if isinstance(exc, FileNotFoundError) else f"Failed to load model: {exc}"
+                self.errors[name] = (time.time(), message)
+                self._on_event("load", name, source="none", status="failed")
+                raise ModelLoadError(message) from exc
+
+            self.errors.pop(name, None)
+            self._on_event("load", name, source=source, status="ok", seconds=time.perf_counter() - started)
+            self._admit(name, _Resident(artifact=artifact, size_bytes=size, source=source, hits=1))
+            return artifact
+
+    async def aget(self, name: str) -> ModelArtifact:
+        artifact = self.peek(name)
+        if artifact is not None:
+            return self.get(name)
+        # first use: load in a worker thread so the event loop keeps serving
+        return await asyncio.to_thread(self.get, name)
+
+    def _load(self, detector: Detector, train: bool = False) -> Tuple[ModelArtifact, int, str]:
+        if MODEL_VARIANT:
+            compacted = variant_path(detector.name, MODEL_VARIANT)
+            if compacted.exists():
+                return load_artifact(detector.name, compacted), compacted.stat().st_size, "variant"
+
+        path = artifact_path(detector.name)
+        if path.exists():
+            artifact = load_artifact(detector.name, path)
+            return artifact, path.stat().st_size, "artifact"
+
+        if not train:
+            raise ModelNotTrainedError(
+                f"Model '{detector.name}' not trained: no {path.name} in MODEL_DIR "
+                f"(run python model_store.py {detector.name})"
+            )
+        model, metrics = detector.train()
+        artifact = ModelArtifact(
+            name=detector.name, model=model, metrics=metrics, version=new_version(),
+            reference=self.build_reference(detector, model),
+        )
+        try:
+            artifact.path = save_artifact(
+                detector.name, model, metrics, version=artifact.version, reference=artifact.reference
+            )
+            return artifact, artifact.path.stat().st_size, "trained"
+        except OSError:
+            # read-only MODEL_DIR: keep serving; once evicted it answers 503 until an artifact exists
+            return artifact, len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)), "trained"
+
+    @staticmethod
+    def build_reference(detector: Detector, model: object) -> Optional[Dict[str, object]]:
+        if detector.reference is None:
+            return None
+        try:
+            return detector.reference(model)
+        except Exception:
+            # drift monitoring is best-effort, a model without a reference still serves
+            return None
+
+    def install(self, name: str, artifact: ModelArtifact) -> None:
+        """Swap in an artifact loaded elsewhere (hot reload, promotion, incremental update)."""
+        size = artifact.path.stat().st_size if artifact.path is not None and artifact.path.exists() else (
+            len(pickle.dumps(artifact.model, protocol=pickle.HIGHEST_PROTOCOL))
+        )
+        self.errors.pop(name, None)
+        self._admit(name, _Resident(artifact=artifact, size_bytes=size, source="install"))
+
+    def _admit(self, name: str, resident: _Resident) -> None:
+        with self._lock:
+            # replacing the dict entry is atomic; requests in flight keep the artifact they read
+            self._resident[name] = resident
+            self._resident.move_to_end(name)
+            if self.memory_budget > 0:
+                while self.resident_bytes() > self.memory_budget and len(self._resident) > 1:
+                    victim, _ = self._resident.popitem(last=False)
+                    self._on_event("evict", victim)
+            self._on_event("resident", None, bytes=self.resident_bytes())
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            evicted = self._resident.pop(name, None) is not None
+            if evicted:
+                self._on_event("evict", name)
+                self._on_event("resident", None, bytes=self.resident_bytes())
+            return evicted
+
+    def resident_bytes(self) -> int:
+        return sum(r.size_bytes for r in self._resident.values())
+
+    # -- introspection -----------------------------------------------------------
+
+    def describe(self, name: str) -> Dict[str, object]:
+        detector = self.detectors[name]
+        resident = self._resident.get(name)
+        failed = self.errors.get(name)
+        return {
+            "attack": detector.attack,
+            "family": detector.family,
+            "default": self.defaults.get(detector.attack) == name,
+            "model_ready": resident is not None,
+            "loading": resident is None and self._load_locks[name].locked(),
+            "version": resident.artifact.version if resident else None,
+            "source": resident.source if resident else None,
+            "size_bytes": resident.size_bytes if resident else None,
+            "hits": resident.hits if resident else 0,
+            "load_error": failed[1] if failed else None,
+            "features": detector.features,
+        }
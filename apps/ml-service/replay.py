@@ -0,0 +1,438 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import dos
+import feature_store
+import port_probing
+import wire
+
+# where the replayed batches go; the detector's generic batch route is appended
+REPLAY_ML_URL = os.getenv("REPLAY_ML_URL", "http://localhost:8001")
+
+# rows per request, and how many requests may be waiting on the service at once
+#   -> together with READ_CHUNK_ROWS this bounds memory: one chunk plus REPLAY_IN_FLIGHT batches
+REPLAY_BATCH_ROWS = int(os.getenv("REPLAY_BATCH_ROWS", "1000"))
+REPLAY_IN_FLIGHT = int(os.getenv("REPLAY_IN_FLIGHT", "4"))
+READ_CHUNK_ROWS = int(os.getenv("REPLAY_READ_CHUNK_ROWS", "20000"))
+
+# at a finite speed a batch goes out once its first row has waited this long, full or not
+REPLAY_MAX_BATCH_DELAY_S = float(os.getenv("REPLAY_MAX_BATCH_DELAY_S", "0.05"))
+
+# same window the API's flow aggregator counts stream_1_count over
+STREAM_WINDOW_S = float(os.getenv("STREAM_WINDOW_S", "1"))
+
+# rows per second for sources without any timing of their own (the DoS flow export)
+DEFAULT_RATE = 1000.0
+
+LABELS_DIR = feature_store.FEATURE_STORE_DIR / "labels"
+
+
+@dataclass
+class Chunk:
+    columns: Dict[str, np.ndarray]  # batch schema field -> values
+    offsets: np.ndarray             # seconds after the first row, in recorded time
+    labels: np.ndarray              # 0/1 per row, from the dataset's labeler
+
+
+@dataclass
+class ReplaySource:
+    attack: str
+    path: Path
+    chunks: Callable[[], Iterator[Chunk]]
+    timing: str
+
+
+# -- labels ------------------------------------------------------------------------
+
+# dataset -> (source file, loader, labeler, label column it adds)
+DATASETS = {
+    "port_probing": (port_probing.SOURCE_FILE, port_probing.load_dataframe, port_probing.find_port_prob, "is_port_prob"),
+    "dos": (dos.SOURCE_FILE, dos.load_dataframe, dos.find_dos, "is_dos"),
+}
+
+
+def dataset_labels(name: str) -> np.ndarray:
+    """
+    Per-row labels of a dataset, in file order, memory-mapped.
+
+    The labelers need the whole frame (per-IP and global statistics), so they
+    run once per source file / labeler version and the int8 column is kept
+    under the feature store; replays after that only map the file.
+    """
+    source, load, label, column = DATASETS[name]
+    key = feature_store.fingerprint(f"labels-{name}", [source], {"labeler": feature_store.code_digest(label)})
+    path = LABELS_DIR / f"{name}-{key}.npy"
+    if not path.exists():
+        labels = label(load())[column].to_numpy(dtype=np.int8)
+        LABELS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npy")
+        np.save(tmp, labels)
+        os.replace(tmp, path)
+        for stale in LABELS_DIR.glob(f"{name}-*.npy"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+    return np.load(path, mmap_mode="r")
+
+
+# -- sources -----------------------------------------------------------------------
+
+def _csv_chunks(path: Path, labels: np.ndarray, convert, chunk_rows: int) -> Iterator[Chunk]:
+    row = 0
+    carry = 0.0
+    for frame in pd.read_csv(path, chunksize=chunk_rows):
+        n = len(frame)
+        columns, offsets = convert(frame, row, carry)
+        carry = float(offsets[-1]) if n else carry
+        yield Chunk(columns, offsets, np.asarray(labels[row : row + n], dtype=np.int8))
+        row += n
+
+
+def dataset_source(name: str, rate: float = DEFAULT_RATE, chunk_rows: int = READ_CHUNK_ROWS) -> ReplaySource:
+    """One of the training datasets, streamed from its CSV in chunks."""
+    if name not in DATASETS:
+        raise ValueError(f"unknown dataset '{name}', expected one of {sorted(DATASETS)}")
+    path = DATASETS[name][0]
+    if not path.exists():
+        raise FileNotFoundError(f"Dataset not found at {path}")
+    labels = dataset_labels(name)
+
+    if name == "port_probing":
+        fields = list(port_probing.DETECTION_FEATURES)
+
+        def convert(frame: pd.DataFrame, row: int, carry: float):
+            # inter_arrival_time is the gap to the previous packet, so the clock is their running sum
+            gaps = frame["inter_arrival_time"].to_numpy(dtype=np.float64)
+            offsets = carry + np.cumsum(np.clip(np.nan_to_num(gaps), 0, None))
+            if row == 0 and len(offsets):
+                offsets -= offsets[0]
+            return {f: frame[f].to_numpy() for f in fields}, offsets
+
+        return ReplaySource("port_probing", path, lambda: _csv_chunks(path, labels, convert, chunk_rows), "inter_arrival_time")
+
+    has_clock = "Timestamp" in pd.read_csv(path, nrows=0).columns
+    first: List[float] = []
+
+    def convert(frame: pd.DataFrame, row: int, carry: float):
+        columns = {f: frame[col].to_numpy() for f, col in dos.SAMPLE_COLUMNS.items()}
+        if has_clock:
+            seconds = _seconds(pd.to_datetime(frame["Timestamp"], errors="coerce"))
+            # unparsable timestamps (NaT) keep the clock where it is instead of anchoring it
+            seconds[np.isnan(seconds)] = -np.inf
+            if not first and np.isfinite(seconds).any():
+                first.append(float(seconds[np.isfinite(seconds)][0]))
+            # flows are exported in completion order, so keep the clock from running backwards
+            offsets = np.maximum.accumulate(np.maximum(seconds - (first[0] if first else 0.0), carry))
+        else:
+            offsets = (row + np.arange(len(frame))) / rate
+        return columns, offsets
+
+    return ReplaySource(
+        "dos", path, lambda: _csv_chunks(path, labels, convert, chunk_rows),
+        "Timestamp" if has_clock else f"{rate:g} rows/s",
+    )
+
+
+def _seconds(stamps: pd.Series) -> np.ndarray:
+    # explicit nanoseconds: pandas 3 parses to datetime64[us], so astype("int64") isn't ns anymore
+    ns = stamps.to_numpy(dtype="datetime64[ns]")
+    seconds = ns.astype(np.int64) / 1e9
+    seconds[np.isnat(ns)] = np.nan
+    return seconds
+
+
+def scan_features(rows: pd.DataFrame, window_s: float = STREAM_WINDOW_S) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """Port-probe batch columns for scanner rows, like the API's ScanFrame.to_ml_batch."""
+    # naive timestamps are UTC, like the API's ScanFrame
+    seconds = _seconds(pd.to_datetime(rows["timestamp"], format="ISO8601", utc=True))
+    targets = rows["target"].astype(str).to_numpy()
+    n = len(rows)
+    gaps = np.zeros(n)
+    streams = np.ones(n, dtype=np.int64)
+    for target in np.unique(targets):
+        idx = np.flatnonzero(targets == target)
+        t = seconds[idx]
+        gaps[idx[1:]] = np.clip(np.diff(t), 0, None)
+        order = np.sort(t)
+        streams[idx] = np.searchsorted(order, t, side="right") - np.searchsorted(order, t - window_s, side="left")
+    columns = {
+        "dst_port": rows["port"].to_numpy(dtype=np.int64),
+        "src_port": np.zeros(n, dtype=np.int64),
+        "inter_arrival_time": gaps,
+        "stream_1_count": streams,
+        "l4_tcp": np.ones(n, dtype=np.int64),
+        "l4_udp": np.zeros(n, dtype=np.int64),
+    }
+    offsets = np.maximum.accumulate(seconds - seconds[0]) if n else seconds
+    return columns, offsets
+
+
+def payload_source(path: Path) -> ReplaySource:
+    """
+    A scanner payload from simulations/generated_payloads. Every row is a probe
+    the simulation sent, so every row counts as an attack (label 1). Payloads
+    are one JSON array of at most a few thousand rows and are read whole.
+    """
+    path = Path(path)
+
+    def chunks() -> Iterator[Chunk]:
+        with path.open("r", encoding="utf-8") as f:
+            rows = json.load(f)
+        if not isinstance(rows, list):
+            raise ValueError("scan payload must be a JSON array of rows")
+        frame = pd.DataFrame([r for r in rows if isinstance(r, dict) and "port" in r and "timestamp" in r])
+        if frame.empty:
+            return
+        columns, offsets = scan_features(frame)
+        yield Chunk(columns, offsets, np.ones(len(frame), dtype=np.int8))
+
+    return ReplaySource("port_probing", path, chunks, "timestamp")
+
+
+def open_source(spec: str, rate: float = DEFAULT_RATE) -> ReplaySource:
+    """A dataset name (port_probing, dos) or the path of a generated payload file."""
+    if spec in DATASETS:
+        return dataset_source(spec, rate=rate)
+    return payload_source(Path(spec))
+
+
+# -- measurements ------------------------------------------------------------------
+
+class LatencyHistogram:
+    """Log-spaced buckets from 0.1 ms to ~17 min, so percentiles cost O(1) memory however long the replay."""
+
+    def __init__(self, low: float = 1e-4, high: float = 1e3, buckets: int = 280):
+        self.edges = np.geomspace(low, high, buckets + 1)
+        self.counts = np.zeros(buckets + 2, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, values: np.ndarray) -> None:
+        if not len(values):
+            return
+        self.counts += np.bincount(np.searchsorted(self.edges, values, side="right"), minlength=len(self.counts))
+        self.total += len(values)
+        self.sum += float(values.sum())
+        self.max = max(self.max, float(values.max()))
+
+    def percentile(self, q: float) -> float:
+        if not self.total:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(self.counts), math.ceil(q / 100 * self.total)))
+        # upper edge of the bucket, never beyond the largest value seen
+        upper = self.edges[min(bucket, len(self.edges) - 1)]
+        return float(min(upper, self.max))
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "mean_ms": round(self.sum / self.total * 1000, 2) if self.total else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p95_ms": round(self.percentile(95) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+@dataclass
+class ReplayStats:
+    rows: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    failed_rows: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)
+    confusion: Dict[str, int] = field(default_factory=lambda: {"tp": 0, "fp": 0, "tn": 0, "fn": 0})
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    max_lag_s: float = 0.0
+    recorded_span_s: float = 0.0
+    elapsed_s: float = 0.0
+
+    def score(self, predicted: np.ndarray, expected: np.ndarray) -> None:
+        predicted = predicted.astype(bool)
+        expected = expected.astype(bool)
+        self.confusion["tp"] += int(np.sum(predicted & expected))
+        self.confusion["fp"] += int(np.sum(predicted & ~expected))
+        self.confusion["tn"] += int(np.sum(~predicted & ~expected))
+        self.confusion["fn"] += int(np.sum(~predicted & expected))
+
+    def report(self) -> Dict[str, object]:
+        c = self.confusion
+        precision = c["tp"] / (c["tp"] + c["fp"]) if c["tp"] + c["fp"] else 0.0
+        recall = c["tp"] / (c["tp"] + c["fn"]) if c["tp"] + c["fn"] else 0.0
+        scored = sum(c.values())
+        return {
+            "rows": self.rows,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "failed_rows": self.failed_rows,
+            "errors": self.errors,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "recorded_span_s": round(self.recorded_span_s, 3),
+            "rows_per_s": round(self.rows / self.elapsed_s, 1) if self.elapsed_s else 0.0,
+            # how far the sender fell behind the (scaled) recording at worst
+            "max_lag_ms": round(self.max_lag_s * 1000, 2),
+            "end_to_end_latency": self.latency.summary(),
+            "confusion_matrix": dict(c),
+            "accuracy": round((c["tp"] + c["tn"]) / scored, 4) if scored else 0.0,
+            "precision": round(precision, 4),
+            "recall": round(recall, 4),
+            "f1": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        }
+
+
+# -- replay ------------------------------------------------------------------------
+
+async def _send(
+    client,
+    url: str,
+    columns: Dict[str, np.ndarray],
+    due: np.ndarray,
+    labels: np.ndarray,
+    stats: ReplayStats,
+    loop: asyncio.AbstractEventLoop,
+) -> None:
+    n = len(labels)
+    try:
+        resp = await client.post(
+            url,
+            content=wire.encode_batch(columns),
+            headers={"Content-Type": wire.CONTENT_TYPE, "Accept": wire.CONTENT_TYPE},
+        )
+        done = loop.time()
+        if resp.status_code != 200:
+            raise RuntimeError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+        answer, _ = wire.decode_batch(resp.content)
+        predicted = np.asarray(answer["label"])
+    except Exception as exc:
+        stats.failed_batches += 1
+        stats.failed_rows += n
+        reason = str(exc).split(":")[0] or type(exc).__name__
+        stats.errors[reason] = stats.errors.get(reason, 0) + 1
+        return
+    # from the moment each row was due to the moment its verdict came back
+    stats.latency.observe(np.clip(done - due, 0, None))
+    stats.score(predicted, labels)
+
+
+async def replay(
+    source: ReplaySource,
+    speed: float = 1.0,
+    url: str = REPLAY_ML_URL,
+    batch_rows: int = REPLAY_BATCH_ROWS,
+    in_flight: int = REPLAY_IN_FLIGHT,
+    max_rows: Optional[int] = None,
+    max_batch_delay_s: float = REPLAY_MAX_BATCH_DELAY_S,
+) -> Dict[str, object]:
+    """
+    Send a source's rows to its detector's batch route at speed x the recorded
+    timing (speed=0: as fast as the service takes them) and score the answers
+    against the dataset labels.
+
+    Rows leave in batches of up to batch_rows; at a finite speed a batch is cut
+    early so no row waits more than max_batch_delay_s for it to fill. Reading
+    stops while in_flight requests are outstanding, so a slow service shows up
+    as lag and latency instead of as memory.
+    """
+    import httpx
+
+    endpoint = f"{url.rstrip('/')}/ml/predict/{source.attack}/batch"
+    stats = ReplayStats()
+    slots = asyncio.Semaphore(in_flight)
+    tasks: set = set()
+    loop = asyncio.get_running_loop()
+
+    def _finished(task: asyncio.Task) -> None:
+        tasks.discard(task)
+        slots.release()
+
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        start = loop.time()
+        for chunk in source.chunks():
+            n = len(chunk.labels)
+            if max_rows is not None:
+                n = min(n, max_rows - stats.rows)
+            if n <= 0:
+                break
+            offsets = chunk.offsets[:n]
+            stats.recorded_span_s = max(stats.recorded_span_s, float(offsets[-1]))
+            due_all = start + offsets / speed if speed > 0 else None
+
+            i = 0
+            while i < n:
+                j = min(i + batch_rows, n)
+                if due_all is not None:
+                    cut = int(np.searchsorted(due_all, due_all[i] + max_batch_delay_s, side="right"))
+                    j = max(i + 1, min(j, cut))
+                    # the batch is complete once its last row has "arrived"
+                    wait = due_all[j - 1] - loop.time()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                await slots.acquire()
+                now = loop.time()
+                if due_all is not None:
+                    due = due_all[i:j]
+                    stats.max_lag_s = max(stats.max_lag_s, now - float(due[-1]))
+                else:
+                    due = np.full(j - i, now)
+                columns = {name: values[i:j] for name, values in chunk.columns.items()}
+                task = asyncio.ensure_future(
+                    _send(client, endpoint, columns, due, chunk.labels[i:j], stats, loop)
+                )
+                tasks.add(task)
+                task.add_done_callback(_finished)
+                stats.rows += j - i
+                stats.batches += 1
+                i = j
+            if max_rows is not None and stats.rows >= max_rows:
+                break
+        if tasks:
+            await asyncio.gather(*list(tasks))
+        stats.elapsed_s = loop.time() - start
+
+    report = stats.report()
+    report.update(
+        source=str(source.path),
+        attack=source.attack,
+        timing=source.timing,
+        speed=speed if speed > 0 else "max",
+        endpoint=endpoint,
+    )
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # python replay.py port_probing --speed 10
+    # python replay.py dos --speed 0 --max-rows 50000
+    # python replay.py ../../simulations/generated_payloads/port_probe_....json --speed 1
+    parser = argparse.ArgumentParser(description="Replay recorded traffic against the ml-service batch routes")
+    parser.add_argument("source", help="port_probing, dos, or a generated scan payload (.json)")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiple of recorded time, 0 = as fast as possible")
+    parser.add_argument("--url", default=REPLAY_ML_URL)
+    parser.add_argument("--batch-rows", type=int, default=REPLAY_BATCH_ROWS)
+    parser.add_argument("--in-flight", type=int, default=REPLAY_IN_FLIGHT)
+    parser.add_argument("--max-rows", type=int, default=None)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="rows/s at 1x for sources without timestamps")
+    args = parser.parse_args()
+
+    if args.speed < 0:
+        parser.error("--speed must be >= 0")
+    src = open_source(args.source, rate=args.rate)
+    print(json.dumps(asyncio.run(replay(
+        src,
+        speed=args.speed,
+        url=args.url,
+        batch_rows=args.batch_rows,
+        in_flight=args.in_flight,
+        max_rows=args.max_rows,
+    )), indent=2))
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+STRATEGIES = ("none", "stratified", "reservoir")
+
+
+@dataclass
+class SamplerConfig:
+    """
+    How much of the dataset a training run gets to see.
+
+    strategy:
+      -> none: train on the full training split (the default)
+      -> stratified: keep every minority-class row, down-sample the majority
+         class to at most majority_ratio x the minority, then cap at max_rows
+      -> reservoir: read the CSV in chunks and keep a uniform sample of
+         max_rows rows, for datasets that don't fit in memory
+    """
+
+    strategy: str = "none"
+    max_rows: Optional[int] = None
+    majority_ratio: Optional[float] = None
+    random_state: int = 42
+    chunksize: int = 200_000
+
+    def __post_init__(self) -> None:
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"Unknown sampling strategy '{self.strategy}', expected one of {STRATEGIES}")
+        if self.strategy == "reservoir" and not self.max_rows:
+            raise ValueError("reservoir sampling needs max_rows")
+
+    @classmethod
+    def from_env(cls) -> "SamplerConfig":
+        max_rows = os.getenv("TRAINING_SAMPLE_ROWS")
+        ratio = os.getenv("TRAINING_MAJORITY_RATIO")
+        return cls(
+            strategy=os.getenv("TRAINING_SAMPLE_STRATEGY", "none").lower(),
+            max_rows=int(max_rows) if max_rows else None,
+            majority_ratio=float(ratio) if ratio else None,
+        )
+
+    def load_key(self) -> dict:
+        """The settings that change which rows get loaded (stratified only trims the train split later)."""
+        if self.strategy != "reservoir":
+            return {"strategy": "full"}
+        return {"strategy": "reservoir", "max_rows": self.max_rows, "random_state": self.random_state}
+
+    def read_csv(self, source_file: Path) -> pd.DataFrame:
+        """Load the raw CSV, sampled up front when the strategy is reservoir."""
+        if self.strategy == "reservoir":
+            return reservoir_sample_csv(
+                source_file, self.max_rows, chunksize=self.chunksize, random_state=self.random_state
+            )
+        return pd.read_csv(source_file)
+
+    def apply(self, X: pd.DataFrame, y: pd.Series) -> Tuple[pd.DataFrame, pd.Series]:
+        """Down-sample a (labeled) training split; reservoir already happened at load time."""
+        if self.strategy != "stratified":
+            return X, y
+        index = stratified_sample_index(
+            y,
+            max_rows=self.max_rows,
+            majority_ratio=self.majority_ratio,
+            random_state=self.random_state,
+        )
+        return X.loc[index], y.loc[index]
+
+
+def stratified_sample_index(
+    y: pd.Series,
+    max_rows: Optional[int] = None,
+    majority_ratio: Optional[float] = None,
+    random_state: int = 42,
+) -> pd.Index:
+    rng = np.random.default_rng(random_state)
+    counts = y.value_counts()
+    minority = int(counts.min())
+
+    # first balance: every class is capped at majority_ratio x the smallest class
+    keep = {label: int(n) for label, n in counts.items()}
+    if majority_ratio is not None:
+        cap = max(int(minority * majority_ratio), minority)
+        keep = {label: min(n, cap) for label, n in keep.items()}
+
+    # then budget: shrink every class by the same factor so proportions hold
+    total = sum(keep.values())
+    if max_rows is not None and total > max_rows:
+        scale = max_rows / total
+        keep = {label: max(1, int(round(n * scale))) for label, n in keep.items()}
+
+    picked = []
+    for label, n in keep.items():
+        members = y.index[y.to_numpy() == label]
+        if n < len(members):
+            members = members[np.sort(rng.choice(len(members), size=n, replace=False))]
+        picked.append(members)
+    return picked[0].append(picked[1:]) if len(picked) > 1 else picked[0]
+
+
+def reservoir_sample_csv(
+    source_file: Path,
+    n: int,
+    chunksize: int = 200_000,
+    random_state: int = 42,
+) -> pd.DataFrame:
+    """
+    Uniform sample of n rows from a CSV of unknown length, holding at most
+    n + chunksize rows in memory (vectorized Algorithm R, one chunk at a time).
+    Note that find_port_prob labels by per-IP aggregates, so labels computed
+    on a sample are an approximation of labels on the full file.
+    """
+    if not Path(source_file).exists():
+        raise FileNotFoundError(f"Training data not found at {source_file}")
+
+    rng = np.random.default_rng(random_state)
+    reservoir: Optional[pd.DataFrame] = None
+    seen = 0
+    for chunk in pd.read_csv(source_file, chunksize=chunksize):
+        chunk = chunk.reset_index(drop=True)
+        if reservoir is None or len(reservoir) < n:
+            take = n - (0 if reservoir is None else len(reservoir))
+            head, chunk = chunk.iloc[:take], chunk.iloc[take:]
+            reservoir = head if reservoir is None else pd.concat([reservoir, head], ignore_index=True)
+            seen += len(head)
+            if chunk.empty:
+                continue
+
+        # row i of the stream (0-based) replaces a random slot with probability n / (i + 1)
+        positions = seen + np.arange(len(chunk))
+        slots = (rng.random(len(chunk)) * (positions + 1)).astype(np.int64)
+        replace = slots < n
+        if replace.any():
+            # later rows win when several pick the same slot, exactly like the sequential loop
+            incoming = pd.DataFrame({"slot": slots[replace], "row": np.flatnonzero(replace)})
+            last = incoming.drop_duplicates("slot", keep="last")
+            reservoir.iloc[last["slot"].to_numpy()] = chunk.iloc[last["row"].to_numpy()].to_numpy()
+        seen += len(chunk)
+
+    return reservoir if reservoir is not None else pd.DataFrame()
+
+
+def learning_curve(name: str, sizes, majority_ratio: Optional[float] = None) -> pd.DataFrame:
+    """
+    Accuracy / F1 / fit time versus training-set size on one fixed test split,
+    so a training budget can be picked that keeps the metrics but cuts fit time.
+    """
+    import time
+
+    from sklearn.metrics import accuracy_score, f1_score
+
+    module = model_module(name)
+    X_train, X_test, y_train, y_test = module.load_training_split()
+
+    rows = []
+    for size in sorted(set(int(s) for s in sizes)):
+        index = stratified_sample_index(y_train, max_rows=size, majority_ratio=majority_ratio)
+        model = module.build_model()
+        start = time.perf_counter()
+        model.fit(X_train.loc[index], y_train.loc[index])
+        fit_seconds = time.perf_counter() - start
+        y_pred = model.predict(X_test)
+        rows.append(
+            {
+                "train_rows": len(index),
+                "positive_share": float(y_train.loc[index].mean()),
+                "fit_seconds": fit_seconds,
+                "accuracy": float(accuracy_score(y_test, y_pred)),
+                "f1_score": float(f1_score(y_test, y_pred, zero_division=0)),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def model_module(name: str):
+    if name == "dos":
+        import dos
+
+        return dos
+    if name == "port_probing":
+        import port_probing
+
+        return port_probing
+    raise ValueError(f"Unknown model '{name}'")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # python sampling.py dos --sizes 1000,10000,100000 --majority-ratio 4
+    parser = argparse.ArgumentParser(description="Learning curve: metrics vs. training sample size")
+    parser.add_argument("model", choices=["dos", "port_probing"])
+    parser.add_argument("--sizes", default="1000,5000,20000,100000,500000")
+    parser.add_argument("--majority-ratio", type=float, default=None)
+    args = parser.parse_args()
+
+    report = learning_curve(
+        args.model, [int(s) for s in args.sizes.split(",")], majority_ratio=args.majority_ratio
+    )
+    print(report.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
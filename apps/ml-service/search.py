@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import io
+import itertools
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+import feature_store
+from sampling import SamplerConfig, model_module, stratified_sample_index
+
+# parameter values tried per model; every candidate is MODEL_PARAMS with some of these swapped in
+SEARCH_SPACES: Dict[str, Dict[str, list]] = {
+    "port_probing": {
+        "n_estimators": [25, 50, 100, 250],
+        "max_depth": [3, 5, 7, 9],
+        "learning_rate": [0.05, 0.1, 0.3],
+    },
+    "dos": {
+        "n_estimators": [5, 10, 20, 35, 60],
+        "max_depth": [None, 8, 16],
+        "min_samples_leaf": [1, 5, 20],
+    },
+}
+
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", str(os.cpu_count() or 1)))
+LATENCY_REPEATS = int(os.getenv("SEARCH_LATENCY_REPEATS", "50"))
+LATENCY_BATCH_ROWS = int(os.getenv("SEARCH_LATENCY_BATCH_ROWS", "1000"))
+
+# a candidate is only on the front if no other one is at least as good on all of these
+PARETO_MAXIMIZE = ("f1_score",)
+PARETO_MINIMIZE = ("single_latency_ms", "batch_latency_us_per_row", "size_bytes")
+
+# per-process training data, set once by _init_worker so tasks only ship their params
+#   -> with the feature store on, every worker maps the same files and shares their pages;
+#   -> with it off, the split loaded by run_search is shipped to each worker once instead
+_DATA: Optional[dict] = None
+
+
+def grid_candidates(space: Dict[str, list]) -> List[dict]:
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def random_candidates(space: Dict[str, list], n: int, seed: int = 42) -> List[dict]:
+    grid = grid_candidates(space)
+    return random.Random(seed).sample(grid, min(n, len(grid)))
+
+
+def _init_worker(name: str, sampler: Optional[SamplerConfig] = None, data: Optional[dict] = None) -> None:
+    global _DATA
+    _DATA = {"name": name, **(data if data is not None else _load_split(name, sampler))}
+
+
+def _load_split(name: str, sampler: Optional[SamplerConfig] = None) -> dict:
+    X_train, X_test, y_train, y_test = model_module(name).load_training_split(sampler)
+    return {"X_train": X_train, "X_test": X_test, "y_train": y_train, "y_test": y_test}
+
+
+def _median_ms(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1e3)
+
+
+def evaluate_candidate(params: dict, train_rows: Optional[int] = None) -> dict:
+    """Fit one candidate on (a stratified slice of) the training split and measure it."""
+    data = _DATA
+    module = model_module(data["name"])
+    X_train, y_train = data["X_train"], data["y_train"]
+    if train_rows is not None and train_rows < len(y_train):
+        index = stratified_sample_index(y_train, max_rows=train_rows)
+        X_train, y_train = X_train.loc[index], y_train.loc[index]
+
+    # one thread per candidate: the pool provides the parallelism and timings stay comparable
+    model = module.build_model({**params, "n_jobs": 1})
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    X_test, y_test = data["X_test"], data["y_test"]
+    y_pred = model.predict(X_test)
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+
+    single = X_test.iloc[:1]
+    batch = X_test.iloc[:LATENCY_BATCH_ROWS]
+    single_ms = _median_ms(lambda: model.predict_proba(single), LATENCY_REPEATS)
+    batch_ms = _median_ms(lambda: model.predict_proba(batch), max(LATENCY_REPEATS // 10, 3))
+
+    return {
+        "params": params,
+        "train_rows": int(len(y_train)),
+        "fit_seconds": fit_seconds,
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "precision": float(precision_score(y_test, y_pred, zero_division=0)),
+        "recall": float(recall_score(y_test, y_pred, zero_division=0)),
+        "f1_score": float(f1_score(y_test, y_pred, zero_division=0)),
+        "size_bytes": buffer.getbuffer().nbytes,
+        "single_latency_ms": single_ms,
+        "batch_latency_us_per_row": batch_ms * 1e3 / max(len(batch), 1),
+    }
+
+
+def _evaluate_all(pool: ProcessPoolExecutor, candidates: Sequence[dict], train_rows=None) -> List[dict]:
+    return list(pool.map(evaluate_candidate, candidates, itertools.repeat(train_rows)))
+
+
+def _rank_key(result: dict):
+    # best F1 first, cheaper single-row latency breaks ties
+    return (-result["f1_score"], result["single_latency_ms"])
+
+
+def successive_halving(
+    pool: ProcessPoolExecutor,
+    candidates: Sequence[dict],
+    n_train: int,
+    eta: int = 3,
+    min_rows: int = 2000,
+) -> List[dict]:
+    """
+    Score every candidate on a small slice, keep the best 1/eta, grow the slice
+    eta-fold and repeat until one rung runs on the full training split.
+    Returns every result, tagged with its rung, so the cost of pruning is visible.
+    """
+    rungs = max(1, math.ceil(math.log(max(len(candidates), 1), eta)))
+    rows = max(min(min_rows, n_train), n_train // eta ** (rungs - 1))
+    survivors = list(candidates)
+    results: List[dict] = []
+    rung = 0
+    while True:
+        scored = _evaluate_all(pool, survivors, rows)
+        for result in scored:
+            result["rung"] = rung
+        results.extend(scored)
+        if len(survivors) <= 1 or rows >= n_train:
+            return results
+        scored.sort(key=_rank_key)
+        survivors = [r["params"] for r in scored[: max(1, math.ceil(len(scored) / eta))]]
+        rows = min(n_train, rows * eta)
+        rung += 1
+
+
+def pareto_front(
+    results: Iterable[dict],
+    maximize: Sequence[str] = PARETO_MAXIMIZE,
+    minimize: Sequence[str] = PARETO_MINIMIZE,
+) -> List[dict]:
+    results = list(results)
+
+    def dominates(a: dict, b: dict) -> bool:
+        no_worse = all(a[k] >= b[k] for k in maximize) and all(a[k] <= b[k] for k in minimize)
+        better = any(a[k] > b[k] for k in maximize) or any(a[k] < b[k] for k in minimize)
+        return no_worse and better
+
+    front = [r for r in results if not any(dominates(o, r) for o in results if o is not r)]
+    return sorted(front, key=_rank_key)
+
+
+def run_search(
+    name: str,
+    strategy: str = "grid",
+    n_candidates: int = 20,
+    workers: int = SEARCH_WORKERS,
+    sampler: Optional[SamplerConfig] = None,
+    space: Optional[Dict[str, list]] = None,
+    eta: int = 3,
+) -> Dict[str, object]:
+    space = space or SEARCH_SPACES[name]
+    if strategy == "grid":
+        candidates = grid_candidates(space)
+    elif strategy in ("random", "halving"):
+        candidates = random_candidates(space, n_candidates)
+    else:
+        raise ValueError(f"Unknown search strategy '{strategy}', expected grid, random or halving")
+
+    # built (or opened) here first, so the workers only ever open it
+    data = _load_split(name, sampler)
+    n_train = len(data["y_train"])
+    # without the store each worker would re-parse the CSV, so it gets the parsed split instead
+    shipped = None if feature_store.FEATURE_STORE_ENABLED else data
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=max(workers, 1), initializer=_init_worker, initargs=(name, sampler, shipped)
+    ) as pool:
+        if strategy == "halving":
+            results = successive_halving(pool, candidates, n_train, eta=eta)
+            final_rung = max(r["rung"] for r in results)
+            finalists = [r for r in results if r["rung"] == final_rung]
+        else:
+            results = _evaluate_all(pool, candidates)
+            finalists = results
+    elapsed = time.perf_counter() - start
+
+    return {
+        "model": name,
+        "strategy": strategy,
+        "candidates": len(candidates),
+        "fits": len(results),
+        "workers": workers,
+        "train_rows": n_train,
+        "elapsed_seconds": elapsed,
+        "results": sorted(results, key=_rank_key),
+        # only full-data results are comparable, halving's early rungs saw less data
+        "pareto_front": pareto_front(finalists),
+    }
+
+
+def _table(results: List[dict]) -> str:
+    frame = pd.DataFrame(
+        [
+            {
+                **{k: v for k, v in r.items() if k != "params"},
+                "params": json.dumps(r["params"], sort_keys=True),
+            }
+            for r in results
+        ]
+    )
+    columns = [
+        "f1_score", "accuracy", "fit_seconds", "size_bytes",
+        "single_latency_ms", "batch_latency_us_per_row", "train_rows", "params",
+    ]
+    return frame[columns].to_string(index=False, float_format=lambda v: f"{v:.4f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # python search.py dos --strategy halving --candidates 27 --workers 4 --output models/dos.search.json
+    parser = argparse.ArgumentParser(description="Hyperparameter search with a latency/accuracy Pareto front")
+    parser.add_argument("model", choices=sorted(SEARCH_SPACES))
+    parser.add_argument("--strategy", choices=["grid", "random", "halving"], default="grid")
+    parser.add_argument("--candidates", type=int, default=20, help="random/halving sample size")
+    parser.add_argument("--workers", type=int, default=SEARCH_WORKERS)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args()
+
+    report = run_search(
+        args.model, strategy=args.strategy, n_candidates=args.candidates, workers=args.workers, eta=args.eta
+    )
+    print(
+        f"{report['model']}: {report['fits']} fits of {report['candidates']} candidates "
+        f"on {report['workers']} workers in {report['elapsed_seconds']:.1f}s"
+    )
+    print("\nPareto front (F1 vs. latency vs. size):")
+    print(_table(report["pareto_front"]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\nFull report written to {args.output}")
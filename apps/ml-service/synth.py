@@ -0,0 +1,399 @@
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import dos
+import port_probing
+
+# rows generated (and written) per chunk; each chunk has its own seed, so this is part of the output
+SYNTH_CHUNK_ROWS = int(os.getenv("SYNTH_CHUNK_ROWS", "1000000"))
+SYNTH_WORKERS = int(os.getenv("SYNTH_WORKERS", str(os.cpu_count() or 1)))
+
+# above this the DoS labeler's mean + 2 std cut-off rises past the flood rows' score,
+#   -> so find_dos stops agreeing with the rows generated as attacks
+DOS_MAX_ATTACK_RATIO = 0.18
+
+# rows per source address, on average, when the pools are sized from the row count
+ROWS_PER_SOURCE = 200
+
+# ports benign port-probing sources talk to; fewer than find_port_prob's 10 distinct ports per source
+COMMON_PORTS = np.array([22, 25, 53, 80, 110, 143, 443, 3306])
+COMMON_PORT_P = np.array([0.08, 0.04, 0.18, 0.3, 0.02, 0.03, 0.3, 0.05])
+
+WEB_PORTS = np.array([80, 443, 8080])
+OTHER_PORTS = np.array([22, 25, 53, 123, 3306, 5432])
+
+# generated roles, per row
+BENIGN, HARD, ATTACK = 0, 1, 2
+
+
+@dataclass(frozen=True)
+class SynthSpec:
+    """
+    What to generate. The output is a function of the spec alone: chunk i is drawn
+    from its own generator seeded with (seed, dataset, i), so any number of
+    workers writes the same bytes.
+    """
+
+    dataset: str  # "port_probing" or "dos"
+    rows: int
+    attack_ratio: float = 0.05
+    # benign rows that look like attacks on some features but stay under the labeler's rules
+    hard_ratio: float = 0.05
+    seed: int = 0
+    chunk_rows: int = SYNTH_CHUNK_ROWS
+    # benign source addresses; 0 sizes the pool from the row count
+    sources: int = 0
+
+    def __post_init__(self) -> None:
+        if self.dataset not in GENERATORS:
+            raise ValueError(f"Unknown dataset {self.dataset!r}, expected one of {sorted(GENERATORS)}")
+        if self.rows < 0 or self.chunk_rows < 1:
+            raise ValueError("rows must be >= 0 and chunk_rows >= 1")
+        if self.attack_ratio < 0 or self.hard_ratio < 0 or self.attack_ratio + self.hard_ratio > 1:
+            raise ValueError("attack_ratio and hard_ratio must be >= 0 and add up to at most 1")
+
+    @property
+    def chunks(self) -> int:
+        return -(-self.rows // self.chunk_rows)
+
+    def chunk_bounds(self, index: int) -> Tuple[int, int]:
+        start = index * self.chunk_rows
+        return start, min(self.rows, start + self.chunk_rows)
+
+    def pool_size(self, role: int) -> int:
+        ratio = {BENIGN: 1 - self.attack_ratio - self.hard_ratio, HARD: self.hard_ratio, ATTACK: self.attack_ratio}[role]
+        if role == BENIGN and self.sources:
+            return self.sources
+        # at most 65536 addresses per role, one /16 each
+        return int(np.clip(self.rows * ratio // ROWS_PER_SOURCE, 1, 65536))
+
+
+@lru_cache(maxsize=16)
+def _ip_pool(prefix: str, size: int) -> np.ndarray:
+    return np.array([f"{prefix}.{i >> 8}.{i & 255}" for i in range(size)], dtype=object)
+
+
+def _roles(spec: SynthSpec, rng: np.random.Generator, start: int, end: int) -> np.ndarray:
+    # counts per chunk are the difference of rounded running totals, so the dataset total is exact
+    def share(ratio: float) -> int:
+        return int(round(end * ratio)) - int(round(start * ratio))
+
+    roles = np.zeros(end - start, dtype=np.int8)
+    attack = share(spec.attack_ratio)
+    hard = share(spec.attack_ratio + spec.hard_ratio) - attack
+    roles[:attack] = ATTACK
+    roles[attack : attack + hard] = HARD
+    return rng.permutation(roles)
+
+
+def _sources(spec: SynthSpec, rng: np.random.Generator, roles: np.ndarray, prefixes: Dict[int, str]) -> np.ndarray:
+    out = np.empty(len(roles), dtype=object)
+    for role, prefix in prefixes.items():
+        rows = np.flatnonzero(roles == role)
+        pool = _ip_pool(prefix, spec.pool_size(role))
+        out[rows] = pool[rng.integers(0, len(pool), len(rows))]
+    return out
+
+
+def port_probing_chunk(spec: SynthSpec, index: int) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Recon-PortScan rows. Scanners sweep random ports with bursts above 10 or slow
+    probes (find_port_prob's rules); benign sources use a handful of common ports;
+    hard rows come from sources that touch many ports, but quickly and quietly.
+    """
+    rng = np.random.default_rng([spec.seed, 0, index])
+    start, end = spec.chunk_bounds(index)
+    roles = _roles(spec, rng, start, end)
+    n = len(roles)
+    benign, hard, attack = (np.flatnonzero(roles == role) for role in (BENIGN, HARD, ATTACK))
+
+    src_ip = _sources(spec, rng, roles, {BENIGN: "10.0", HARD: "10.200", ATTACK: "172.16"})
+
+    dst_port = np.empty(n, dtype=np.int64)
+    dst_port[benign] = rng.choice(COMMON_PORTS, len(benign), p=COMMON_PORT_P)
+    dst_port[hard] = rng.integers(1, 65536, len(hard))
+    # half the probes walk the well-known range, the rest anywhere
+    dst_port[attack] = np.where(
+        rng.random(len(attack)) < 0.5, rng.integers(1, 1025, len(attack)), rng.integers(1, 65536, len(attack))
+    )
+
+    src_port = rng.integers(32768, 61000, n)
+    src_port[attack] = rng.integers(1024, 65536, len(attack))
+
+    inter_arrival = rng.exponential(0.5, n)
+    inter_arrival[hard] = rng.exponential(0.3, len(hard))
+    # slow scans spread out over seconds, fast ones fire back to back
+    slow = rng.random(len(attack)) < 0.5
+    inter_arrival[attack] = np.where(slow, rng.exponential(3.0, len(attack)), rng.exponential(0.01, len(attack)))
+
+    stream_count = np.minimum(rng.poisson(4, n), 10)
+    stream_count[hard] = rng.integers(0, 11, len(hard))
+    stream_count[attack] = rng.poisson(25, len(attack))
+
+    tcp = (rng.random(n) < 0.8).astype(np.int64)
+    tcp[attack] = rng.random(len(attack)) < 0.9
+
+    frame = pd.DataFrame(
+        {
+            "src_ip": src_ip,
+            "dst_port": dst_port,
+            "src_port": src_port,
+            "inter_arrival_time": inter_arrival.round(6),
+            "stream_1_count": stream_count,
+            "l4_tcp": tcp,
+            "l4_udp": 1 - tcp,
+        }
+    )
+    return frame, roles
+
+
+def dos_chunk(spec: SynthSpec, index: int) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    CICFlowMeter flow rows. Attacks are HTTP request floods (short flows, > 500
+    forward packets, > 80 packets/s), half of them large uploads. Benign
+    flows stay under find_dos's packet cut-offs; hard rows are long bulk
+    transfers on non-web ports, with flood-sized packet and byte counts at a
+    benign packet rate, so they score no higher than the busiest benign flows.
+    """
+    rng = np.random.default_rng([spec.seed, 1, index])
+    start, end = spec.chunk_bounds(index)
+    roles = _roles(spec, rng, start, end)
+    n = len(roles)
+    benign, hard, attack = (np.flatnonzero(roles == role) for role in (BENIGN, HARD, ATTACK))
+
+    src_ip = _sources(spec, rng, roles, {BENIGN: "10.0", HARD: "10.200", ATTACK: "192.168"})
+    dst_ip = _ip_pool("10.1", 16)[rng.integers(0, 16, n)]
+
+    dst_port = np.where(rng.random(n) < 0.5, rng.choice(WEB_PORTS, n), rng.choice(OTHER_PORTS, n))
+    dst_port[hard] = rng.choice(OTHER_PORTS, len(hard))
+    dst_port[attack] = rng.choice(WEB_PORTS[:2], len(attack), p=[0.8, 0.2])
+
+    packets_s = np.minimum(rng.lognormal(np.log(5), 1.0, n), 25.0)
+    packets_s[hard] = rng.uniform(5, 25, len(hard))
+    packets_s[attack] = 80 + rng.lognormal(np.log(200), 0.7, len(attack))
+
+    fwd_packets = np.clip(rng.lognormal(np.log(20), 1.0, n), 1, 499).astype(np.int64)
+    fwd_packets[hard] = 500 + rng.geometric(1 / 2000, len(hard))
+    fwd_packets[attack] = 500 + rng.geometric(1 / 1000, len(attack))
+
+    # microseconds, as CICFlowMeter reports them
+    duration = rng.lognormal(np.log(1e6), 1.5, n)
+    duration[hard] = rng.lognormal(np.log(5e6), 1.0, len(hard))
+    duration[attack] = rng.uniform(1000, 50000, len(attack))
+
+    packet_bytes = rng.lognormal(np.log(200), 0.8, n)
+    packet_bytes[hard] = rng.uniform(1000, 1400, len(hard))
+    # small GET floods or large uploads; either way a flood sends more than 50kB forward
+    packet_bytes[attack] = np.where(
+        rng.random(len(attack)) < 0.5, rng.uniform(101, 200, len(attack)), rng.uniform(500, 1400, len(attack))
+    )
+    fwd_length = fwd_packets * packet_bytes
+    bytes_s = packets_s * packet_bytes
+
+    frame = pd.DataFrame(
+        {
+            "Src IP": src_ip,
+            "Dst IP": dst_ip,
+            "Dst Port": dst_port,
+            "Flow Packets/s": packets_s.round(6),
+            "Flow Bytes/s": bytes_s.round(6),
+            "Total Fwd Packet": fwd_packets,
+            "Flow Duration": duration.round(3),
+            "Total Length of Fwd Packet": fwd_length.round(3),
+        }
+    )
+    return frame, roles
+
+
+GENERATORS: Dict[str, Callable[[SynthSpec, int], Tuple[pd.DataFrame, np.ndarray]]] = {
+    "port_probing": port_probing_chunk,
+    "dos": dos_chunk,
+}
+
+# the labeler whose output the generated attack rows are meant to match
+LABELERS = {
+    "port_probing": lambda df: port_probing.find_port_prob(df)["is_port_prob"].to_numpy(dtype=bool),
+    "dos": lambda df: dos.find_dos(df)["is_dos"].to_numpy(dtype=bool),
+}
+
+
+def generate_chunk(spec: SynthSpec, index: int) -> Tuple[pd.DataFrame, np.ndarray]:
+    return GENERATORS[spec.dataset](spec, index)
+
+
+def _render(spec: SynthSpec, index: int, fmt: str, with_roles: bool) -> bytes:
+    # runs in the worker: generation and serialization both happen off the writing process
+    frame, roles = generate_chunk(spec, index)
+    if with_roles:
+        frame["synthetic_attack"] = (roles == ATTACK).astype(np.int8)
+    if fmt == "csv":
+        return frame.to_csv(index=False, header=index == 0).encode()
+
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def render_chunks(
+    spec: SynthSpec, fmt: str = "csv", workers: int = SYNTH_WORKERS, with_roles: bool = False
+) -> Iterator[bytes]:
+    """
+    Serialized chunks in order. At most 2 * workers chunks are generated ahead of
+    the consumer, so memory is bounded by the chunk size whatever the row count.
+    """
+    if workers <= 1:
+        for index in range(spec.chunks):
+            yield _render(spec, index, fmt, with_roles)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for index in range(spec.chunks):
+            pending.append(pool.submit(_render, spec, index, fmt, with_roles))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def write_dataset(
+    spec: SynthSpec,
+    path: Path,
+    fmt: Optional[str] = None,
+    workers: int = SYNTH_WORKERS,
+    with_roles: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+    overwrite: bool = False,
+) -> Dict[str, object]:
+    """
+    Stream the dataset to path (CSV or Parquet, from the suffix unless fmt is given).
+    An existing file is only replaced with overwrite=True, and then only at the end.
+    """
+    if path.exists() and not overwrite:
+        raise FileExistsError(f"{path} already exists; pass overwrite=True (--force) to replace it")
+    fmt = fmt or ("parquet" if path.suffix == ".parquet" else "csv")
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"Unknown format {fmt!r}, expected csv or parquet")
+    if fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)") from exc
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    started = time.perf_counter()
+    written = 0
+    with open(tmp_path, "wb") as out:
+        writer = None
+        for index, chunk in enumerate(render_chunks(spec, fmt, workers, with_roles)):
+            if fmt == "csv":
+                out.write(chunk)
+            else:
+                table = pa.ipc.open_stream(chunk).read_all()
+                if writer is None:
+                    writer = pq.ParquetWriter(out, table.schema, compression="zstd")
+                writer.write_table(table)
+            written += len(chunk)
+            if progress:
+                progress(index + 1, spec.chunks)
+        if writer is not None:
+            writer.close()
+    # training reads the file by path, so it only ever sees a finished dataset
+    os.replace(tmp_path, path)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "path": str(path),
+        "format": fmt,
+        "rows": spec.rows,
+        "attack_rows": int(round(spec.rows * spec.attack_ratio)),
+        "chunks": spec.chunks,
+        "bytes": written,
+        "seconds": round(elapsed, 3),
+        "rows_per_s": round(spec.rows / elapsed) if elapsed > 0 else None,
+    }
+
+
+def check_labels(spec: SynthSpec) -> Dict[str, object]:
+    """Regenerate the dataset in memory and compare the labeler's verdicts with the generated attacks."""
+    frames, roles = zip(*(generate_chunk(spec, i) for i in range(spec.chunks))) if spec.chunks else ((), ())
+    df = pd.concat(frames, ignore_index=True)
+    attack = np.concatenate(roles) == ATTACK
+    labels = LABELERS[spec.dataset](df)
+    return {
+        "rows": len(df),
+        "generated_attack_ratio": round(float(attack.mean()), 6),
+        "labeled_attack_ratio": round(float(labels.mean()), 6),
+        "agreement": round(float((labels == attack).mean()), 6),
+        "missed": int((attack & ~labels).sum()),
+        "extra": int((labels & ~attack).sum()),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+
+    # never defaults to the training CSVs, and never replaces a file without --force
+    #   -> python synth.py port_probing --rows 10000000 --attack-ratio 0.1 --out /data/portscan.csv
+    #   -> python synth.py dos --rows 100000000 --out /data/dos.parquet --workers 8
+    parser = argparse.ArgumentParser(description="Generate deterministic synthetic training datasets")
+    parser.add_argument("dataset", choices=sorted(GENERATORS))
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--attack-ratio", type=float, default=0.05)
+    parser.add_argument("--hard-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sources", type=int, default=0, help="benign source addresses, 0 = from --rows")
+    parser.add_argument("--chunk-rows", type=int, default=SYNTH_CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=SYNTH_WORKERS)
+    parser.add_argument("--out", type=Path, required=True, help="output path, .csv or .parquet")
+    parser.add_argument("--force", action="store_true", help="replace --out if it exists")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None)
+    parser.add_argument("--with-roles", action="store_true", help="add a synthetic_attack column")
+    parser.add_argument("--check", action="store_true", help="compare the labeler with the generated attacks")
+    args = parser.parse_args()
+
+    spec = SynthSpec(
+        dataset=args.dataset,
+        rows=args.rows,
+        attack_ratio=args.attack_ratio,
+        hard_ratio=args.hard_ratio,
+        seed=args.seed,
+        chunk_rows=args.chunk_rows,
+        sources=args.sources,
+    )
+    if spec.dataset == "dos" and spec.attack_ratio > DOS_MAX_ATTACK_RATIO:
+        print(
+            f"warning: find_dos flags rows 2 std above the mean score; above {DOS_MAX_ATTACK_RATIO:.0%} "
+            "attacks it will not label the generated floods as DoS",
+            file=sys.stderr,
+        )
+
+    def report(done: int, total: int) -> None:
+        print(f"\r{done}/{total} chunks", end="", file=sys.stderr, flush=True)
+
+    try:
+        summary = write_dataset(spec, args.out, args.format, args.workers, args.with_roles, report, args.force)
+    except FileExistsError as exc:
+        parser.error(str(exc))
+    print(file=sys.stderr)
+    if args.check:
+        summary["labels"] = check_labels(spec)
+    print(json.dumps(summary, indent=2))
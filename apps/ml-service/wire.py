@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import json
+import struct
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Compact batch format shared by the API and the ml-service.
+# Both services ship their own copy of this file (each Docker image only gets
+# its own app directory), so keep apps/api/wire.py and apps/ml-service/wire.py identical.
+#
+#   b"MLB1" | uint32 header length | JSON header | float32 column blocks
+#
+# The header lists the column names, row count and, for string columns, a
+# dictionary that the float32 codes index into. Columns are stored one after
+# another (column-major), little-endian float32.
+CONTENT_TYPE = "application/x-ml-batch"
+MAGIC = b"MLB1"
+DTYPE = "<f4"
+_HEADER_LEN = struct.Struct("<I")
+
+
+class WireFormatError(ValueError):
+    pass
+
+
+def encode_batch(columns: Mapping[str, Sequence], meta: Optional[dict] = None) -> bytes:
+    names = list(columns)
+    arrays = []
+    dictionaries: Dict[str, list] = {}
+    rows = None
+    for name in names:
+        arr = np.asarray(columns[name])
+        if arr.dtype.kind in "OUS":
+            uniques, codes = np.unique(arr.astype(str), return_inverse=True)
+            dictionaries[name] = uniques.tolist()
+            arr = codes
+        if rows is None:
+            rows = int(arr.shape[0])
+        elif arr.shape[0] != rows:
+            raise WireFormatError(f"column '{name}' has {arr.shape[0]} rows, expected {rows}")
+        arrays.append(np.ascontiguousarray(arr, dtype=DTYPE))
+
+    header = json.dumps(
+        {
+            "columns": names,
+            "rows": rows or 0,
+            "dtype": DTYPE,
+            "dictionaries": dictionaries,
+            "meta": meta or {},
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return b"".join([MAGIC, _HEADER_LEN.pack(len(header)), header, *(a.tobytes() for a in arrays)])
+
+
+def decode_batch(data: bytes) -> Tuple[Dict[str, np.ndarray], dict]:
+    if data[:4] != MAGIC:
+        raise WireFormatError("not an ML batch payload (bad magic)")
+    try:
+        (header_len,) = _HEADER_LEN.unpack_from(data, 4)
+        header = json.loads(data[8 : 8 + header_len])
+        names = header["columns"]
+        rows = int(header["rows"])
+    except (struct.error, ValueError, KeyError, TypeError) as exc:
+        raise WireFormatError(f"malformed batch header: {exc}") from exc
+    if header.get("dtype", DTYPE) != DTYPE:
+        raise WireFormatError(f"unsupported dtype {header.get('dtype')}")
+
+    offset = 8 + header_len
+    expected = len(names) * rows * np.dtype(DTYPE).itemsize
+    if len(data) - offset != expected:
+        raise WireFormatError(f"batch body is {len(data) - offset} bytes, expected {expected}")
+
+    matrix = np.frombuffer(data, dtype=DTYPE, offset=offset).reshape(len(names), rows)
+    columns: Dict[str, np.ndarray] = {name: matrix[i] for i, name in enumerate(names)}
+    for name, values in (header.get("dictionaries") or {}).items():
+        columns[name] = np.asarray(values, dtype=object)[columns[name].astype(np.int64)]
+    return columns, header.get("meta") or {}
+
+
+def accepts_batch(accept_header: Optional[str]) -> bool:
+    return CONTENT_TYPE in (accept_header or "")
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    # payload size and encode/decode time of the binary format vs. the JSON list-of-dicts path
+    #   -> python wire.py 100000
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(42)
+    batch = {
+        "dst_port": rng.integers(0, 65536, n).tolist(),
+        "flow_packets_s": rng.uniform(0, 2000, n).tolist(),
+        "flow_bytes_s": rng.uniform(0, 1e7, n).tolist(),
+        "total_fwd_packet": rng.integers(0, 1000, n).tolist(),
+        "flow_duration": rng.uniform(0, 1e6, n).tolist(),
+        "total_length_of_fwd_packet": rng.uniform(0, 1e7, n).tolist(),
+        "src_ip": [f"10.0.{i % 7}.{i % 250}" for i in range(n)],
+        "dst_ip": ["192.168.50.253"] * n,
+    }
+    rows = [dict(zip(batch, values)) for values in zip(*batch.values())]
+
+    def _time(fn, repeat=3):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            out = fn()
+            best = min(best, time.perf_counter() - start)
+        return out, best
+
+    json_rows, json_rows_enc = _time(lambda: json.dumps(rows).encode())
+    _, json_rows_dec = _time(lambda: json.loads(json_rows))
+    json_cols, json_cols_enc = _time(lambda: json.dumps(batch).encode())
+    _, json_cols_dec = _time(lambda: json.loads(json_cols))
+    binary, bin_enc = _time(lambda: encode_batch(batch))
+    _, bin_dec = _time(lambda: decode_batch(binary))
+
+    print(f"{n} rows, {len(batch)} features")
+    print(f"{'format':<22}{'bytes':>14}{'encode ms':>12}{'decode ms':>12}")
+    for label, size, enc, dec in (
+        ("json list-of-dicts", len(json_rows), json_rows_enc, json_rows_dec),
+        ("json columnar", len(json_cols), json_cols_enc, json_cols_dec),
+        ("binary float32", len(binary), bin_enc, bin_dec),
+    ):
+        print(f"{label:<22}{size:>14,}{enc * 1000:>12.1f}{dec * 1000:>12.1f}")
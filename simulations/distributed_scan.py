@@ -0,0 +1,529 @@
+"""
+Sharded port scans over many targets and the full port range.
+
+The coordinator splits (target, port range) into shards, hands them to
+workers through a transport and gathers the rows they stream back:
+  -> LocalTransport: multiprocessing queues, one machine, nothing external
+  -> DirectoryTransport: the same messages as files in a shared directory,
+     a stand-in for a real queue when workers run in other pods
+
+python distributed_scan.py run --targets 10.0.0.5,10.0.0.6 --ports 0-65535 --workers 8 --output scan.json
+python distributed_scan.py run --targets 10.0.0.5 --queue-dir /shared/scan-queue --workers 0
+python distributed_scan.py worker --queue-dir /shared/scan-queue
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import queue
+import socket
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from port_probing import port_probe
+
+# ports per shard: big enough to keep 200 sockets busy, small enough that a retry is cheap
+SHARD_PORTS = int(os.getenv("SCAN_SHARD_PORTS", "4096"))
+# a failed (or lost) shard is tried this many more times before it's reported as failed
+SHARD_RETRIES = int(os.getenv("SCAN_SHARD_RETRIES", "2"))
+# a shard with no message from its worker for this long is assumed lost and handed out again
+SHARD_LEASE_S = float(os.getenv("SCAN_SHARD_LEASE_S", "120"))
+# workers stream rows back in chunks of this many probes
+RESULT_CHUNK = int(os.getenv("SCAN_RESULT_CHUNK", "512"))
+
+# what take_shard returns when the coordinator has no more work
+STOP = "stop"
+
+
+@dataclass
+class Shard:
+    shard_id: int
+    target: str
+    start: int
+    end: int
+    attempt: int = 0
+
+    @property
+    def ports(self) -> int:
+        return self.end - self.start + 1
+
+
+def parse_ports(spec: str) -> Tuple[int, int]:
+    first, _, last = spec.partition("-")
+    start, end = int(first), int(last or first)
+    if not 0 <= start <= end <= 65535:
+        raise ValueError(f"bad port range '{spec}', expected e.g. 0-65535")
+    return start, end
+
+
+def make_shards(targets: Sequence[str], start: int, end: int, shard_ports: int = SHARD_PORTS) -> List[Shard]:
+    shards = []
+    for target in targets:
+        for first in range(start, end + 1, shard_ports):
+            shards.append(Shard(len(shards), target, first, min(first + shard_ports - 1, end)))
+    return shards
+
+
+# -- transports ----------------------------------------------------------------
+
+
+class LocalTransport:
+    """
+    Shards and results over multiprocessing queues.
+    Each worker also records the shard it holds in shared memory, which (unlike a
+    queued message) survives the worker dying before its queue flushes.
+    """
+
+    def __init__(self, workers: Sequence[str]):
+        ctx = mp.get_context()
+        self.shards = ctx.Queue()
+        self.results = ctx.Queue()
+        self.slots = {name: i for i, name in enumerate(workers)}
+        # (shard_id, attempt) per worker, -1 when idle
+        self.holding = ctx.Array("q", [-1] * (2 * len(self.slots)), lock=False)
+
+    def _hold(self, worker: str, shard_id: int, attempt: int) -> None:
+        slot = self.slots[worker]
+        self.holding[2 * slot], self.holding[2 * slot + 1] = shard_id, attempt
+
+    def put_shard(self, shard: Shard) -> None:
+        self.shards.put(asdict(shard))
+
+    def stop_workers(self, n: int) -> None:
+        for _ in range(n):
+            self.shards.put(None)
+
+    def take_shard(self, worker: str, timeout: float = 1.0):
+        try:
+            item = self.shards.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if item is None:
+            return STOP
+        self._hold(worker, item["shard_id"], item["attempt"])
+        return Shard(**item)
+
+    def release(self, worker: str, shard: Shard) -> None:
+        self._hold(worker, -1, -1)
+
+    def claims(self) -> List[Tuple[str, int, int]]:
+        """(worker, shard_id, attempt) for every shard a worker is holding."""
+        return [
+            (name, self.holding[2 * slot], self.holding[2 * slot + 1])
+            for name, slot in self.slots.items()
+            if self.holding[2 * slot] >= 0
+        ]
+
+    def send(self, message: dict) -> None:
+        self.results.put(message)
+
+    def receive(self, timeout: float = 0.5) -> Optional[dict]:
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class DirectoryTransport:
+    """
+    The same protocol as files, so workers can live anywhere the directory is mounted.
+      -> pending/<shard>.json is claimed by renaming it into claimed/ (first rename wins)
+      -> results/ holds one file per message, written to a temp name and renamed
+      -> a STOP file tells workers to exit once pending/ is empty
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        for sub in ("pending", "claimed", "results"):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+        self._seq = 0
+
+    def reset(self) -> None:
+        for sub in ("pending", "claimed", "results"):
+            for path in (self.root / sub).iterdir():
+                path.unlink(missing_ok=True)
+        (self.root / "STOP").unlink(missing_ok=True)
+
+    def _write(self, path: Path, payload: dict) -> None:
+        tmp = path.with_name(f".{path.name}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.rename(tmp, path)
+
+    def put_shard(self, shard: Shard) -> None:
+        self._write(self.root / "pending" / f"{shard.shard_id:06d}-{shard.attempt}.json", asdict(shard))
+
+    def stop_workers(self, n: int) -> None:
+        (self.root / "STOP").touch()
+
+    def take_shard(self, worker: str, timeout: float = 1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            for path in sorted((self.root / "pending").glob("*.json")):
+                claimed = self.root / "claimed" / f"{worker}__{path.name}"
+                try:
+                    os.rename(path, claimed)
+                except OSError:
+                    continue  # another worker got it first
+                with claimed.open("r", encoding="utf-8") as f:
+                    return Shard(**json.load(f))
+            if (self.root / "STOP").exists():
+                return STOP
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+    def release(self, worker: str, shard: Shard) -> None:
+        (self.root / "claimed" / f"{worker}__{shard.shard_id:06d}-{shard.attempt}.json").unlink(missing_ok=True)
+
+    def claims(self) -> List[Tuple[str, int, int]]:
+        found = []
+        for path in (self.root / "claimed").glob("*__*.json"):
+            worker, _, name = path.stem.rpartition("__")
+            shard_id, _, attempt = name.partition("-")
+            found.append((worker, int(shard_id), int(attempt)))
+        return found
+
+    def send(self, message: dict) -> None:
+        self._seq += 1
+        name = f"{time.time_ns()}-{message['worker']}-{self._seq:08d}.json"
+        self._write(self.root / "results" / name, message)
+
+    def receive(self, timeout: float = 0.5) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        while True:
+            for path in sorted((self.root / "results").glob("*.json")):
+                try:
+                    with path.open("r", encoding="utf-8") as f:
+                        message = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                path.unlink(missing_ok=True)
+                return message
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+
+# -- worker --------------------------------------------------------------------
+
+
+def scan_shard(shard: Shard, on_rows, concurrency: int = 200, timeout: float = 1.5) -> int:
+    """Probe one shard, handing rows to on_rows in RESULT_CHUNK batches; returns the probe count."""
+    scanner = port_probe(shard.end, start_port=shard.start, target=shard.target)
+    scanner.verbose = False
+    scanner.concurrency = concurrency
+    scanner.timeout = timeout
+    pending: List[dict] = []
+
+    def collect(result) -> None:
+        port, state, banner = result
+        pending.append({
+            "timestamp": datetime.now().isoformat(),
+            "target": shard.target,
+            "port": port,
+            "state": state,
+            "banner": banner,
+            "src_port": scanner.src_ports.get(port),
+        })
+        if len(pending) >= RESULT_CHUNK:
+            on_rows(pending[:])
+            pending.clear()
+
+    scanner.on_result = collect
+    results = asyncio.run(scanner.perform_scan())
+    if pending:
+        on_rows(pending[:])
+    return len(results)
+
+
+def worker_loop(
+    transport, worker: str, concurrency: int = 200, timeout: float = 1.5, persistent: bool = False
+) -> None:
+    # persistent workers (pods) outlive one coordinator run and wait for the next one's shards
+    while True:
+        shard = transport.take_shard(worker)
+        if shard is STOP:
+            if not persistent:
+                return
+            time.sleep(1.0)
+            continue
+        if shard is None:
+            continue
+
+        ids = {"worker": worker, "shard_id": shard.shard_id, "attempt": shard.attempt}
+        transport.send({"kind": "claimed", **ids})
+        started = time.perf_counter()
+        try:
+            probes = scan_shard(
+                shard, lambda rows: transport.send({"kind": "rows", **ids, "rows": rows}), concurrency, timeout
+            )
+        except Exception as exc:
+            transport.send({"kind": "failed", **ids, "error": f"{type(exc).__name__}: {exc}"})
+        else:
+            transport.send({"kind": "done", **ids, "probes": probes, "seconds": time.perf_counter() - started})
+        finally:
+            transport.release(worker, shard)
+
+
+def _worker_main(transport, worker: str, concurrency: int, timeout: float) -> None:
+    try:
+        worker_loop(transport, worker, concurrency, timeout)
+    except KeyboardInterrupt:
+        pass
+
+
+# -- coordinator ---------------------------------------------------------------
+
+
+class _RowWriter:
+    """Streams finished shards into one JSON array, the same layout port_probing.py writes."""
+
+    def __init__(self, path: Optional[Path]):
+        self.path = Path(path) if path else None
+        self._f = None
+        self._first = True
+        if self.path is not None:
+            self._tmp = self.path.with_name(f".{self.path.name}.tmp")
+            self._f = self._tmp.open("w", encoding="utf-8")
+            self._f.write("[")
+
+    def write(self, rows: List[dict]) -> None:
+        if self._f is None:
+            return
+        for row in rows:
+            self._f.write("\n  " if self._first else ",\n  ")
+            self._f.write(json.dumps(row, ensure_ascii=False))
+            self._first = False
+
+    def close(self) -> None:
+        if self._f is None:
+            return
+        self._f.write("\n]\n")
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+
+def run_scan(
+    targets: Sequence[str],
+    ports: Tuple[int, int] = (0, 65535),
+    workers: int = os.cpu_count() or 1,
+    shard_ports: int = SHARD_PORTS,
+    retries: int = SHARD_RETRIES,
+    lease_s: float = SHARD_LEASE_S,
+    queue_dir: Optional[Path] = None,
+    output: Optional[Path] = None,
+    concurrency: int = 200,
+    timeout: float = 1.5,
+    progress: Optional[Callable[[int, int, Dict[str, int]], None]] = None,
+) -> Dict[str, object]:
+    """
+    Scan every target over ports, sharded across workers. With queue_dir the
+    shards go through DirectoryTransport and workers=0 leaves them to workers
+    started elsewhere (`distributed_scan.py worker --queue-dir ...`).
+    progress(done, total, states) is called as rows arrive; rows of a shard
+    that is retried stop counting until its next attempt sends them again.
+    """
+    host = socket.gethostname()
+    names = [f"{host}-{i}" for i in range(workers)]
+    if queue_dir is not None:
+        transport = DirectoryTransport(queue_dir)
+        transport.reset()
+    else:
+        if workers < 1:
+            raise ValueError("a local scan needs at least one worker")
+        transport = LocalTransport(names)
+
+    shards = {s.shard_id: s for s in make_shards(targets, ports[0], ports[1], shard_ports)}
+    for shard in shards.values():
+        transport.put_shard(shard)
+
+    ctx = mp.get_context()
+    procs: Dict[str, mp.Process] = {}
+
+    def spawn(name: str) -> None:
+        proc = ctx.Process(target=_worker_main, args=(transport, name, concurrency, timeout), daemon=True)
+        proc.start()
+        procs[name] = proc
+
+    for name in names:
+        spawn(name)
+
+    writer = _RowWriter(output)
+    buffered: Dict[int, List[dict]] = {}
+    in_flight: Dict[int, Tuple[str, float]] = {}   # shard -> (worker, last message time)
+    remaining = set(shards)
+    failed: Dict[int, str] = {}
+    per_worker: Dict[str, Dict[str, float]] = {}
+    retried = 0
+    probes = 0
+    total = sum(s.ports for s in shards.values())
+    # port states of every row received so far (written or buffered), for progress
+    states: Dict[str, int] = {}
+    started = time.perf_counter()
+
+    def count(rows: List[dict], sign: int) -> None:
+        for row in rows:
+            states[row["state"]] = states.get(row["state"], 0) + sign
+
+    def report_progress() -> None:
+        if progress is not None:
+            progress(sum(states.values()), total, {k: v for k, v in states.items() if v})
+
+    def retry(shard_id: int, reason: str) -> None:
+        nonlocal retried
+        if shard_id not in remaining:
+            return
+        in_flight.pop(shard_id, None)
+        count(buffered.pop(shard_id, []), -1)
+        shard = shards[shard_id]
+        if shard.attempt >= retries:
+            failed[shard_id] = reason
+            remaining.discard(shard_id)
+            return
+        shard.attempt += 1
+        retried += 1
+        transport.put_shard(shard)
+
+    try:
+        while remaining:
+            message = transport.receive(timeout=0.5)
+            now = time.monotonic()
+            if message is not None:
+                shard = shards.get(message["shard_id"])
+                # answers from an attempt that was already given up on are dropped
+                if shard is not None and message["attempt"] == shard.attempt and shard.shard_id in remaining:
+                    kind = message["kind"]
+                    in_flight[shard.shard_id] = (message["worker"], now)
+                    if kind == "rows":
+                        buffered.setdefault(shard.shard_id, []).extend(message["rows"])
+                        count(message["rows"], 1)
+                        report_progress()
+                    elif kind == "done":
+                        # rows are only written once the whole shard made it, so a retry never duplicates them
+                        rows = buffered.pop(shard.shard_id, [])
+                        writer.write(sorted(rows, key=lambda r: r["port"]))
+                        probes += len(rows)
+                        stats = per_worker.setdefault(message["worker"], {"shards": 0, "probes": 0, "seconds": 0.0})
+                        stats["shards"] += 1
+                        stats["probes"] += message["probes"]
+                        stats["seconds"] += message["seconds"]
+                        in_flight.pop(shard.shard_id, None)
+                        remaining.discard(shard.shard_id)
+                    elif kind == "failed":
+                        retry(shard.shard_id, message["error"])
+
+            # a claim whose "claimed" message never arrived still starts the lease
+            for worker, shard_id, attempt in transport.claims():
+                shard = shards.get(shard_id)
+                if shard is not None and shard.attempt == attempt and shard_id in remaining:
+                    in_flight.setdefault(shard_id, (worker, now))
+
+            # a dead local worker loses its shard now; anywhere else the lease runs out
+            for name, proc in list(procs.items()):
+                if not proc.is_alive():
+                    for shard_id, (worker, _) in list(in_flight.items()):
+                        if worker == name:
+                            retry(shard_id, f"worker {name} exited with code {proc.exitcode}")
+                    del procs[name]
+                    if remaining:
+                        spawn(name)
+            for shard_id, (worker, seen) in list(in_flight.items()):
+                if now - seen > lease_s:
+                    retry(shard_id, f"no word from {worker} for {lease_s:.0f}s")
+    finally:
+        transport.stop_workers(len(procs))
+        for proc in procs.values():
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "targets": list(targets),
+        "ports": list(ports),
+        "shards": len(shards),
+        "workers": workers,
+        "probes": probes,
+        "elapsed_seconds": elapsed,
+        "probes_per_s": probes / elapsed if elapsed > 0 else 0.0,
+        "retried_shards": retried,
+        "failed_shards": {
+            shard_id: {**asdict(shards[shard_id]), "error": error} for shard_id, error in failed.items()
+        },
+        "per_worker": {
+            name: {**stats, "probes_per_s": stats["probes"] / stats["seconds"] if stats["seconds"] else 0.0}
+            for name, stats in sorted(per_worker.items())
+        },
+        "output": str(output) if output else None,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sharded port scans across worker processes")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="split the scan into shards and gather the results")
+    run.add_argument("--targets", default=port_probe.TARGET, help="comma-separated hosts")
+    run.add_argument("--ports", default="0-65535")
+    run.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="local worker processes")
+    run.add_argument("--shard-ports", type=int, default=SHARD_PORTS)
+    run.add_argument("--retries", type=int, default=SHARD_RETRIES)
+    run.add_argument("--queue-dir", type=Path, help="shared directory queue instead of in-process queues")
+    run.add_argument("--output", type=Path, help="JSON rows, same layout as port_probing.py")
+    run.add_argument("--concurrency", type=int, default=200, help="sockets per worker")
+    run.add_argument("--timeout", type=float, default=1.5, help="connect timeout per probe")
+    run.add_argument("--progress", action="store_true", help="print a progress line as rows arrive")
+
+    work = sub.add_parser("worker", help="serve shards from a directory queue until the coordinator stops")
+    work.add_argument("--queue-dir", type=Path, required=True)
+    work.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}")
+    work.add_argument("--concurrency", type=int, default=200)
+    work.add_argument("--timeout", type=float, default=1.5)
+    work.add_argument("--exit-on-stop", action="store_true", help="exit when the coordinator finishes")
+
+    args = parser.parse_args()
+    if args.command == "worker":
+        worker_loop(
+            DirectoryTransport(args.queue_dir), args.name, args.concurrency, args.timeout,
+            persistent=not args.exit_on_stop,
+        )
+        sys.exit(0)
+
+    def print_progress(done: int, total: int, states: Dict[str, int]) -> None:
+        # "[1024/65536] ports closed=1020 open=4", parsed by the API for its live feed
+        counts = " ".join(f"{state}={n}" for state, n in sorted(states.items()))
+        print(f"[{done}/{total}] ports {counts}", flush=True)
+
+    report = run_scan(
+        [t.strip() for t in args.targets.split(",") if t.strip()],
+        ports=parse_ports(args.ports),
+        workers=args.workers,
+        shard_ports=args.shard_ports,
+        retries=args.retries,
+        queue_dir=args.queue_dir,
+        output=args.output,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        progress=print_progress if args.progress else None,
+    )
+    print(
+        f"{report['probes']:,} probes over {report['shards']} shards on {report['workers']} workers "
+        f"in {report['elapsed_seconds']:.1f}s -> {report['probes_per_s']:,.0f} probes/s "
+        f"({report['retried_shards']} retried, {len(report['failed_shards'])} failed)"
+    )
+    for name, stats in report["per_worker"].items():
+        print(f"  {name}: {stats['shards']} shards, {stats['probes']:,} probes, {stats['probes_per_s']:,.0f}/s")
+    for shard_id, shard in report["failed_shards"].items():
+        print(f"  shard {shard_id} {shard['target']}:{shard['start']}-{shard['end']} failed: {shard['error']}", file=sys.stderr)
+    # exit non-zero when rows are missing so callers (the API) fall back like a failed scan
+    sys.exit(1 if report["failed_shards"] else 0)
@@ -1,22 +1,107 @@
+import argparse
+import ipaddress
+import json
+import os
+import socket
+import sys
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 
 import requests
 
+# hard cap on requests per run, whatever the caller asks for
+DOS_MAX_REQUESTS = int(os.getenv("DOS_MAX_REQUESTS", "10000"))
+# targets outside loopback/private networks are refused unless this is set (or --allow-remote)
+DOS_ALLOW_REMOTE_TARGET = os.getenv("DOS_ALLOW_REMOTE_TARGET", "0") == "1"
+
+def is_local_target(url):                           # Loopback or private address, after DNS
+    host = urlparse(url).hostname
+    if not host:
+        return False
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror:
+        return False
+    addresses = {ipaddress.ip_address(info[4][0]) for info in infos}
+    return all(a.is_loopback or a.is_private for a in addresses)
+
 class dos_attack:
-    def __init__(self, url, i):
+    def __init__(self, url, i, allow_remote=DOS_ALLOW_REMOTE_TARGET):
+        if not allow_remote and not is_local_target(url):
+            raise ValueError(f"Refusing non-local target {url}; set DOS_ALLOW_REMOTE_TARGET=1 to allow it")
         self.url = url                              # Attack endpoint
-        self.i = i                                  # Number of requests to send
+        self.i = max(0, min(int(i), DOS_MAX_REQUESTS))  # Number of requests to send, clamped
         self.payload = {'msg': 'malicious traffic'}      # Payload for http message and visibility server-side
+        self.body_length = len(json.dumps(self.payload))
+        self.events = []                            # One raw event per request, for the API's flow aggregator
+        self.events_lock = threading.Lock()
+
+        parsed = urlparse(url)
+        self.dst_port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        try:
+            self.dst_ip = socket.gethostbyname(parsed.hostname)
+        except (socket.gaierror, TypeError):
+            self.dst_ip = parsed.hostname or ""
+        self.src_ip = self.local_ip(self.dst_ip)
+
+    @staticmethod
+    def local_ip(dst_ip):                           # Source address the OS would use to reach the target
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                s.connect((dst_ip, 80))
+                return s.getsockname()[0]
+        except OSError:
+            return "127.0.0.1"
 
     def send_request(self):                         # Sends single request
+        sent_ns = time.time_ns()
         try:
             response = requests.post(self.url, json=self.payload, timeout=0.000001)
-            return response.status_code
+            outcome = response.status_code
         except requests.exceptions.ReadTimeout:
-            pass
+            outcome = "sent"
         except Exception as e:
-            return f"Error: {e}"
+            outcome = f"Error: {e}"
+
+        with self.events_lock:
+            self.events.append({
+                "ts_ns": sent_ns,
+                "src_ip": self.src_ip,
+                "dst_ip": self.dst_ip,
+                "dst_port": self.dst_port,
+                "length": self.body_length,
+                "proto": "tcp",
+            })
+        return outcome
 
     def run(self, workers=200):                      # In parallel send requests in range i
         with ThreadPoolExecutor(max_workers=workers) as executor:
             futures = [executor.submit(self.send_request) for _ in range(self.i)]
+            return [f.result() for f in as_completed(futures)]
+
+    def write_events(self, out=sys.stdout):          # NDJSON, oldest first
+        for event in sorted(self.events, key=lambda e: e["ts_ns"]):
+            out.write(json.dumps(event) + "\n")
+
+
+if __name__ == "__main__":
+    # python simulations/dos.py <url> <count>
+    #   -> raw request events go to stdout as NDJSON, the summary to stderr
+    parser = argparse.ArgumentParser(description="HTTP request flood against a local target")
+    parser.add_argument("target", nargs="?", default="http://localhost:8000/output-json")
+    parser.add_argument("count", nargs="?", type=int, default=100, help=f"requests to send, at most {DOS_MAX_REQUESTS}")
+    parser.add_argument("--allow-remote", action="store_true", default=DOS_ALLOW_REMOTE_TARGET,
+                        help="allow targets outside loopback/private networks")
+    args = parser.parse_args()
+
+    try:
+        attack = dos_attack(args.target, args.count, allow_remote=args.allow_remote)
+    except ValueError as exc:
+        parser.error(str(exc))
+    outcomes = attack.run()
+    attack.write_events()
+
+    errors = [o for o in outcomes if isinstance(o, str) and o.startswith("Error")]
+    print(f"Sent {attack.i} requests to {args.target}; {len(errors)} errors", file=sys.stderr)
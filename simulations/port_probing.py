@@ -2,7 +2,6 @@ import argparse
 import asyncio
 import json
 import socket
-import sys
 from datetime import datetime
 from typing import List, Tuple
 
@@ -10,8 +9,12 @@ class port_probe:
     TARGET = "192.168.50.253"
     DEFAULT_COMMON_PORTS = list(range(0, 10001))
 
-    def __init__(self, num_ports):
-        self.ports = list(range(0, int(num_ports) + 1))
+    def __init__(self, num_ports, start_port=0, target=None, output=None):
+        # ports start_port..num_ports, both ends included
+        self.ports = list(range(int(start_port), int(num_ports) + 1))
+        if target:
+            self.TARGET = target
+        self.output = output
         self.concurrency = 200
         self.timeout = 1.5
         self.banner =True
@@ -19,6 +22,9 @@ class port_probe:
         self.delay = 0.0
         self.out_prefix = "local_scan"
         self.use_default_common = False
+        self.verbose = True
+        self.on_result = None                       # called with each (port, state, banner) as it lands
+        self.src_ports = {}                         # port -> local source port, for the ports that opened
 
     async def try_connect(self, port: int, semaphore: asyncio.Semaphore,
                           start_delay: float) -> Tuple[int, str, str]:
@@ -39,6 +45,9 @@ class port_probe:
                     return (port, "closed", "")
                 return (port, "filtered", "")
 
+            sockname = writer.get_extra_info("sockname")
+            if sockname:
+                self.src_ports[port] = sockname[1]
             banner_text = ""
             if self.banner:
                 try:
@@ -80,21 +89,30 @@ class port_probe:
             result = await fut
             results.append(result)
             completed += 1
-            print(f"[{completed}/{total}] port {result[0]} -> {result[1]}"
-                  f"{(' | banner: ' + result[2][:120]) if result[2] else ''}")
+            if self.on_result is not None:
+                self.on_result(result)
+            if self.verbose:
+                print(f"[{completed}/{total}] port {result[0]} -> {result[1]}"
+                      f"{(' | banner: ' + result[2][:120]) if result[2] else ''}")
 
         return sorted(results, key=lambda x: x[0])
 
     def write_outputs(self, results):
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        json_path = f"simulations/generated_payloads/{self.out_prefix}_{ts}.json"
+        if self.output:
+            json_path = self.output
+        elif "/" in self.out_prefix:
+            json_path = f"{self.out_prefix}_{ts}.json"
+        else:
+            json_path = f"simulations/generated_payloads/{self.out_prefix}_{ts}.json"
 
         rows = [{
             "timestamp": datetime.now().isoformat(),
             "target": self.TARGET,
             "port": port,
             "state": state,
-            "banner": banner
+            "banner": banner,
+            "src_port": self.src_ports.get(port)
         } for port, state, banner in results]
 
         with open(json_path, "w", encoding="utf-8") as jf:
@@ -130,9 +148,19 @@ class port_probe:
         print(f"\nResults written to: {paths}")
 
 
-if len(sys.argv) > 1:
-    scanner = port_probe(sys.argv[1])
-else:
-    scanner = port_probe(10000)
+# distributed_scan.py imports port_probe, so the scan only runs when this file is the script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local TCP port scan")
+    parser.add_argument("num_ports", nargs="?", type=int, default=10000, help="last port to scan")
+    parser.add_argument("--start-port", type=int, default=0, help="first port to scan")
+    parser.add_argument("--target", default=port_probe.TARGET)
+    parser.add_argument("--out-prefix", default="local_scan")
+    parser.add_argument("--output", help="exact JSON path, overrides --out-prefix")
+    parser.add_argument("--use-default-common", action="store_true")
+    args = parser.parse_args()
 
-scanner.run()
+    scanner = port_probe(args.num_ports, start_port=args.start_port, target=args.target, output=args.output)
+    scanner.out_prefix = args.out_prefix
+    scanner.use_default_common = args.use_default_common
+
+    scanner.run()